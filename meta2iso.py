@@ -1,7 +1,31 @@
 from gis_metadata.iso_metadata_parser import IsoParser
-from pygeometa.core import render_template
+from gis_metadata.utils import parse_property, validate_properties
+from pygeometa.changes import Manifest, canonical_hash, write_atom, write_jsonl
+from pygeometa.completeness import MEASURES, CompletenessStats
+from pygeometa.contacts import (HREF_PATTERN, ContactRegistry,
+                                contact_references, record_href,
+                                registry_name, responsible_parties)
+from pygeometa.core import (get_rga_languages, get_rga_strings, get_template,
+                            get_template_fields, read_mcf, render_template)
+from pygeometa.emitter import render_tree
+from pygeometa.fileio import (COMPRESSIONS, DURABILITY_LEVELS, LAYOUTS,
+                              AtomicWriter, find_sources, get_compression,
+                              layout_path, move_source, parse_xml, read_text,
+                              source_name)
+from pygeometa.linkcheck import LinkChecker
+from pygeometa.profiling import Profiler
+from pygeometa.search import INDEXED_FIELDS, CatalogueIndex
+from pygeometa.record import MCFRecord
+from pygeometa.report import RunReport, in_shard, parse_shard
+from pygeometa.scheduler import Scheduler, source_size
+from pygeometa.sniff import sniff
+from pygeometa.validation import get_validator
+from pygeometa.store import MCFStore
+import click
+import codecs
+import functools
+import itertools
 import yaml
-import glob
 import os
 from os.path import basename
 import time 
@@ -10,6 +34,24 @@ import time
 
 class RGAIsoParser(IsoParser):
 
+    def _init_metadata(self):
+        # properties are parsed lazily, on first access (see __getattr__)
+        if self._data_map is None:
+            self._init_data_map()
+        validate_properties(self._data_map, self._metadata_props)
+        del self.has_data
+
+    def __getattr__(self, prop):
+        data_map = self.__dict__.get('_data_map')
+        if prop == 'has_data' and data_map is not None:
+            value = any(getattr(self, p) for p in data_map)
+        elif data_map is not None and prop in data_map:
+            value = parse_property(self._xml_tree, None, data_map, prop)
+        else:
+            raise AttributeError(prop)
+        setattr(self, prop, value)
+        return value
+
     def _init_data_map(self):
         super(RGAIsoParser, self)._init_data_map()
 
@@ -136,6 +178,9 @@ class RGAIsoParser(IsoParser):
         
         lineage_prop = 'lineage'
         self._data_map[lineage_prop] = 'dataQualityInfo/DQ_DataQuality/lineage/LI_Lineage/statement/CharacterString'
+        
+        referenceSystem_prop = 'referenceSystem'
+        self._data_map[referenceSystem_prop] = 'referenceSystemInfo/MD_ReferenceSystem/referenceSystemIdentifier/RS_Identifier/code/CharacterString'
 
         # And finally, let the parent validation logic know about the two new custom properties
 
@@ -173,102 +218,524 @@ class RGAIsoParser(IsoParser):
         self._metadata_props.add(t_extnt_endPosition_prop)
         self._metadata_props.add(linkage_prop)
         self._metadata_props.add(lineage_prop)
-        
+        self._metadata_props.add(referenceSystem_prop)
+        
+def shard_option(ctx, param, value):
+  if value is None:
+    return None
+  try:
+    return parse_shard(value)
+  except ValueError as err:
+    raise click.BadParameter(str(err))
+
+def extract_record(fxml_path, fields=None):
+  # parsed from bytes, honouring the encoding declaration of the file
+  old_schema_file = RGAIsoParser(parse_xml(fxml_path))
+  # keep only the compact field set, the parsed tree is released here;
+  # with fields given, other properties are never parsed
+  record = MCFRecord.from_parser(old_schema_file, fields)
+  del old_schema_file
+  return record
+
+def writeyml(data, base, ymls_dts_dir, writer=None, layout='flat'):
+  yml_file_name= base  + '.yml'
+  yml_file_path= layout_path(ymls_dts_dir, yml_file_name, layout)
+  if writer is None:
+    with AtomicWriter() as writer:
+      return writeyml(data, base, ymls_dts_dir, writer, layout)
+  print(writer.path(yml_file_path))
+  content = yaml.dump(data, default_flow_style=False, allow_unicode=True)
+  with writer.open(yml_file_path) as outfile:
+    outfile.write(content.encode('utf-8'))
+
 def makeyml(fxml_path, ymls_dts_dir):
-    with open(fxml_path) as metadata:
-      old_schema_file = RGAIsoParser(metadata)
+  data = extract_record(fxml_path).to_mcf()
+  if ymls_dts_dir is None:  # caller stores the record
+    return data
+  base= source_name(fxml_path)
+  writeyml(data, base, ymls_dts_dir)
+  return data
+        
+def print_load_balance(stage, stats):
+  if stats['workers'] > 1:
+    print('Load balance ' + stage + ': busy ' +
+          ', '.join('%.2fs' % b for b in stats['busy_seconds']) +
+          ' (efficiency %d%%)' % (100 * stats['efficiency']))
+  if any(stats['peak_rss']):
+    print('Worker memory ' + stage + ': peak ' +
+          ', '.join('%.0f MiB' % ((p or 0) / 1048576.0)
+                    for p in stats['peak_rss']) +
+          ', recycled ' + ', '.join(str(r) for r in stats['recycled']))
 
-    
-      data = dict(mcf = dict(version = '1.0.0'
-			   ),
-		  metadata = dict(
-		  identifier = old_schema_file.fileIdentifier,
-		  language = old_schema_file.metadata_language,
-		  hierarchylevel = old_schema_file.hierarchyLevel,
-		  organization_name = old_schema_file.meta_organization_name,
-		  organisation_emailAddress = old_schema_file.meta_organisation_emailAddress,
-		  datestamp = old_schema_file.dateStamp,
-		  title = old_schema_file.title,
-		  # Datum kreiranja, izmene, publikacije i njegov tip
-		  publish_date = old_schema_file.publish_date,
-		  dateTypeCode = old_schema_file.dateTypeCode,
-		  # identifikator resursa i njegov tip
-		  resourceIdentifier = old_schema_file.RS_Identifier,
-		  resourceIdentifierNamespace = old_schema_file.RS_Identifier_codeSpace,
-		  abstract = old_schema_file.abstract,
-		  # Responsible party organisationName, cotact, role
-		  resp_organisationName = old_schema_file.organisationName,
-		  resp_organisation_emailAddress = old_schema_file.organisation_emailAddress,
-		  resp_organisation_role = old_schema_file.organisation_role,
-		  # Keywords
-		  keywords = old_schema_file.descriptiveKeywords,
-		  #Constraints
-		  useLimitation = old_schema_file.useLimitation,
-		  accessConstraints = old_schema_file.accessConstraints,
-		  otherConstraints = old_schema_file.otherConstraints,
-		  # SpatialResolution
-		  denominator = old_schema_file.denominator,
-		  distance = old_schema_file.distance,
-		  # resourceLanguage
-		  resourceLanguage = old_schema_file.resourceLanguage,
-		  #TopicCategoryes
-		  inspireCategory = [old_schema_file.inspireCategory],
-		  # bounding_box
-		  bounding_box_w = old_schema_file.westBoundLongitude,
-		  bounding_box_e = old_schema_file.eastBoundLongitude,
-		  bounding_box_s = old_schema_file.southBoundLatitude,
-		  bounding_box_n = old_schema_file.northBoundLatitude,
-		  # temporal extend
-		  t_extnt_beginPosition = old_schema_file.t_extnt_beginPosition,
-		  t_extnt_endPosition =old_schema_file.t_extnt_endPosition,
-		  # dist_format from srb tag
-		  dist_format = old_schema_file.dist_format,
-		  linkage = old_schema_file.linkage,
-		  lineage = old_schema_file.lineage
-		  ),
-	       )
-      base=os.path.basename(fxml_path)
-      base= os.path.splitext(base)[0]
-      yml_file_name= base  + '.yml'
-      yml_file_path= ymls_dts_dir + yml_file_name
-      print(yml_file_path)
-      with open(yml_file_path, 'w') as outfile:
-        yaml.dump(data, outfile, default_flow_style=False, allow_unicode=True)
+def render_record(job):
+  # returns xml, the responsible parties referenced in a registry and
+  # (fileIdentifier, canonical hash) of the xml if requested
+  mcf_ref, engine, template, contact_href, hash_output = job
+  # a yml path, or an MCF dict read from the store
+  if not isinstance(mcf_ref, dict) and get_compression(mcf_ref):
+    mcf_ref = read_text(mcf_ref)
+  parties = []
+  if contact_href is not None:
+    mcf_ref = read_mcf(mcf_ref)
+    mcf_ref['contacts'] = contact_references(mcf_ref, contact_href)
+    parties = responsible_parties(mcf_ref['metadata'])
+  if engine == 'tree':
+    xml_string = render_tree(mcf_ref, template)
+  else:
+    xml_string = render_template(mcf_ref, schema_local=template)
+  return (xml_string, parties,
+          canonical_hash(xml_string) if hash_output else None)
+        
+def required_fields(templates, engine, index, store, reproject, check_quality,
+                    completeness=False):
+  # MCF fields read by the templates plus those the enabled stages need,
+  # None (all fields) if a template can't be analysed
+  if engine != 'jinja':
+    return None
+  fields = set(['identifier'])
+  for template in templates:
+    template_fields = get_template_fields(schema_local=template)
+    if template_fields is None:
+      return None
+    fields.update(template_fields)
+  if index:
+    fields.update(INDEXED_FIELDS)
+  if store:
+    fields.update(['datestamp', 'publish_date', 'language'])
+  if reproject or check_quality:
+    from pygeometa.quality import BBOX_FIELDS, TEMPORAL_FIELDS
+    fields.update(BBOX_FIELDS + TEMPORAL_FIELDS + ('reference_system',))
+  if completeness:
+    for _, measure_fields, _ in MEASURES:
+      fields.update(measure_fields)
+    fields.update(['organization_name', 'language', 'title', 'abstract'])
+  return frozenset(fields)
         
 start_time = time.time() 
 
-def main():
+@click.command()
+@click.option('--index', 'index_path', type=click.Path(dir_okay=False),
+              help='Search index to update with converted records')
+@click.option('--store', 'store_path', type=click.Path(dir_okay=False),
+              help='SQLite MCF store to use instead of ymls_dts_dir')
+@click.option('--chunk-size', type=click.IntRange(1), default=2000,
+              show_default=True,
+              help='Extracted records checked, validated and written per '
+                   'chunk')
+@click.option('--batch-size', type=int, default=500,
+              help='Number of records per store transaction')
+@click.option('--reproject', is_flag=True,
+              help='Reproject projected bounding boxes to WGS84')
+@click.option('--check-quality', is_flag=True,
+              help='Check extents and dates of the batch before rendering')
+@click.option('--autofix', is_flag=True,
+              help='Fix obvious swaps found by --check-quality')
+@click.option('--engine', type=click.Choice(['jinja', 'tree']),
+              default='jinja',
+              help='Render with the Jinja2 templates or the tree emitter')
+@click.option('--shard', callback=shard_option,
+              help='Process only shard i of N (i/N, 1-based) of the input')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False),
+              help='Run report (JSON) to write, see pygeometa merge_reports')
+@click.option('--profile', 'profile_dir', type=click.Path(file_okay=False),
+              help='Write profile of the conversion stages to directory')
+@click.option('--compress',
+              type=click.Choice(sorted(c[1:] for c in COMPRESSIONS)),
+              help='Compress files written to ymls_dts_dir and xml_output_dir')
+@click.option('--compress-level', type=click.IntRange(1, 9),
+              help='Compression level, 1 (fastest) to 9 (smallest)')
+@click.option('--workers', type=click.IntRange(1), default=1,
+              help='Number of worker processes, largest inputs first')
+@click.option('--timeout', type=float,
+              help='Seconds after which a record conversion is killed '
+                   'and the record quarantined')
+@click.option('--max-tasks-per-worker', type=click.IntRange(1),
+              help='Records a worker converts before it is recycled')
+@click.option('--window', type=click.IntRange(1), default=1000,
+              show_default=True,
+              help='Records read ahead of the workers and converted largest '
+                   'first')
+@click.option('--max-worker-memory', type=click.IntRange(1),
+              help='Worker RSS (MiB) above which it is recycled')
+@click.option('--template-fields', is_flag=True,
+              help='Extract only the MCF fields the template reads (and '
+                   'enabled stages need); other fields are left empty')
+@click.option('--language', 'rga_language', default='auto',
+              type=click.Choice(['auto'] + sorted(get_rga_languages())),
+              help='Template language; auto detects it per record from '
+                   'the metadata language and script of title and abstract')
+@click.option('--completeness', 'completeness_path',
+              type=click.Path(dir_okay=False),
+              help='Write field completeness by organisation and language '
+                   '(.json for JSON, which merge_reports merges across '
+                   'shards, else CSV)')
+@click.option('--check-links', is_flag=True,
+              help='Check linkage URLs of converted records, results in '
+                   'the report')
+@click.option('--link-cache', type=click.Path(dir_okay=False),
+              help='JSON cache of link check results, reused by reruns')
+@click.option('--link-ttl', type=float, default=24,
+              help='Hours link check results are cached')
+@click.option('--link-workers', type=click.IntRange(1), default=16,
+              help='Concurrent link checks')
+@click.option('--link-per-host', type=click.IntRange(1), default=2,
+              help='Concurrent link checks per host')
+@click.option('--contacts', 'contact_registry', is_flag=True,
+              help='Reference responsible parties by xlink:href to a shared '
+                   'registry, xml_output_dir/contacts.xml, instead of '
+                   'repeating them; with --shard, each shard writes '
+                   'contacts.shard-i-of-N.xml for merge_reports --contacts')
+@click.option('--contact-href', default=HREF_PATTERN, show_default=True,
+              help='xlink:href of registry entries, with an {id} field '
+                   '(e.g. a catalogue\'s subtemplate URL); relative to '
+                   'xml_output_dir, whatever the --layout')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False),
+              help='JSON manifest of canonical (C14N) hashes of outputs, '
+                   'compared with the previous run to detect changes')
+@click.option('--changes', 'changes_path', type=click.Path(dir_okay=False),
+              help='Change feed of added, modified and deleted records '
+                   '(.atom or .xml for Atom, else appended JSON Lines); '
+                   'requires --manifest')
+@click.option('--changes-link',
+              help='URL of records in the Atom feed, with {name} and '
+                   '{identifier} fields')
+@click.option('--durability', type=click.Choice(DURABILITY_LEVELS),
+              default='batch',
+              help='Sync outputs to disk: none, in groups (batch), or '
+                   'each file')
+@click.option('--commit-every', type=click.IntRange(1), default=256,
+              help='Outputs synced together per group commit (batch '
+                   'durability)')
+@click.option('--recursive', is_flag=True,
+              help='Find input files in subdirectories of xml_input_dir')
+@click.option('--include', multiple=True,
+              help='Convert only inputs whose path relative to '
+                   'xml_input_dir matches this pattern (repeatable, e.g. '
+                   '\'*_SRP_lat*\')')
+@click.option('--exclude', multiple=True,
+              help='Skip inputs whose relative path matches this pattern '
+                   '(repeatable)')
+@click.option('--layout', type=click.Choice(LAYOUTS), default='flat',
+              help='Write outputs to ymls_dts_dir and xml_output_dir '
+                   'directly (flat) or in ab/cd/ subdirectories by a hash '
+                   'of the record name (hash), for millions of files')
+def main(index_path, store_path, chunk_size, batch_size, reproject,
+         check_quality, autofix, engine, shard, report_path, profile_dir, compress,
+         compress_level, workers, timeout, max_tasks_per_worker, window,
+         max_worker_memory, template_fields, rga_language, completeness_path,
+         check_links, link_cache, link_ttl, link_workers, link_per_host,
+         contact_registry, contact_href, manifest_path, changes_path,
+         changes_link, durability, commit_every, recursive, include,
+         exclude, layout):
+  limits = {'max_tasks': max_tasks_per_worker,
+            'max_rss': max_worker_memory and max_worker_memory * 1024 * 1024,
+            'window': window}
+  if changes_path and not manifest_path:
+    raise click.UsageError('--changes requires --manifest')
+  durability = {'durability': durability, 'group_size': commit_every}
+  feed = {'manifest': manifest_path, 'changes': changes_path,
+          'link': changes_link}
+  discovery = {'recursive': recursive, 'include': include,
+               'exclude': exclude, 'layout': layout}
+  link_checker = None
+  if check_links:
+    link_checker = LinkChecker(link_cache, link_ttl * 3600, link_workers,
+                               link_per_host)
+  with Profiler(profile_dir) as profiler:
+    convert(index_path, store_path, batch_size, reproject, check_quality,
+            autofix, engine, shard, report_path, profiler, compress,
+            compress_level, workers, timeout, limits, template_fields,
+            durability, rga_language, completeness_path, link_checker,
+            contact_href if contact_registry else None, feed, discovery,
+            chunk_size)
+
+def convert(index_path, store_path, batch_size, reproject, check_quality,
+            autofix, engine, shard, report_path, profiler, compress=None,
+            compress_level=None, workers=1, timeout=None, limits=None,
+            template_fields=False, durability=None, rga_language='auto',
+            completeness_path=None, link_checker=None, contact_href=None,
+            feed=None, discovery=None, chunk_size=2000):
+  feed = feed or {}
+  discovery = discovery or {}
+  layout = discovery.get('layout', 'flat')
+  limits = limits or {}
+  durability = durability or {}
   
   template_dataset_srb_cyr= 'pygeometa/templates/dts_template_srb_cyr/'
   template_dataset_srb_lat= 'pygeometa/templates/dts_template_srb_lat/'
   template_dataset_eng = 'pygeometa/templates/dts_template_eng/'
+  template_datasets = {'srb_cyr': template_dataset_srb_cyr,
+                       'srb_lat': template_dataset_srb_lat,
+                       'eng': template_dataset_eng}
   xml_input_dir= 'xml_input_dir/'
   xml_output_dir='xml_output_dir/'
   ymls_dts_dir='ymls_dts_dir/'
   fail_dts_dir= 'fail_dts_dir/'
-  #print(glob.glob(xml_input_dir + "*.xml"))
-  xmlfiles= glob.glob(xml_input_dir + "*.xml")
+  report = RunReport(shard)
   data=[]
-  for fxml in xmlfiles:
-    makeyml(fxml, ymls_dts_dir)
-  ymlfiles= glob.glob(ymls_dts_dir + "*.yml")
-  for fyml in ymlfiles:
-    mcf_string = fyml
-    base=os.path.basename(fyml)
-    base= os.path.splitext(base)[0]
-    xml_file_name= base  + '.xml'
-    xml_file_path= xml_output_dir + xml_file_name
-    print (fyml)
-    try:
-      xml_string = render_template(mcf_string, schema_local=template_dataset_srb_lat)
-      with open(xml_file_path, 'w') as ff:
-        ff.write(xml_string)
-        print('Uspeh!')
-    except:
-      os.rename(fyml, fail_dts_dir + base + '.yml' )
-      os.rename(xml_input_dir + base  + '.xml', fail_dts_dir + xml_file_name )
-      print ("Oops! " + base +' That was no valid file.  Try again...')
-      continue
+  index = CatalogueIndex(index_path) if index_path else None
+  store = MCFStore(store_path) if store_path else None
+  if rga_language != 'auto':
+    default_template = template_datasets[rga_language]
+  else:
+    default_template = template_dataset_srb_lat
+  sources = {}  # name: input file, to skip duplicates and quarantine
+  templates = {}  # name: template, if not the default one
+  # plain, compressed (.gz, .bz2, .xz) and zipped (archive.zip!member)
+  # xml, streamed from the directory scan into the extract scheduler:
+  # each file is sniffed as it is found, reading only its start to
+  # reject non-ISO files before parsing and pick the template of its
+  # language and script
+  def discovered():
+    for fxml in find_sources(xml_input_dir,
+                             recursive=discovery.get('recursive', False),
+                             include=discovery.get('include'),
+                             exclude=discovery.get('exclude')):
+      base = source_name(fxml)
+      # files are assigned to shards by record name, base + '.xml'
+      if not in_shard(base + '.xml', shard):
+        continue
+      if base in sources:
+        print('Skipped ' + fxml + ': duplicate of ' + sources[base])
+        continue
+      try:
+        header = sniff(fxml)
+      except Exception as err:
+        header = None
+        reason = '{}: {}'.format(type(err).__name__, err)
+      else:
+        reason = header.reason
+      if reason is not None:
+        move_source(fxml, fail_dts_dir)
+        print('Rejected ' + base + ': ' + reason)
+        report.add(base, 'quarantined', [reason])
+        continue
+      language = header.rga_language if rga_language == 'auto' else rga_language
+      if template_datasets[language] != default_template:
+        templates[base] = template_datasets[language]
+      sources[base] = fxml
+      yield fxml, fxml, source_size(fxml)
+  fields = None
+  if template_fields:
+    # templates are picked as files are found: all those that may be
+    fields = required_fields(set(template_datasets.values())
+                             if rga_language == 'auto'
+                             else [default_template],
+                             engine, index_path, store_path, reproject,
+                             check_quality, completeness_path)
+    print('Extracting ' + (str(len(fields)) if fields else 'all') + ' fields')
+  scheduler = Scheduler(functools.partial(extract_record, fields=fields),
+                        workers, timeout, profiler, **limits)
+  jobs = discovered()
+  def extracted_records():
+    for fxml, record, error in scheduler.run(jobs):
+      base = source_name(fxml)
+      if error is not None:
+        move_source(fxml, fail_dts_dir)
+        print('Quarantined ' + base + ': ' + error)
+        report.add(base, 'quarantined', [error])
+        continue
+      yield base, fxml, record
+  if reproject:
+    from pygeometa.reproject import reproject_batch
+  if check_quality:
+    from pygeometa.quality import SERBIA_EXTENT, check_batch
+  completeness = CompletenessStats() if completeness_path else None
+  measured = set()  # names of records in completeness, until converted
+  links = {}  # url: names of records linking it
+  writer = AtomicWriter(compression=compress, level=compress_level,
+                        **durability)
+  # check, validate and write bounded chunks of extracted records, so
+  # memory doesn't grow with the catalogue and each chunk is committed
+  pending = extracted_records()
+  with writer:
+    while True:
+      with profiler.stage('extract'):
+        extracted = list(itertools.islice(pending, chunk_size))
+      if not extracted:
+        break
+      if reproject:
+        with profiler.stage('reproject'):
+          codes = reproject_batch([record for _, _, record in extracted])
+        for (base, _, _), epsg in zip(extracted, codes):
+          if epsg is not None:
+            print('Reprojected ' + base + ' from EPSG:' + str(epsg))
+      if check_quality:
+        with profiler.stage('check'):
+          results = check_batch([record for _, _, record in extracted],
+                                autofix=autofix, region=SERBIA_EXTENT)
+        passed = []
+        for (base, fxml, record), (failures, fixes) in zip(extracted, results):
+          if fixes:
+            print('Fixed ' + base + ': ' + ', '.join(fixes))
+          if failures:
+            move_source(fxml, fail_dts_dir)
+            print('Quarantined ' + base + ': ' + ', '.join(failures))
+            report.add(base, 'quarantined', failures)
+          else:
+            passed.append((base, fxml, record))
+        extracted = passed
+      with profiler.stage('write'):
+        batch = []
+        for base, fxml, record in extracted:
+          mcf = record.to_mcf()
+          # fail fast on MCFs the template can't render, with reasons
+          validator = get_validator(schema_local=templates.get(
+                                    base, default_template))
+          reasons = validator.validate(mcf) if validator is not None else []
+          if reasons:
+            move_source(fxml, fail_dts_dir)
+            print('Invalid ' + base + ': ' + ', '.join(reasons))
+            report.add(base, 'quarantined', reasons)
+            continue
+          if completeness is not None:
+            completeness.add(mcf)
+            measured.add(base)
+          if link_checker is not None:
+            linkage = mcf['metadata'].get('linkage')
+            for url in (linkage if isinstance(linkage, list) else [linkage]):
+              if url and url.strip():
+                links.setdefault(url.strip(), []).append(base)
+          if store is not None:
+            batch.append((base, mcf))
+            if len(batch) >= batch_size:
+              store.put_many(batch)
+              batch = []
+          else:
+            writeyml(mcf, base, ymls_dts_dir, writer, layout)
+          if index is not None:
+            index.add(base, mcf)
+        if batch:
+          store.put_many(batch)
+        writer.commit()
+  report.add_stage('extract', scheduler.stats())
+  print_load_balance('extract', scheduler.stats())
+  if link_checker is not None:
+    with profiler.stage('links'):
+      results = link_checker.check(links)
+    report.add_links(results, links)
+    for url, status, error, names in report.broken_links():
+      print('Broken link ' + url + ' (' + (error or str(status)) + '): ' +
+            ', '.join(names))
+    print('Checked ' + str(len(results)) + ' links, ' +
+          str(link_checker.cached) + ' cached, ' +
+          str(len(report.broken_links())) + ' broken')
+  if store is not None:
+    # one sequential scan of the store, rows are handed to workers as
+    # MCF dicts instead of reopening the store per record
+    records = ((name, mcf, None, size)
+               for name, mcf, size in store.iter_records(sizes=True))
+  else:
+    records = ((source_name(fyml), fyml, fyml, source_size(fyml))
+               for fyml in find_sources(ymls_dts_dir, '.yml',
+                                        recursive=layout == 'hash'))
+  inflight = {}  # name: yml path of records read ahead or rendering
+  def render_jobs():
+    for base, mcf_ref, fyml, size in records:
+      if not in_shard(base + '.xml', shard):
+        continue
+      inflight[base] = fyml
+      # relative hrefs resolve from the record's folder of the layout
+      href = (record_href(contact_href, layout_path('', base + '.xml', layout))
+              if contact_href is not None else None)
+      # records stored by earlier runs keep the default template
+      yield (base, (mcf_ref, engine, templates.get(base, default_template),
+                    href, bool(feed.get('manifest'))),
+             size)
+  failed = []
+  # warm caches once, before workers (and their replacements) fork
+  if engine == 'jinja':
+    for template in (set(template_datasets.values()) if rga_language == 'auto'
+                     else [default_template]):
+      get_template(schema_local=template)
+  else:
+    get_rga_strings()
+  scheduler = Scheduler(render_record, workers, timeout, profiler, **limits)
+  writer = AtomicWriter(compression=compress, level=compress_level,
+                        **durability)
+  manifest = Manifest(feed['manifest']) if feed.get('manifest') else None
+  registry = None
+  if contact_href is not None:
+    # one registry per shard, merged with merge_reports --contacts;
+    # uncompressed at the root of xml_output_dir, where hrefs point
+    registry_path = xml_output_dir + registry_name(shard)
+    # keep entries (and edits) of the registry of earlier runs
+    registry = ContactRegistry(registry_path if os.path.exists(registry_path)
+                               else None)
+  with profiler.stage('render'), writer:
+    for base, result, error in scheduler.run(render_jobs()):
+      xml_string, parties, digest = result or (None, [], None)
+      fyml = inflight.pop(base)
+      xml_file_name= base  + '.xml'
+      xml_file_path= layout_path(xml_output_dir, xml_file_name, layout)
+      print (fyml or base)
+      try:
+        if error is not None:
+          raise RuntimeError(error)
+        with writer.open(xml_file_path) as ff:
+          ff.write(xml_string.encode('utf-8'))
+          print('Uspeh!')
+        report.add(base, 'converted')
+        if registry is not None:
+          for _, name, email, role in parties:
+            registry.register(name, email, role)
+        if manifest is not None:
+          manifest.update(base, *digest)
+      except Exception as err:
+        reason = error or '{}: {}'.format(type(err).__name__, err)
+        report.add(base, 'failed', [reason])
+        if index is not None:
+          # indexed at extract time, but not converted
+          index.remove(base)
+        if base in measured:
+          completeness.remove(store.get(base) if fyml is None
+                              else read_mcf(read_text(fyml)))
+        if fyml is None:
+          failed.append(base)
+          with open(fail_dts_dir + base + '.yml', 'w') as outfile:
+            yaml.dump(store.get(base), outfile, default_flow_style=False, allow_unicode=True)
+        else:
+          move_source(fyml, fail_dts_dir)
+        move_source(sources.get(base, xml_input_dir + xml_file_name), fail_dts_dir)
+        print ("Oops! " + base +' That was no valid file: ' + reason)
+        continue
+    if registry is not None:
+      registry.save(registry_path, durability.get('durability', 'batch'))
+      print('Contacts: ' + str(len(registry)) + ' in registry, ' +
+            str(registry.added) + ' new')
+  report.add_stage('render', scheduler.stats())
+  if manifest is not None:
+    # records of earlier runs whose output is gone
+    for name in manifest.missing():
+      if (in_shard(name + '.xml', shard) and
+          not os.path.exists(writer.path(layout_path(xml_output_dir,
+                                                     name + '.xml', layout)))):
+        manifest.delete(name)
+    manifest.save()
+    if feed.get('changes'):
+      if feed['changes'].endswith(('.atom', '.xml')):
+        write_atom(manifest.history, feed['changes'], link=feed.get('link'))
+      else:
+        write_jsonl(manifest.changes, feed['changes'])
+    summary = manifest.summary()
+    print('Changes: ' + ', '.join(str(summary[c]) + ' ' + c
+                                  for c in ('added', 'modified', 'deleted')))
+  print_load_balance('render', scheduler.stats())
+  if index is not None:
+    index.save()
+  if store is not None:
+    for name in failed:
+      store.delete(name)
+    store.close()
+  if completeness is not None:
+    with codecs.open(completeness_path, 'w', encoding='utf-8') as fh:
+      if completeness_path.endswith('.json'):
+        completeness.write_json(fh)
+      else:
+        completeness.write_csv(fh)
+  if report_path:
+    report.finish()
+    report.save(report_path)
     
   print("--- %s seconds ---" % (time.time() - start_time))
 
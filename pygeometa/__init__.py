@@ -46,8 +46,12 @@
 
 import click
 
+from pygeometa.completeness import completeness
 from pygeometa.core import generate_metadata
 from pygeometa.migrations import migrate
+from pygeometa.report import merge_reports
+from pygeometa.search import build_index, search
+from pygeometa.validation import lint
 
 __version__ = '0.3-dev'
 
@@ -59,3 +63,8 @@ def cli():
 
 cli.add_command(generate_metadata)
 cli.add_command(migrate)
+cli.add_command(merge_reports)
+cli.add_command(build_index)
+cli.add_command(search)
+cli.add_command(lint)
+cli.add_command(completeness)
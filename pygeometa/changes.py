@@ -0,0 +1,253 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import codecs
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import uuid
+from xml.etree import ElementTree as etree
+from xml.sax.saxutils import escape, quoteattr
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+CHANGES = ['added', 'modified', 'deleted']
+
+# changes kept in the manifest, and published in Atom feeds
+HISTORY_SIZE = 1000
+
+ATOM_NAMESPACE = 'http://www.w3.org/2005/Atom'
+
+IDENTIFIER_PATH = ('{http://www.isotc211.org/2005/gmd}fileIdentifier/'
+                   '{http://www.isotc211.org/2005/gco}CharacterString')
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _canonicalize(element):
+    """
+    returns canonical form of an element for Pythons without
+    etree.canonicalize (< 3.8): namespaces as {uri}name, attributes
+    sorted, whitespace-stripped text, no comments
+    """
+
+    parts = [u'<', element.tag]
+    for key in sorted(element.attrib):
+        parts.extend([u' ', key, u'=', quoteattr(element.attrib[key])])
+    parts.append(u'>')
+    parts.append(escape((element.text or u'').strip()))
+    for child in element:
+        parts.append(_canonicalize(child))
+        parts.append(escape((child.tail or u'').strip()))
+    parts.extend([u'</', element.tag, u'>'])
+    return u''.join(parts)
+
+
+def canonical_hash(xml):
+    """
+    returns tuple of fileIdentifier (or None) and SHA-256 hex digest of
+    the canonical (C14N 2.0, whitespace-stripped) form of an XML string,
+    so that formatting changes do not count as modifications.  Pythons
+    before 3.8 lack C14N 2.0 and use a fallback form, whose digests
+    differ from those of later Pythons
+    """
+
+    if isinstance(xml, bytes):
+        xml = xml.decode('utf-8')
+
+    root = etree.fromstring(xml.encode('utf-8'))
+    identifier = root.findtext(IDENTIFIER_PATH)
+    if hasattr(etree, 'canonicalize'):
+        canonical = etree.canonicalize(xml, strip_text=True)
+    else:
+        canonical = _canonicalize(root)
+    digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return identifier and identifier.strip(), digest
+
+
+class Manifest(object):
+    """
+    canonical hashes of the records of the previous run, compared with
+    those of this run into a change list of added, modified and deleted
+    records
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = {}  # name: {'identifier', 'hash', 'updated'}
+        self.history = []
+        self.changes = []
+        self.seen = set()
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        LOGGER.debug('Loading manifest {}'.format(path))
+        with codecs.open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+
+        if data.get('version') != MANIFEST_VERSION:
+            raise RuntimeError('Unsupported manifest version: {}'.format(
+                               data.get('version')))
+
+        self.records = data['records']
+        self.history = data.get('history', [])
+
+    def update(self, name, identifier, digest, timestamp=None):
+        """record the hash of a generated record, returns its change"""
+
+        self.seen.add(name)
+        previous = self.records.get(name)
+        if previous is not None and previous['hash'] == digest:
+            return None
+
+        change = 'added' if previous is None else 'modified'
+        timestamp = timestamp or _now()
+        self.records[name] = {'identifier': identifier, 'hash': digest,
+                              'updated': timestamp}
+        return self._change(change, name, identifier, digest, timestamp)
+
+    def delete(self, name, timestamp=None):
+        """remove a record of the previous run, returns its change"""
+
+        previous = self.records.pop(name, None)
+        if previous is None:
+            return None
+        return self._change('deleted', name, previous['identifier'], None,
+                            timestamp or _now())
+
+    def missing(self):
+        """returns sorted names of previous records not updated this run"""
+
+        return sorted(set(self.records) - self.seen)
+
+    def _change(self, change, name, identifier, digest, timestamp):
+        entry = {'change': change, 'name': name, 'identifier': identifier,
+                 'hash': digest, 'timestamp': timestamp}
+        self.changes.append(entry)
+        return entry
+
+    def summary(self):
+        """returns dict of change count by type of this run"""
+
+        counts = dict((change, 0) for change in CHANGES)
+        for entry in self.changes:
+            counts[entry['change']] += 1
+        return counts
+
+    def save(self, path=None):
+        """write manifest, with recent change history, to a JSON file"""
+
+        path = path or self.path
+        self.history = (self.history + self.changes)[-HISTORY_SIZE:]
+
+        LOGGER.debug('Writing manifest {}'.format(path))
+        tmp_path = '{}.tmp'.format(path)
+        with codecs.open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump({'version': MANIFEST_VERSION, 'generated': _now(),
+                       'records': self.records, 'history': self.history},
+                      fh, indent=1, sort_keys=True, ensure_ascii=False)
+        os.rename(tmp_path, path)
+
+
+def write_jsonl(changes, path):
+    """append changes to a JSON Lines change feed"""
+
+    with codecs.open(path, 'a', encoding='utf-8') as fh:
+        for entry in changes:
+            fh.write(json.dumps(entry, sort_keys=True, ensure_ascii=False))
+            fh.write('\n')
+
+
+def _entry_id(entry):
+    """returns permanent, unique Atom id of a change"""
+
+    return uuid.uuid5(uuid.NAMESPACE_URL, u'{}|{}|{}'.format(
+        entry['name'], entry['change'], entry['timestamp'])).urn
+
+
+def write_atom(changes, path, title='Metadata changes', link=None):
+    """
+    write an Atom feed of changes, newest first; link is an optional
+    URL pattern of records with {name} and {identifier} fields
+    """
+
+    def sub(parent, tag, text=None, **attributes):
+        element = etree.SubElement(parent, tag, attributes)
+        element.text = text
+        return element
+
+    changes = sorted(changes, key=lambda e: e['timestamp'], reverse=True)
+    feed = etree.Element('feed', xmlns=ATOM_NAMESPACE)
+    sub(feed, 'id', uuid.uuid5(uuid.NAMESPACE_URL,
+                               os.path.abspath(path)).urn)
+    sub(feed, 'title', title)
+    sub(feed, 'updated', changes[0]['timestamp'] if changes else _now())
+    sub(sub(feed, 'author'), 'name', 'pygeometa')
+
+    for entry in changes:
+        element = sub(feed, 'entry')
+        sub(element, 'id', _entry_id(entry))
+        sub(element, 'title', u'{} {}'.format(entry['change'],
+                                              entry['identifier']))
+        sub(element, 'updated', entry['timestamp'])
+        sub(element, 'category', term=entry['change'])
+        sub(element, 'summary', entry['name'])
+        if link is not None:
+            sub(element, 'link', href=link.format(
+                name=entry['name'], identifier=entry['identifier']))
+
+    tmp_path = '{}.tmp'.format(path)
+    etree.ElementTree(feed).write(tmp_path, encoding='UTF-8',
+                                  xml_declaration=True)
+    os.rename(tmp_path, path)
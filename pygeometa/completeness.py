@@ -0,0 +1,257 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import csv
+import json
+import logging
+import os
+
+import click
+from six import string_types
+
+from pygeometa.core import read_mcf
+from pygeometa.fileio import find_sources, read_text
+from pygeometa.quality import BBOX_FIELDS, TEMPORAL_FIELDS
+from pygeometa.sniff import detect_script, route
+from pygeometa.store import MCFStore
+
+LOGGER = logging.getLogger(__name__)
+
+# (measure, MCF metadata fields, whether any or all must be filled)
+MEASURES = [
+    ('title', ('title',), any),
+    ('abstract', ('abstract',), any),
+    ('keywords', ('keywords',), any),
+    ('inspire_category', ('inspireCategory',), any),
+    ('lineage', ('lineage',), any),
+    ('linkage', ('linkage',), any),
+    ('bounding_box', BBOX_FIELDS, all),
+    ('temporal_extent', TEMPORAL_FIELDS, any),
+    ('resolution', ('denominator', 'distance'), any),
+    ('distribution_format', ('dist_format',), any),
+    ('use_limitation', ('useLimitation',), any),
+    ('access_constraints', ('accessConstraints', 'otherConstraints'), any),
+    ('responsible_party', ('resp_organisationName',), any),
+    ('contact_email', ('organisation_emailAddress',), any),
+    ('resource_identifier', ('resourceIdentifier',), any)
+]
+
+# dimensions records are grouped by, besides the catalogue total
+DIMENSIONS = ['all', 'organisation', 'language']
+
+UNKNOWN = '(none)'
+
+
+def filled(value):
+    """returns True if an MCF value is not empty"""
+
+    if isinstance(value, (list, tuple)):
+        return any(filled(v) for v in value)
+    if isinstance(value, string_types):
+        return bool(value.strip())
+    return value is not None
+
+
+def _first(value):
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    if isinstance(value, string_types):
+        value = ' '.join(value.split())
+    return value or UNKNOWN
+
+
+class CompletenessStats(object):
+    """
+    field completeness of MCF records, in total and by organisation and
+    RGA language, accumulated record by record in memory proportional
+    to the number of groups
+    """
+
+    def __init__(self):
+        self.groups = {}  # (dimension, group): [records, score, counts]
+
+    def __len__(self):
+        total = self.groups.get(('all', ''))
+        return total[0] if total else 0
+
+    def add(self, mcf):
+        """add an MCF dict (or MCFRecord.to_mcf() output)"""
+
+        self._update(mcf, 1)
+
+    def remove(self, mcf):
+        """remove an MCF added before (e.g. a record that failed later)"""
+
+        self._update(mcf, -1)
+
+    def _update(self, mcf, sign):
+        metadata = mcf.get('metadata', mcf)
+        hits = [int(combine(filled(metadata.get(f)) for f in fields))
+                for _, fields, combine in MEASURES]
+        score = sum(hits) / float(len(hits))
+
+        organisation = _first(metadata.get('organization_name') or
+                              metadata.get('resp_organisationName'))
+        text = u' '.join(u'{}'.format(metadata.get(f) or '')
+                         for f in ('title', 'abstract'))
+        language = route(_first(metadata.get('language')).lower(),
+                         detect_script(text))
+
+        for key in (('all', ''), ('organisation', organisation),
+                    ('language', language)):
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = [0, 0.0, [0] * len(MEASURES)]
+            group[0] += sign
+            group[1] += sign * score
+            group[2] = [c + sign * h for c, h in zip(group[2], hits)]
+            if not group[0]:
+                del self.groups[key]
+
+    def merge(self, other):
+        """add the statistics of another instance (e.g. a shard)"""
+
+        for key, (records, score, counts) in other.groups.items():
+            group = self.groups.setdefault(key, [0, 0.0, [0] * len(MEASURES)])
+            group[0] += records
+            group[1] += score
+            group[2] = [c + o for c, o in zip(group[2], counts)]
+
+    def rows(self):
+        """
+        yields dicts of dimension, group, records, mean completeness
+        score and share of records filling each measure, sorted
+        """
+
+        def order(key):
+            return DIMENSIONS.index(key[0]), key[1]
+
+        for key in sorted(self.groups, key=order):
+            records, score, counts = self.groups[key]
+            row = {'dimension': key[0], 'group': key[1],
+                   'records': records,
+                   'completeness': round(score / records, 4)}
+            for (measure, _, _), count in zip(MEASURES, counts):
+                row[measure] = round(count / float(records), 4)
+            yield row
+
+    def write_csv(self, fh):
+        """write rows as CSV to a text file object"""
+
+        columns = (['dimension', 'group', 'records', 'completeness'] +
+                   [m[0] for m in MEASURES])
+        writer = csv.DictWriter(fh, columns, lineterminator='\n')
+        writer.writeheader()
+        for row in self.rows():
+            writer.writerow(row)
+
+    def to_dict(self):
+        """returns JSON serialisable dict of measures, counts and rows"""
+
+        return {
+            'measures': dict((m[0], {'fields': list(m[1]),
+                                     'requires': m[2].__name__})
+                             for m in MEASURES),
+            'groups': [[k[0], k[1], g[0], g[1], g[2]]
+                       for k, g in sorted(self.groups.items())],
+            'rows': list(self.rows())
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """returns instance of the output of to_dict()"""
+
+        stats = cls()
+        for dimension, group, records, score, counts in data['groups']:
+            stats.groups[(dimension, group)] = [records, score, counts]
+        return stats
+
+    def write_json(self, fh):
+        """write to_dict() as JSON to a text file object"""
+
+        json.dump(self.to_dict(), fh, ensure_ascii=False, indent=2)
+        fh.write('\n')
+
+
+@click.command()
+@click.option('--store', 'store_path',
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='MCF store to read records from')
+@click.option('--format', 'format_', type=click.Choice(['csv', 'json']),
+              default='csv', help='Output format')
+@click.option('--output', type=click.File('w', encoding='utf-8'),
+              default='-', help='Name of output file (default: stdout)')
+@click.argument('mcf', nargs=-1,
+                type=click.Path(exists=True, resolve_path=True))
+def completeness(store_path, format_, output, mcf):
+    """field completeness of MCFs by organisation and language"""
+
+    if not mcf and store_path is None:
+        raise click.UsageError('MCF paths or --store required')
+
+    stats = CompletenessStats()
+
+    for path in mcf:
+        # recursive: ymls_dts_dir may have the hash layout
+        sources = (find_sources(path, '.yml', recursive=True)
+                   if os.path.isdir(path) else [path])
+        for source in sources:
+            try:
+                stats.add(read_mcf(read_text(source)))
+            except Exception as err:
+                LOGGER.warning('Skipping {}: {}'.format(source, err))
+
+    if store_path is not None:
+        with MCFStore(store_path) as store:
+            for _, record in store:
+                stats.add(record)
+
+    LOGGER.info('Read {} records'.format(len(stats)))
+
+    if format_ == 'json':
+        stats.write_json(output)
+    else:
+        stats.write_csv(output)
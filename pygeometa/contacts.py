@@ -0,0 +1,229 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import hashlib
+import logging
+import os
+
+from six import string_types
+
+from pygeometa.emitter import build_registry, serialize
+from pygeometa.fileio import AtomicWriter, parse_xml
+
+LOGGER = logging.getLogger(__name__)
+
+# default xlink:href of registry entries, relative to the output
+# directory holding the registry and (flat layout) the records
+HREF_PATTERN = 'contacts.xml#{id}'
+
+REGISTRY_NAME = 'contacts.xml'
+
+
+def _text(value):
+    return u'' if value is None else u'{}'.format(value).strip()
+
+
+def _item(value, index):
+    try:
+        return value[index]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+def responsible_parties(metadata):
+    """
+    returns list of (property, name, email, role) of the contact and
+    point of contact responsible parties of MCF metadata, as the RGA
+    template renders them
+    """
+
+    parties = [('contact', metadata.get('organization_name'),
+                metadata.get('organisation_emailAddress'), 'pointOfContact')]
+
+    names = metadata.get('resp_organisationName')
+    emails = metadata.get('resp_organisation_emailAddress')
+    roles = metadata.get('resp_organisation_role')
+
+    if isinstance(roles, string_types):
+        parties.append(('pointOfContact', names, emails, roles))
+    else:
+        for i, name in enumerate(names or []):
+            parties.append(('pointOfContact', name, _item(emails, i),
+                            _item(roles, i)))
+
+    return [(prop, _text(name), _text(email), _text(role))
+            for prop, name, email, role in parties]
+
+
+def contact_id(name, email, role):
+    """returns stable registry id of a responsible party"""
+
+    key = u'\n'.join(u' '.join(v.split()).lower() for v in (name, email, role))
+    return 'contact-{}'.format(
+        hashlib.sha1(key.encode('utf-8')).hexdigest()[:12])
+
+
+def registry_name(shard=None):
+    """
+    returns filename of the registry written by a run of shard (i, N):
+    shards write their own registry, merged into REGISTRY_NAME later
+    """
+
+    if shard is None:
+        return REGISTRY_NAME
+    return 'contacts.shard-{}-of-{}.xml'.format(*shard)
+
+
+def record_href(href, path):
+    """
+    returns xlink:href pattern of registry entries as referenced from a
+    record at path, relative to the output directory (e.g. ab/cd/name.xml
+    of the hash layout): relative hrefs go up one level per directory
+    """
+
+    if '://' in href or href.startswith(('/', '#')):
+        return href
+
+    directory = os.path.dirname(path)
+    depth = len(directory.replace(os.sep, '/').split('/')) if directory else 0
+    return '../' * depth + href
+
+
+def contact_references(mcf, href=HREF_PATTERN):
+    """
+    returns dict of xlink references (href and title) to registry
+    entries of the responsible parties of an MCF: contact and a list
+    for pointOfContact, as read by the RGA template and emitter
+    """
+
+    references = {'contact': None, 'pointOfContact': []}
+
+    for prop, name, email, role in responsible_parties(mcf['metadata']):
+        reference = {'href': href.format(id=contact_id(name, email, role)),
+                     'title': name}
+        if prop == 'contact':
+            references['contact'] = reference
+        else:
+            references['pointOfContact'].append(reference)
+
+    return references
+
+
+class ContactRegistry(object):
+    """
+    responsible parties deduplicated across records, written as one
+    registry document of CI_ResponsibleParty entries identified by id
+
+    entries loaded from an existing registry are kept as they are, so
+    a contact edited in the registry stays edited and records keep
+    referencing it
+    """
+
+    def __init__(self, path=None):
+        self.entries = {}  # id: (name, email, role)
+        self.added = 0
+
+        if path is not None:
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def register(self, name, email, role):
+        """register a responsible party, returns its id"""
+
+        id_ = contact_id(name, email, role)
+        if id_ not in self.entries:
+            self.entries[id_] = (name, email, role)
+            self.added += 1
+        return id_
+
+    def add(self, mcf):
+        """register the responsible parties of an MCF, returns ids"""
+
+        return [self.register(name, email, role) for _, name, email, role
+                in responsible_parties(mcf['metadata'])]
+
+    def merge(self, other):
+        """
+        add entries of another registry (e.g. of a shard), keeping
+        entries of this one as they are
+        """
+
+        for id_, entry in other.entries.items():
+            if id_ not in self.entries:
+                self.entries[id_] = entry
+                self.added += 1
+
+    def load(self, path):
+        """load entries of a registry document"""
+
+        LOGGER.debug('Loading contact registry {}'.format(path))
+        root = parse_xml(path).getroot()
+
+        for party in root.iter('CI_ResponsibleParty'):
+            self.entries[party.get('id')] = (
+                _text(party.findtext('organisationName/CharacterString')),
+                _text(party.findtext('contactInfo/CI_Contact/address/'
+                                     'CI_Address/electronicMailAddress/'
+                                     'CharacterString')),
+                _text(party.find('role/CI_RoleCode').get('codeListValue')))
+
+    def to_xml(self):
+        """returns registry document as UTF-8 encoded XML"""
+
+        return serialize(build_registry(
+            (id_,) + self.entries[id_] for id_ in sorted(self.entries)))
+
+    def save(self, path, durability='batch'):
+        """
+        write registry document to path atomically, uncompressed so the
+        xlink:href of records resolve to it
+        """
+
+        LOGGER.debug('Writing contact registry {}'.format(path))
+        with AtomicWriter(durability) as writer, writer.open(path) as fh:
+            fh.write(self.to_xml())
@@ -47,15 +47,21 @@
 import codecs
 from datetime import date, datetime
 import logging
+from multiprocessing import Pool, cpu_count
 import os
 import pkg_resources
 import re
 from xml.dom import minidom
 
 import click
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, nodes
 from jinja2.exceptions import TemplateNotFound
+from six import string_types
 import yaml
+from yaml.representer import SafeRepresenter
+
+from pygeometa.profiling import Profiler
+from pygeometa.store import STORE_SCHEME, MCFStore, parse_store_uri
 
 LOGGER = logging.getLogger(__name__)
 
@@ -64,36 +70,122 @@ TEMPLATES = '{}{}templates'.format(os.path.dirname(os.path.realpath(__file__)),
 
 VERSION = pkg_resources.require('pygeometa')[0].version
 
+# shared RGA dataset template, rendered by the dts_template_* aliases
+RGA_TEMPLATE = 'dts_template'
+RGA_ALIAS_PREFIX = 'dts_template_'
+
+_ENVIRONMENTS = {}
+_RGA_STRINGS = None
+_TEMPLATE_FIELDS = {}
+
+
+def language_index(section):
+    """
+    returns dict of the options of an MCF section by language: option:
+    {language: value}, with unsuffixed options under None.  Languages
+    may contain '_' (e.g. title_srb_lat), so every split is indexed
+    """
+
+    index = {}
+
+    for key, value in section.items():
+        if not isinstance(key, string_types):
+            continue
+        index.setdefault(key, {})[None] = value
+        position = key.find('_')
+        while position != -1:
+            index.setdefault(key[:position], {})[key[position + 1:]] = value
+            position = key.find('_', position + 1)
+
+    return index
+
+
+class MCFSection(dict):
+    """
+    MCF section (dict) carrying its language_index, built on first use
+    and dropped when the section changes
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._languages = None
+
+    @property
+    def languages(self):
+        if getattr(self, '_languages', None) is None:
+            self._languages = language_index(self)
+        return self._languages
+
+    def __reduce__(self):  # pickle (e.g. to workers) without the index
+        return MCFSection, (dict(self),)
+
+    def __setitem__(self, key, value):
+        self._languages = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._languages = None
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self._languages = None
+        dict.clear(self)
+
+    def pop(self, *args):
+        self._languages = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._languages = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._languages = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._languages = None
+        dict.update(self, *args, **kwargs)
+
+
+# sections dump as plain mappings
+yaml.add_representer(MCFSection, SafeRepresenter.represent_dict)
+yaml.add_representer(MCFSection, SafeRepresenter.represent_dict,
+                     Dumper=yaml.SafeDumper)
+
+
+def index_sections(value):
+    """
+    returns value with its dicts, at any depth, as MCFSections, so that
+    their language index is built once per record
+    """
+
+    if isinstance(value, dict):
+        if not isinstance(value, MCFSection):
+            value = MCFSection(value)
+        for key, child in value.items():
+            if isinstance(child, dict) and not isinstance(child, MCFSection):
+                dict.__setitem__(value, key, index_sections(child))
+        value.languages  # build the index now, not while rendering
+    return value
+
 
 def get_charstring(option, section_items, language,
                    language_alternate=None):
     """convenience function to return unilingual or multilingual value(s)"""
 
-    section_items = dict(section_items)
-    option_value1 = None
+    if not isinstance(section_items, MCFSection):  # not from read_mcf
+        section_items = MCFSection(section_items)
+
+    values = section_items.languages.get(option)
+    if values is None:
+        return [None, None]
+
+    option_value1 = values.get(language, values.get(None))
     option_value2 = None
 
-    if 'language_alternate' is None:  # unilingual
-        option_tmp = '{}_{}'.format(option, language)
-        if option_tmp in section_items:
-            option_value1 = section_items[option_tmp]
-        else:
-            try:
-                option_value1 = section_items[option]
-            except KeyError:
-                pass  # default=None
-    else:  # multilingual
-        option_tmp = '{}_{}'.format(option, language)
-        if option_tmp in section_items:
-            option_value1 = section_items[option_tmp]
-        else:
-            try:
-                option_value1 = section_items[option]
-            except KeyError:
-                pass  # default=None
-        option_tmp2 = '{}_{}'.format(option, language_alternate)
-        if option_tmp2 in section_items:
-            option_value2 = section_items[option_tmp2]
+    if language_alternate is not None:  # multilingual
+        option_value2 = values.get(language_alternate)
 
     return [option_value1, option_value2]
 
@@ -145,7 +237,10 @@ def normalize_datestring(datestring, format_='default'):
 
 
 def read_mcf(mcf):
-    """returns dict of YAML file from filepath"""
+    """
+    returns dict of YAML file from filepath, string, dict or
+    MCF store reference (sqlite:/path/to/store.db#name)
+    """
 
     mcf_list = []
     mcf_dict = {}
@@ -158,6 +253,11 @@ def read_mcf(mcf):
         if isinstance(mcf_object, dict):
             LOGGER.debug('mcf object is already a dict')
             dict_ = mcf_object
+        elif mcf_object.startswith(STORE_SCHEME):
+            LOGGER.debug('mcf object is a store reference')
+            path, name = parse_store_uri(mcf_object)
+            with MCFStore(path) as store:
+                dict_ = store.get(name)
         elif 'metadata' in mcf_object:
             LOGGER.debug('mcf object is a string')
             dict_ = yaml.load(mcf_object)
@@ -204,6 +304,9 @@ def read_mcf(mcf):
     except KeyError:
         LOGGER.info('no MCF version specified')
 
+    for section, value in mcf_dict.items():
+        mcf_dict[section] = index_sections(value)
+
     return mcf_dict
 
 
@@ -216,10 +319,73 @@ def pretty_print(xml):
                       val.toprettyxml(indent=' '*2).split('\n') if l.strip()])
 
 
-def render_template(mcf, schema=None, schema_local=None):
+def get_rga_strings(language='srb_lat'):
+    """returns fixed labels of the shared RGA dataset template"""
+
+    global _RGA_STRINGS
+
+    if _RGA_STRINGS is None:
+        LOGGER.debug('Loading RGA template string tables')
+        path = os.path.join(TEMPLATES, RGA_TEMPLATE, 'strings.yml')
+        with codecs.open(path, encoding='utf-8') as fh:
+            _RGA_STRINGS = yaml.safe_load(fh)
+
+    return _RGA_STRINGS[language]
+
+
+def get_rga_languages():
+    """returns dict of RGA template languages and their metadata language"""
+
+    get_rga_strings()
+    return dict((language, strings['language_code'])
+                for language, strings in _RGA_STRINGS.items())
+
+
+def resolve_rga_alias(abspath):
     """
-    convenience function to render Jinja2 template given
-    an mcf file, string, or dict
+    returns tuple of shared RGA template path and language if abspath
+    is one of the dts_template_* aliases, else (abspath, None)
+    """
+
+    name = os.path.basename(os.path.normpath(abspath))
+    language = name[len(RGA_ALIAS_PREFIX):]
+
+    if (name.startswith(RGA_ALIAS_PREFIX) and
+            os.path.realpath(abspath) ==
+            os.path.realpath(os.path.join(TEMPLATES, name))):
+        try:
+            get_rga_strings(language)
+        except KeyError:
+            return abspath, None
+        return os.path.join(TEMPLATES, RGA_TEMPLATE), language
+
+    return abspath, None
+
+
+def get_environment(abspath):
+    """returns template environment of a schema path, created once"""
+
+    env = _ENVIRONMENTS.get(abspath)
+
+    if env is None:
+        LOGGER.debug('Setting up template environment {}'.format(abspath))
+        env = Environment(loader=FileSystemLoader([abspath, TEMPLATES]))
+        env.filters['normalize_datestring'] = normalize_datestring
+        env.filters['get_distribution_language'] = get_distribution_language
+        env.filters['get_charstring'] = get_charstring
+        env.globals.update(zip=zip)
+        env.globals.update(get_charstring=get_charstring)
+        env.globals.update(normalize_datestring=normalize_datestring)
+        env.globals.update(rga_strings=get_rga_strings)
+        _ENVIRONMENTS[abspath] = env
+
+    return env
+
+
+def get_schema_path(schema=None, schema_local=None):
+    """
+    returns tuple of template directory of a schema, resolving RGA
+    aliases, and RGA language (None if not an RGA alias)
     """
 
     LOGGER.debug('Evaluating schema path')
@@ -232,14 +398,17 @@ def render_template(mcf, schema=None, schema_local=None):
     elif schema is None:  # user-defined
         abspath = schema_local
 
-    LOGGER.debug('Setting up template environment {}'.format(abspath))
-    env = Environment(loader=FileSystemLoader([abspath, TEMPLATES]))
-    env.filters['normalize_datestring'] = normalize_datestring
-    env.filters['get_distribution_language'] = get_distribution_language
-    env.filters['get_charstring'] = get_charstring
-    env.globals.update(zip=zip)
-    env.globals.update(get_charstring=get_charstring)
-    env.globals.update(normalize_datestring=normalize_datestring)
+    return resolve_rga_alias(abspath)
+
+
+def get_template(schema=None, schema_local=None):
+    """
+    returns tuple of main template of a schema, from its cached
+    environment, and RGA language (None if not an RGA alias)
+    """
+
+    abspath, rga_language = get_schema_path(schema, schema_local)
+    env = get_environment(abspath)
 
     try:
         LOGGER.debug('Loading template')
@@ -249,8 +418,125 @@ def render_template(mcf, schema=None, schema_local=None):
         LOGGER.exception(msg)
         raise RuntimeError(msg)
 
+    return template, rga_language
+
+
+def _constant_key(node):
+    """returns constant key of a subscript or attribute node, else None"""
+
+    if isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const):
+        return node.arg.value
+    if isinstance(node, nodes.Getattr):
+        return node.attr
+    return None
+
+
+def _get_call_key(node, call):
+    """
+    returns key read by a call of a method of record[section]: the
+    constant key of .get(<constant>[, default]), else None
+    """
+
+    if (isinstance(node, nodes.Getattr) and node.attr == 'get' and
+            1 <= len(call.args) <= 2 and not call.kwargs and
+            call.dyn_args is None and call.dyn_kwargs is None and
+            isinstance(call.args[0], nodes.Const)):
+        return call.args[0].value
+    return None
+
+
+def _template_fields(env, name, section, seen):
+    """
+    returns set of record[section] keys read by template name and the
+    templates it includes or imports, None if not determinable
+    """
+
+    if name in seen:
+        return set()
+    seen.add(name)
+
+    ast = env.parse(env.loader.get_source(env, name)[0])
+    fields = set()
+
+    records = [n for n in ast.find_all(nodes.Name) if n.name == 'record']
+    subscripts = [n for n in ast.find_all((nodes.Getitem, nodes.Getattr))
+                  if isinstance(n.node, nodes.Name) and
+                  n.node.name == 'record']
+
+    # calls by the node called, e.g. record.metadata.get of .get('x')
+    calls = dict((id(n.node), n) for n in ast.find_all(nodes.Call))
+
+    # every use of record must be record[<constant>]
+    if (len(subscripts) != len(records) or
+            any(_constant_key(n) is None for n in subscripts)):
+        return None
+
+    # record.get(...) may return the section, to be read dynamically
+    for node in subscripts:
+        if (id(node) in calls and _constant_key(node) == 'get' and
+                _get_call_key(node, calls[id(node)]) in (section, None)):
+            return None
+
+    sections = set(id(n) for n in subscripts
+                   if _constant_key(n) == section)
+    consumed = set()
+
+    for node in ast.find_all((nodes.Getitem, nodes.Getattr)):
+        if id(node.node) in sections:
+            key = _constant_key(node)
+            if id(node) in calls:  # method of record[section]
+                key = _get_call_key(node, calls[id(node)])
+            if key is None:
+                return None
+            fields.add(key)
+            consumed.add(id(node.node))
+
+    # and every record[section] must be record[section][<constant>]
+    if consumed != sections:
+        return None
+
+    for node in ast.find_all((nodes.Include, nodes.Import,
+                              nodes.FromImport)):
+        if not isinstance(node.template, nodes.Const):
+            return None
+        included = _template_fields(env, node.template.value, section, seen)
+        if included is None:
+            return None
+        fields.update(included)
+
+    return fields
+
+
+def get_template_fields(schema=None, schema_local=None, section='metadata'):
+    """
+    returns frozenset of keys of record[section] that a template (with
+    the templates it includes or imports) reads, or None if the
+    template uses the record in a way that cannot be determined
+    statically.  The result is computed once per template
+    """
+
+    template, _ = get_template(schema, schema_local)
+    key = (template.filename, section)
+
+    if key not in _TEMPLATE_FIELDS:
+        LOGGER.debug('Analysing fields of {}'.format(template.filename))
+        fields = _template_fields(template.environment, template.name,
+                                  section, set())
+        _TEMPLATE_FIELDS[key] = None if fields is None else frozenset(fields)
+
+    return _TEMPLATE_FIELDS[key]
+
+
+def render_template(mcf, schema=None, schema_local=None):
+    """
+    convenience function to render Jinja2 template given
+    an mcf file, string, or dict
+    """
+
+    template, rga_language = get_template(schema, schema_local)
+
     LOGGER.debug('Processing template')
-    xml = template.render(record=read_mcf(mcf),
+    xml = template.render(record=read_mcf(mcf), rga_language=rga_language,
                           software_version=VERSION).encode('utf-8')
     return pretty_print(xml)
 
@@ -271,13 +557,115 @@ def get_abspath(mcf, filepath):
     return os.path.join(abspath, filepath)
 
 
+def find_mcfs(paths, extension='.yml'):
+    """yields MCF filepaths from a list of files and directories"""
+
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(extension):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def get_output_path(mcf, output_pattern, schema=None):
+    """
+    returns output filepath of an MCF file given a pattern with
+    {name} (MCF filename without extension) and {schema} fields
+    """
+
+    name = os.path.splitext(os.path.basename(mcf))[0]
+    return output_pattern.format(name=name, schema=schema or 'local')
+
+
+def _render_job(job):
+    """renders one MCF to its output file, returns error or None"""
+
+    mcf, schema, schema_local, output = job
+
+    try:
+        content = render_template(mcf, schema=schema,
+                                  schema_local=schema_local)
+        dirname = os.path.dirname(output)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:  # created by another worker
+                pass
+        with codecs.open(output, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+    except Exception as err:
+        LOGGER.debug('Rendering of {} failed'.format(mcf), exc_info=True)
+        return mcf, output, '{}: {}'.format(type(err).__name__, err)
+
+    return mcf, output, None
+
+
+def render_batch(mcfs, output_pattern, schema=None, schema_local=None,
+                 workers=1, profiler=None):
+    """
+    renders MCF files to outputs named by output_pattern, all with one
+    template environment
+
+    yields (mcf, output, error message or None) tuples as files complete.
+    Inputs mapping to the output of another input fail without rendering,
+    inputs given more than once are rendered once
+    """
+
+    profiler = profiler or Profiler()
+    if profiler.enabled:  # profile in this process
+        workers = 1
+
+    # compile the template before forking so that workers inherit it
+    get_template(schema, schema_local)
+
+    jobs = []
+    outputs = {}  # output: input
+
+    for mcf in mcfs:
+        output = get_output_path(mcf, output_pattern, schema)
+        previous = outputs.get(output)
+        if previous is not None:
+            if os.path.realpath(previous) != os.path.realpath(mcf):
+                yield mcf, output, 'Same output {} as {}'.format(
+                    output, previous)
+            continue  # else the same input, given twice
+        outputs[output] = mcf
+        jobs.append((mcf, schema, schema_local, output))
+
+    if workers > 1 and len(jobs) > 1:
+        pool = Pool(workers)
+        try:
+            chunksize = max(1, len(jobs) // (workers * 8))
+            for result in pool.imap_unordered(_render_job, jobs, chunksize):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            with profiler.record(job[0]):
+                result = _render_job(job)
+            yield result
+
+
 @click.command()
 @click.pass_context
-@click.option('--mcf',
+@click.option('--mcf', multiple=True,
               type=click.Path(exists=True, resolve_path=True),
-              help='Path to metadata control file (.yml)')
+              help='Path to metadata control file (.yml) or directory of '
+                   'MCF files (repeatable)')
+@click.option('--mcf-list', type=click.File('r', encoding='utf-8'),
+              help='File listing MCF paths, one per line (- for stdin)')
 @click.option('--output', type=click.File('w', encoding='utf-8'),
               help='Name of output file')
+@click.option('--output-dir',
+              type=click.Path(file_okay=False, resolve_path=True),
+              help='Output directory for batch mode')
+@click.option('--output-pattern',
+              help='Output filepath pattern for batch mode, with {name} '
+                   'and {schema} fields (default: {name}.xml)')
 @click.option('--schema',
               type=click.Choice(get_supported_schemas()),
               help='Metadata schema')
@@ -285,13 +673,56 @@ def get_abspath(mcf, filepath):
               type=click.Path(exists=True, resolve_path=True,
                               dir_okay=True, file_okay=False),
               help='Locally defined metadata schema')
-def generate_metadata(ctx, mcf, schema, schema_local, output):
-    if mcf is None or (schema is None and schema_local is None):
+@click.option('--workers', type=int, default=cpu_count(), show_default=True,
+              help='Number of worker processes for batch mode')
+@click.option('--profile', 'profile_dir',
+              type=click.Path(file_okay=False, resolve_path=True),
+              help='Write profile of rendering to directory (implies '
+                   '--workers 1)')
+def generate_metadata(ctx, mcf, mcf_list, schema, schema_local, output,
+                      output_dir, output_pattern, workers, profile_dir):
+    mcfs = list(find_mcfs(mcf))
+    if mcf_list is not None:
+        mcfs.extend(line.strip() for line in mcf_list if line.strip())
+
+    if not mcfs or (schema is None and schema_local is None):
         raise click.UsageError('Missing arguments')
-    else:
-        content = render_template(mcf, schema=schema,
-                                  schema_local=schema_local)
+
+    if output_dir is None and output_pattern is None:
+        if len(mcfs) > 1:
+            raise click.UsageError(
+                '--output-dir or --output-pattern required for batch mode')
+
+        with Profiler(profile_dir) as profiler:
+            with profiler.stage('render'), profiler.record(mcfs[0]):
+                content = render_template(mcfs[0], schema=schema,
+                                          schema_local=schema_local)
         if output is None:
             click.echo_via_pager(content)
         else:
             output.write(content)
+        return
+
+    output_pattern = os.path.join(output_dir or '',
+                                  output_pattern or '{name}.xml')
+
+    count = 0
+    failures = []
+
+    with Profiler(profile_dir) as profiler, profiler.stage('render'):
+        for mcf_path, output_path, error in render_batch(
+                mcfs, output_pattern, schema, schema_local, workers,
+                profiler):
+            if error is None:
+                count += 1
+                LOGGER.info('{} -> {}'.format(mcf_path, output_path))
+            else:
+                failures.append((mcf_path, error))
+
+    click.echo('Generated {}, failed {}'.format(count, len(failures)))
+
+    for mcf_path, error in sorted(failures):
+        click.echo('FAILED {}: {}'.format(mcf_path, error), err=True)
+
+    if failures:
+        ctx.exit(1)
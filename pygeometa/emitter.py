@@ -0,0 +1,436 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+from io import BytesIO
+import logging
+import os
+from xml.etree import ElementTree as etree
+
+from six import string_types
+
+from pygeometa.core import (RGA_ALIAS_PREFIX, get_rga_strings,
+                            normalize_datestring, read_mcf)
+
+LOGGER = logging.getLogger(__name__)
+
+NAMESPACES = {
+    'gco': 'http://www.isotc211.org/2005/gco',
+    'gmd': 'http://www.isotc211.org/2005/gmd',
+    'gml': 'http://www.opengis.net/gml',
+    'gmx': 'http://www.isotc211.org/2005/gmx',
+    'xlink': 'http://www.w3.org/1999/xlink',
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
+}
+
+for _prefix, _uri in NAMESPACES.items():
+    etree.register_namespace(_prefix, _uri)
+
+SCHEMA_LOCATION = ('http://www.isotc211.org/2005/gmd '
+                   'http://schemas.opengis.net/iso/19139/20060504/gmd/gmd.xsd '
+                   'http://www.isotc211.org/2005/gmx '
+                   'http://schemas.opengis.net/iso/19139/20060504/gmx/gmx.xsd')
+
+CODELISTS = ('http://standards.iso.org/ittf/PubliclyAvailableStandards/'
+             'ISO_19139_Schemas/resources/Codelist/')
+ML_CODELISTS = '{}ML_gmx Codelists.xml'.format(CODELISTS)
+GMX_CODELISTS = '{}ML_gmxCodelists.xml'.format(CODELISTS)
+MAINTENANCE_CODELIST = ('http://standards.iso.org/ittf/'
+                        'PubliclyAvailableStandards       ISO_19139_Schemas/'
+                        'resources/Codelist/ML_gmxCodelists.xml'
+                        '#MD_MaintenanceFreque ncyCode')
+
+INSPIRE_REGULATION = (
+    'Commission Regulation (EU) No 1089/2010 of 23 November 2010 '
+    'implementing Directive 2007/2/EC of the European Parliament and of '
+    'the Council as regards interoperability of spatial data sets and '
+    'services')
+
+TIME_PERIOD_ID = 'ID_05d1d6c2-111f-4dc5-b51d-551a93cfdbbc'
+
+
+def get_supported_schemas():
+    """returns a list of schemas supported by the emitter"""
+
+    return ['{}{}'.format(RGA_ALIAS_PREFIX, language)
+            for language in ('eng', 'srb_cyr', 'srb_lat')]
+
+
+def _qname(name):
+    if ':' not in name:  # no namespace
+        return name
+    prefix, local = name.split(':')
+    return '{{{}}}{}'.format(NAMESPACES[prefix], local)
+
+
+def _text(value):
+    """text of a value as rendered by the templates"""
+
+    return u'' if value is None else u'{}'.format(value).strip()
+
+
+def _is_list(value):
+    return (value is not None and not isinstance(value, string_types) and
+            hasattr(value, '__iter__'))
+
+
+def _item(value, index):
+    """loop.index0 lookup as done by the templates"""
+
+    try:
+        return value[index]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+class TreeBuilder(object):
+    """element tree construction helpers"""
+
+    def __init__(self, root):
+        self.root = etree.Element(_qname(root))
+
+    @staticmethod
+    def add(parent, path, text=None, **attributes):
+        """append a chain of elements given as a path, returns the leaf"""
+
+        element = parent
+        for name in path.split('/'):
+            element = etree.SubElement(element, _qname(name))
+        for key, value in attributes.items():
+            key = _qname(key.replace('_', ':', 1)) if '_' in key else key
+            element.set(key, value)
+        if text is not None:
+            element.text = _text(text)
+        return element
+
+    def charstring(self, parent, path, value):
+        return self.add(parent, '{}/gco:CharacterString'.format(path), value)
+
+    def date(self, parent, path, value):
+        """gco:Date or gco:DateTime depending on value length"""
+
+        value = '' if value is None else normalize_datestring(value)
+        if len(_text(value)) > 11:
+            return self.add(parent, '{}/gco:DateTime'.format(path), value)
+        return self.add(parent, '{}/gco:Date'.format(path), value)
+
+    def codelist(self, parent, path, codelist, value, text=None):
+        return self.add(parent, path, text, codeList=codelist,
+                        codeListValue=_text(value))
+
+
+def _email(builder, parent, value):
+    builder.charstring(
+        parent, 'gmd:contactInfo/gmd:CI_Contact/gmd:address/gmd:CI_Address/'
+        'gmd:electronicMailAddress', value)
+
+
+def _responsible_party(builder, parent, path, name, email, role,
+                       reference=None, **attributes):
+    """
+    CI_ResponsibleParty in a property element, or an xlink reference
+    (href and title) to a registry entry if given
+    """
+
+    if reference is not None:
+        return builder.add(parent, path, xlink_href=reference['href'],
+                           xlink_title=_text(reference['title']))
+
+    party = builder.add(parent, '{}/gmd:CI_ResponsibleParty'.format(path)
+                        if path else 'gmd:CI_ResponsibleParty', **attributes)
+    builder.charstring(party, 'gmd:organisationName', name)
+    _email(builder, party, email)
+    builder.codelist(party, 'gmd:role/gmd:CI_RoleCode',
+                     '{}#CI_RoleCode'.format(ML_CODELISTS), role)
+
+
+def _citation_date(builder, parent, value, datetype):
+    ci_date = builder.add(parent, 'gmd:date/gmd:CI_Date')
+    builder.date(ci_date, 'gmd:date', value)
+    builder.codelist(ci_date, 'gmd:dateType/gmd:CI_DateTypeCode',
+                     '{}#CI_DateTypeCode'.format(ML_CODELISTS), datetype)
+
+
+def _publication_date(builder, parent, value):
+    ci_date = builder.add(parent, 'gmd:date/gmd:CI_Date')
+    builder.add(ci_date, 'gmd:date/gco:Date', value)
+    builder.codelist(ci_date, 'gmd:dateType/gmd:CI_DateTypeCode',
+                     '{}#CI_DateTypeCode'.format(GMX_CODELISTS),
+                     'publication', 'publication')
+
+
+def _resolution(builder, parent, value, path, **attributes):
+    if _is_list(value):
+        values = value
+    elif _text(value):
+        values = [value]
+    else:
+        values = []
+
+    for value in values:
+        builder.add(parent, 'gmd:spatialResolution/gmd:MD_Resolution/'
+                    '{}'.format(path), value, **attributes)
+
+
+def build_tree(mcf, schema='dts_template_srb_lat'):
+    """
+    returns ISO 19139 element tree of an MCF, with the same field
+    semantics as the RGA dataset templates
+    """
+
+    name = os.path.basename(os.path.normpath(schema))
+    strings = get_rga_strings(name.replace(RGA_ALIAS_PREFIX, '', 1))
+    mcf = read_mcf(mcf)
+    md = mcf['metadata']
+    contacts = mcf.get('contacts') or {}
+    builder = TreeBuilder('gmd:MD_Metadata')
+    add = builder.add
+    root = builder.root
+    root.set(_qname('xsi:schemaLocation'), SCHEMA_LOCATION)
+
+    builder.charstring(root, 'gmd:fileIdentifier', md.get('identifier'))
+    add(root, 'gmd:language/gmd:LanguageCode', strings['language_name'],
+        codeList='http://www.loc.gov/standards/iso639-2',
+        codeListValue=strings['language_code'])
+    add(root, 'gmd:characterSet/gmd:MD_CharacterSetCode',
+        codeSpace='ISOTC211/19115', codeListValue='MD_CharacterSetCode_utf8',
+        codeList='{}#MD_CharacterSetCode'.format(ML_CODELISTS))
+    builder.codelist(root, 'gmd:hierarchyLevel/gmd:MD_ScopeCode',
+                     '{}#MD_ScopeCode'.format(GMX_CODELISTS), 'dataset',
+                     'dataset')
+    _responsible_party(builder, root, 'gmd:contact',
+                       md.get('organization_name'),
+                       md.get('organisation_emailAddress'), 'pointOfContact',
+                       contacts.get('contact'))
+    builder.date(root, 'gmd:dateStamp', md.get('datestamp'))
+    builder.charstring(root, 'gmd:metadataStandardName', 'ISO19115')
+    builder.charstring(root, 'gmd:metadataStandardVersion',
+                       '2003/Cor.1:2006')
+    builder.charstring(root, 'gmd:referenceSystemInfo/gmd:MD_ReferenceSystem/'
+                       'gmd:referenceSystemIdentifier/gmd:RS_Identifier/'
+                       'gmd:code',
+                       'http://www.opengis.net/def/crs/EPSG/0/3046')
+
+    # identificationInfo
+    ident = add(root, 'gmd:identificationInfo/gmd:MD_DataIdentification')
+    citation = add(ident, 'gmd:citation/gmd:CI_Citation')
+    builder.charstring(citation, 'gmd:title', md.get('title'))
+    if isinstance(md.get('dateTypeCode'), string_types):
+        _citation_date(builder, citation, md.get('publish_date'),
+                       md.get('dateTypeCode'))
+    else:
+        for i, date in enumerate(md.get('publish_date') or []):
+            _citation_date(builder, citation, date,
+                           _item(md.get('dateTypeCode'), i))
+    identifier = add(citation, 'gmd:identifier/gmd:RS_Identifier')
+    builder.charstring(identifier, 'gmd:code', md.get('resourceIdentifier'))
+    builder.charstring(identifier, 'gmd:codeSpace',
+                       md.get('resourceIdentifierNamespace'))
+
+    builder.charstring(ident, 'gmd:abstract', md.get('abstract'))
+
+    if contacts:
+        for reference in contacts['pointOfContact']:
+            _responsible_party(builder, ident, 'gmd:pointOfContact', None,
+                               None, None, reference)
+    elif isinstance(md.get('resp_organisation_role'), string_types):
+        _responsible_party(builder, ident, 'gmd:pointOfContact',
+                           md.get('resp_organisationName'),
+                           md.get('resp_organisation_emailAddress'),
+                           md.get('resp_organisation_role'))
+    else:
+        for i, _ in enumerate(md.get('resp_organisationName') or []):
+            _responsible_party(
+                builder, ident, 'gmd:pointOfContact',
+                _item(md.get('resp_organisationName'), i),
+                _item(md.get('resp_organisation_emailAddress'), i),
+                _item(md.get('resp_organisation_role'), i))
+
+    maintenance = add(ident, 'gmd:resourceMaintenance/'
+                      'gmd:MD_MaintenanceInformation')
+    add(maintenance, 'gmd:maintenanceAndUpdateFrequency/'
+        'gmd:MD_MaintenanceFrequencyCode', codeList=MAINTENANCE_CODELIST,
+        codeListValue='asNeeded')
+    builder.charstring(maintenance, 'gmd:maintenanceNote',
+                       strings['maintenance_note'])
+
+    # INSPIRE theme, then free keywords
+    keywords = md.get('keywords') or []
+    inspire = add(ident, 'gmd:descriptiveKeywords/gmd:MD_Keywords')
+    builder.charstring(inspire, 'gmd:keyword', _item(keywords, 0))
+    thesaurus = add(inspire, 'gmd:thesaurusName/gmd:CI_Citation')
+    builder.charstring(thesaurus, 'gmd:title',
+                       'GEMET - INSPIRE themes, version 1.0')
+    _publication_date(builder, thesaurus, '2008-06-01')
+    free = add(ident, 'gmd:descriptiveKeywords/gmd:MD_Keywords')
+    for keyword in keywords:
+        builder.charstring(free, 'gmd:keyword', keyword)
+
+    # constraints
+    builder.charstring(ident, 'gmd:resourceConstraints/gmd:MD_Constraints/'
+                       'gmd:useLimitation', md.get('useLimitation'))
+    if isinstance(md.get('accessConstraints'), string_types):
+        access = [(md.get('accessConstraints'), md.get('otherConstraints'))]
+    else:
+        access = [(value, _item(md.get('otherConstraints'), i))
+                  for i, value in enumerate(md.get('accessConstraints') or [])]
+    for value, other in access:
+        legal = add(ident, 'gmd:resourceConstraints/gmd:MD_LegalConstraints')
+        builder.codelist(legal, 'gmd:accessConstraints/gmd:MD_RestrictionCode',
+                         '{}#MD_RestrictionCode'.format(GMX_CODELISTS),
+                         value, value)
+        builder.charstring(legal, 'gmd:otherConstraints', other)
+
+    _resolution(builder, ident, md.get('denominator'),
+                'gmd:equivalentScale/gmd:MD_RepresentativeFraction/'
+                'gmd:denominator/gco:Integer')
+    _resolution(builder, ident, md.get('distance'),
+                'gmd:distance/gco:Distance', uom='metres')
+
+    add(ident, 'gmd:language/gmd:LanguageCode', 'Serbian',
+        codeList='http://www.loc.gov/standards/iso639-2/',
+        codeListValue='srp')
+    for category in md.get('inspireCategory') or []:
+        add(ident, 'gmd:topicCategory/gmd:MD_TopicCategoryCode', category)
+
+    bbox = add(ident, 'gmd:extent/gmd:EX_Extent/gmd:geographicElement/'
+               'gmd:EX_GeographicBoundingBox')
+    for element, key in (('westBoundLongitude', 'bounding_box_w'),
+                         ('eastBoundLongitude', 'bounding_box_e'),
+                         ('southBoundLatitude', 'bounding_box_s'),
+                         ('northBoundLatitude', 'bounding_box_n')):
+        add(bbox, 'gmd:{}/gco:Decimal'.format(element), md.get(key))
+
+    period = add(ident, 'gmd:extent/gmd:EX_Extent/gmd:temporalElement/'
+                 'gmd:EX_TemporalExtent/gmd:extent/gml:TimePeriod',
+                 gml_id=TIME_PERIOD_ID, xsi_type='gml:TimePeriodType')
+    add(period, 'gml:beginPosition', md.get('t_extnt_beginPosition'))
+    add(period, 'gml:endPosition', md.get('t_extnt_endPosition'))
+
+    # distributionInfo
+    distribution = add(root, 'gmd:distributionInfo/gmd:MD_Distribution')
+    formats = md.get('dist_format')
+    if isinstance(formats, string_types):
+        formats = [formats]
+    for format_ in formats or []:
+        format_element = add(distribution, 'gmd:distributionFormat/'
+                             'gmd:MD_Format')
+        builder.charstring(format_element, 'gmd:name', format_)
+        builder.charstring(format_element, 'gmd:version', 'unknown')
+    add(distribution, 'gmd:transferOptions/gmd:MD_DigitalTransferOptions/'
+        'gmd:onLine/gmd:CI_OnlineResource/gmd:linkage/gmd:URL',
+        md.get('linkage'))
+
+    # dataQualityInfo
+    quality = add(root, 'gmd:dataQualityInfo/gmd:DQ_DataQuality')
+    add(quality, 'gmd:scope/gmd:DQ_Scope/gmd:level/gmd:MD_ScopeCode',
+        'dataset', codeListValue='dataset',
+        codeList='{}#MD_ScopeCode'.format(GMX_CODELISTS))
+    report = add(quality, 'gmd:report/gmd:DQ_DomainConsistency',
+                 xsi_type='gmd:DQ_DomainConsistency_Type')
+    measure = add(report, 'gmd:measureIdentification/gmd:RS_Identifier')
+    builder.charstring(measure, 'gmd:code', 'Conformity_001')
+    builder.charstring(measure, 'gmd:codeSpace', 'INSPIRE')
+    result = add(report, 'gmd:result/gmd:DQ_ConformanceResult',
+                 xsi_type='gmd:DQ_ConformanceResult_Type')
+    specification = add(result, 'gmd:specification/gmd:CI_Citation')
+    builder.charstring(specification, 'gmd:title', INSPIRE_REGULATION)
+    _publication_date(builder, specification, '2010-12-08')
+    builder.charstring(result, 'gmd:explanation',
+                       strings['conformity_explanation'])
+    add(result, 'gmd:pass/gco:Boolean', 'false')
+    builder.charstring(quality, 'gmd:lineage/gmd:LI_Lineage/gmd:statement',
+                       md.get('lineage'))
+
+    return root
+
+
+def indent(element, level=0, space='  '):
+    """indent an element tree in place"""
+
+    padding = '\n' + level * space
+    if len(element):
+        if not element.text or not element.text.strip():
+            element.text = padding + space
+        for child in element:
+            indent(child, level + 1, space)
+        if not child.tail or not child.tail.strip():
+            child.tail = padding
+    if level and (not element.tail or not element.tail.strip()):
+        element.tail = padding
+
+
+def render_tree(mcf, schema='dts_template_srb_lat'):
+    """
+    convenience function to render ISO 19139 XML of an RGA dataset
+    record without a template, serialised once and indented
+    """
+
+    return serialize(build_tree(mcf, schema)).decode('utf-8')
+
+
+def build_registry(entries):
+    """
+    returns element tree of a contact registry: a contacts element of
+    CI_ResponsibleParty elements, identified by id and uuid, of (id,
+    name, email, role) entries
+    """
+
+    builder = TreeBuilder('contacts')
+    for id_, name, email, role in entries:
+        _responsible_party(builder, builder.root, None, name, email, role,
+                           id=id_, uuid=id_)
+    return builder.root
+
+
+def serialize(root):
+    """returns UTF-8 encoded XML of an element tree, indented"""
+
+    indent(root)
+    LOGGER.debug('Serialising element tree')
+    buffer_ = BytesIO()
+    etree.ElementTree(root).write(buffer_, encoding='UTF-8',
+                                  xml_declaration=True)
+    return buffer_.getvalue()
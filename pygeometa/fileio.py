@@ -0,0 +1,537 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+import bz2
+from contextlib import contextmanager
+import ctypes
+import ctypes.util
+from fnmatch import fnmatch
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+from xml.etree import ElementTree as etree
+import zipfile
+
+from six import string_types
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+try:
+    from os import scandir
+except ImportError:  # Python 2
+    scandir = None
+
+LOGGER = logging.getLogger(__name__)
+
+# inputs of at least this size are memory-mapped instead of read
+MMAP_THRESHOLD = 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# separates a zip archive path from the name of a member
+ZIP_SEPARATOR = '!'
+
+# output layouts: flat (directory/name) or hash (directory/ab/cd/name,
+# by a digest of name, bounding the size of each directory)
+LAYOUTS = ('flat', 'hash')
+
+# durability levels of AtomicWriter: none (atomic rename only), batch
+# (fsync groups of files before renaming them) and file (fsync each file)
+DURABILITY_LEVELS = ('none', 'batch', 'file')
+
+# compressed file suffixes and functions opening them in binary mode
+COMPRESSIONS = {
+    '.gz': lambda path, mode, level: gzip.open(
+        path, mode, 9 if level is None else level),
+    '.bz2': lambda path, mode, level: bz2.BZ2File(
+        path, mode, compresslevel=9 if level is None else level)
+}
+
+if lzma is not None:
+    COMPRESSIONS['.xz'] = lambda path, mode, level: lzma.open(
+        path, mode, preset=level if 'w' in mode else None)
+
+
+def get_compression(path):
+    """returns compression suffix of a path, or None"""
+
+    suffix = os.path.splitext(path)[1].lower()
+    return suffix if suffix in COMPRESSIONS else None
+
+
+def _scan(directory):
+    """yields (name, path, is_file, is_dir) of entries, unsorted"""
+
+    if scandir is None:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            yield name, path, os.path.isfile(path), os.path.isdir(path)
+        return
+
+    for entry in scandir(directory):
+        yield (entry.name, entry.path, entry.is_file(),
+               entry.is_dir(follow_symlinks=False))
+
+
+def _matches(relpath, include, exclude):
+    """returns True if relpath matches include (if any), not exclude"""
+
+    if include and not any(fnmatch(relpath, p) for p in include):
+        return False
+    return not any(fnmatch(relpath, p) for p in exclude or [])
+
+
+def find_sources(directory, extension='.xml', recursive=False, include=None,
+                 exclude=None):
+    """
+    yields input sources of a directory as they are found: plain or
+    compressed (.gz, .bz2, .xz) files, and members of zip archives
+    named as archive!member
+
+    entries are enumerated in directory order, without listing or
+    sorting the directory first.  With recursive, subdirectories are
+    descended into (hidden entries are skipped).  include and exclude
+    are lists of shell patterns matched against the path of a source
+    relative to directory (e.g. 'lat/*', '*_SRP_*')
+    """
+
+    pending = [directory]
+
+    while pending:
+        current = pending.pop()
+        for name, path, is_file, is_dir in _scan(current):
+            if name.startswith('.'):
+                continue
+            if is_dir:
+                if recursive:
+                    pending.append(path)
+                continue
+            if not is_file:
+                continue
+            relpath = os.path.relpath(path, directory).replace(os.sep, '/')
+            if name.lower().endswith('.zip'):
+                with zipfile.ZipFile(path) as archive:
+                    for member in archive.namelist():
+                        source = '{}{}{}'.format(relpath, ZIP_SEPARATOR,
+                                                 member)
+                        if (member.lower().endswith(extension) and
+                                _matches(source, include, exclude)):
+                            yield '{}{}{}'.format(path, ZIP_SEPARATOR,
+                                                  member)
+            else:
+                compression = get_compression(name)
+                if compression is not None:
+                    name = name[:-len(compression)]
+                if (name.lower().endswith(extension) and
+                        _matches(relpath, include, exclude)):
+                    yield path
+
+
+def layout_path(directory, name, layout='flat'):
+    """
+    returns path of output file name in directory: directory/name, or
+    directory/ab/cd/name with the 'hash' layout
+    """
+
+    if layout not in LAYOUTS:
+        raise ValueError('Unsupported layout: {}'.format(layout))
+
+    if layout == 'hash':
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        directory = os.path.join(directory, digest[:2], digest[2:4])
+    return os.path.join(directory, name)
+
+
+def source_name(source):
+    """returns record name of a source: its filename without suffixes"""
+
+    name = os.path.basename(source.split(ZIP_SEPARATOR)[-1])
+    compression = get_compression(name)
+    if compression is not None:
+        name = name[:-len(compression)]
+    return os.path.splitext(name)[0]
+
+
+def split_source(source):
+    """returns tuple of file path and zip member (or None) of a source"""
+
+    path, separator, member = source.partition(ZIP_SEPARATOR)
+    if separator and path.lower().endswith('.zip'):
+        return path, member
+    return source, None
+
+
+@contextmanager
+def open_source(source):
+    """open a source for reading as a binary stream, decompressing"""
+
+    path, member = split_source(source)
+
+    if member is not None:
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(member) as fh:
+                yield fh
+    elif get_compression(path) is not None:
+        with COMPRESSIONS[get_compression(path)](path, 'rb', None) as fh:
+            yield fh
+    else:
+        with open(path, 'rb') as fh:
+            yield fh
+
+
+def move_source(source, directory):
+    """
+    move a source into directory; zip members are extracted there and
+    the archive is left as is
+    """
+
+    path, member = split_source(source)
+
+    if member is None:
+        os.rename(path, os.path.join(directory, os.path.basename(path)))
+    else:
+        with open_source(source) as fh:
+            with open(os.path.join(directory, os.path.basename(member)),
+                      'wb') as out:
+                shutil.copyfileobj(fh, out)
+
+
+def output_path(path, compression=None):
+    """returns path with the suffix of compression, if any"""
+
+    if compression is None:
+        return path
+    if not compression.startswith('.'):
+        compression = '.{}'.format(compression)
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unsupported compression: {}'.format(compression))
+    return '{}{}'.format(path, compression)
+
+
+def open_output(path, compression=None, level=None):
+    """
+    open path (plus compression suffix) for writing in binary mode,
+    compressed at level (1-9, default 9) if compression is given
+    """
+
+    path = output_path(path, compression)
+    compression = get_compression(path) if compression else None
+
+    if compression is None:
+        return open(path, 'wb')
+    return COMPRESSIONS[compression](path, 'wb', level)
+
+
+def read_text(path, encoding='utf-8'):
+    """returns content of a plain or compressed text file"""
+
+    with open_source(path) as fh:
+        return fh.read().decode(encoding)
+
+
+def strip_namespaces(element):
+    """remove namespaces of element tags and attributes in place"""
+
+    for child in element.iter():
+        if not isinstance(child.tag, string_types):  # comments and PIs
+            continue
+        if child.tag[0] == '{':
+            child.tag = child.tag.split('}', 1)[1]
+        for key in [k for k in child.attrib if k[0] == '{']:
+            child.attrib[key.split('}', 1)[1]] = child.attrib.pop(key)
+
+    return element
+
+
+def parse_xml(path, mmap_threshold=MMAP_THRESHOLD):
+    """
+    parse an XML source as bytes into an ElementTree without namespaces
+
+    the parser decodes the content as given by the document's XML
+    declaration (UTF-8 by default).  Plain files of at least
+    mmap_threshold bytes are memory-mapped and fed to the parser in
+    chunks without copying; compressed files and zip members are
+    streamed
+    """
+
+    parser = etree.XMLParser()
+
+    if split_source(path)[1] is not None or get_compression(path):
+        with open_source(path) as fh:
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+                parser.feed(chunk)
+        return etree.ElementTree(strip_namespaces(parser.close()))
+
+    with open(path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size and size >= mmap_threshold:
+            LOGGER.debug('Memory-mapping {} ({} bytes)'.format(path, size))
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, CHUNK_SIZE):
+                    parser.feed(view[offset:offset + CHUNK_SIZE])
+            finally:
+                view.release()
+                mapped.close()
+        else:
+            parser.feed(fh.read())
+
+    root = parser.close()
+    return etree.ElementTree(strip_namespaces(root))
+
+
+def _fsync(fh):
+    """flush a file object and sync its data to disk"""
+
+    fh.flush()
+    getattr(os, 'fdatasync', os.fsync)(fh.fileno())
+
+
+def _fsync_directory(directory):
+    """sync a directory entry (renames in it) to disk, where supported"""
+
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:  # Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _load_syncfs():
+    """returns libc syncfs(fd) (Linux), or None"""
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc.syncfs
+    except (AttributeError, OSError, TypeError):
+        return None
+
+
+_syncfs = _load_syncfs()
+
+
+def _sync_filesystems(paths):
+    """
+    durability barrier: flush all written data of the filesystems
+    holding paths to disk, with one syncfs() per filesystem (Linux) or
+    one os.sync(); returns the number of sync calls, 0 if unsupported
+    """
+
+    if _syncfs is not None:
+        devices = {}
+        for path in paths:
+            directory = os.path.dirname(path) or '.'
+            devices.setdefault(os.stat(directory).st_dev, directory)
+        for directory in devices.values():
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                if _syncfs(fd) != 0:
+                    raise OSError(ctypes.get_errno(), 'syncfs failed')
+            finally:
+                os.close(fd)
+        return len(devices)
+
+    if hasattr(os, 'sync'):
+        os.sync()
+        return 1
+
+    return 0
+
+
+class AtomicWriter(object):
+    """
+    writes output files atomically: each file is written to a temporary
+    file in the same directory and renamed over its path once complete,
+    so readers never see truncated content
+
+    durability is one of DURABILITY_LEVELS.  With 'batch' (group
+    commit), completed files are closed unsynced until group_size of
+    them are pending (or commit() is called); then one filesystem sync
+    (syncfs, or os.sync) makes the whole group durable before it is
+    renamed and its directories synced, trading one sync per file for
+    one per group.  Files become visible at commit.  'file' syncs every
+    file before its rename; 'none' only renames.  syncs counts data
+    sync calls
+    """
+
+    def __init__(self, durability='batch', group_size=256, compression=None,
+                 level=None):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError('Unsupported durability: {}'.format(durability))
+        self.durability = durability
+        self.group_size = max(1, group_size)
+        self.compression = compression
+        self.level = level
+        self.pending = []  # (temporary path, path)
+        self.commits = 0
+        self.syncs = 0
+        self.files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+
+    def path(self, path):
+        """returns path of an output as written (with compression suffix)"""
+
+        return output_path(path, self.compression)
+
+    @contextmanager
+    def open(self, path):
+        """
+        open path (plus compression suffix) for writing in binary mode;
+        the file is committed when the block exits without error and
+        discarded otherwise
+        """
+
+        path = self.path(path)
+        directory, name = os.path.split(path)
+        tmp_path = os.path.join(directory, '.{}.tmp-{}'.format(
+                                name, os.getpid()))
+        try:
+            raw = open(tmp_path, 'wb')
+        except (IOError, OSError):
+            if not directory or os.path.isdir(directory):
+                raise
+            self._makedirs(directory)
+            raw = open(tmp_path, 'wb')
+
+        try:
+            compression = get_compression(path) if self.compression else None
+            if compression is None:
+                yield raw
+            else:
+                if compression == '.gz':  # header records the final name
+                    fh = gzip.GzipFile(path, 'wb', 9 if self.level is None
+                                       else self.level, raw)
+                else:
+                    fh = COMPRESSIONS[compression](raw, 'wb', self.level)
+                with fh:
+                    yield fh
+        except BaseException:
+            raw.close()
+            os.remove(tmp_path)
+            raise
+
+        self._complete(raw, tmp_path, path)
+
+    def _makedirs(self, directory):
+        """create directory and missing parents (e.g. of a hash layout)"""
+
+        created = []
+        parent = directory
+        while parent and not os.path.isdir(parent):
+            created.append(parent)
+            parent = os.path.dirname(parent)
+        try:
+            os.makedirs(directory)
+        except OSError:  # created concurrently
+            if not os.path.isdir(directory):
+                raise
+        if self.durability != 'none':  # new directory entries
+            for path in created:
+                _fsync_directory(os.path.dirname(path))
+
+    def _complete(self, raw, tmp_path, path):
+        if self.durability == 'batch':
+            raw.close()
+            self.pending.append((tmp_path, path))
+            if len(self.pending) >= self.group_size:
+                self.commit()
+            return
+
+        if self.durability == 'file':
+            _fsync(raw)
+            self.syncs += 1
+        raw.close()
+        os.rename(tmp_path, path)
+        if self.durability == 'file':
+            _fsync_directory(os.path.dirname(path))
+        self.files += 1
+
+    def commit(self):
+        """sync, rename and publish all pending files"""
+
+        if not self.pending:
+            return
+
+        LOGGER.debug('Committing {} files'.format(len(self.pending)))
+        pending, self.pending = self.pending, []
+
+        syncs = _sync_filesystems([p for _, p in pending])
+        if not syncs:  # no filesystem sync: fall back to each file
+            for tmp_path, _ in pending:
+                with open(tmp_path, 'rb+') as fh:
+                    _fsync(fh)
+            syncs = len(pending)
+        self.syncs += syncs
+        for tmp_path, path in pending:
+            os.rename(tmp_path, path)
+        for directory in set(os.path.dirname(p) for _, p in pending):
+            _fsync_directory(directory)
+
+        self.commits += 1
+        self.files += len(pending)
+
+    def discard(self):
+        """remove all pending (uncommitted) files"""
+
+        pending, self.pending = self.pending, []
+        for tmp_path, _ in pending:
+            os.remove(tmp_path)
@@ -0,0 +1,305 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import codecs
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from six.moves import http_client, queue
+from six.moves.urllib.parse import urljoin, urlsplit
+
+LOGGER = logging.getLogger(__name__)
+
+USER_AGENT = 'pygeometa-linkcheck'
+
+MAX_REDIRECTS = 5
+
+# statuses of servers that do not allow HEAD, retried with GET
+HEAD_NOT_ALLOWED = (403, 405, 501)
+
+CONNECTIONS = {
+    'http': http_client.HTTPConnection,
+    'https': http_client.HTTPSConnection
+}
+
+
+def _host_key(url):
+    """returns (scheme, host:port) of a URL, the unit of pooling"""
+
+    parts = urlsplit(url)
+    return parts.scheme.lower(), parts.netloc.lower()
+
+
+def _interleave(urls):
+    """order URLs round-robin by host, spreading load across hosts"""
+
+    by_host = {}
+    for url in sorted(urls):
+        by_host.setdefault(_host_key(url), []).append(url)
+
+    ordered = []
+    queues = [by_host[key] for key in sorted(by_host)]
+    while queues:
+        ordered.extend(q.pop(0) for q in queues)
+        queues = [q for q in queues if q]
+    return ordered
+
+
+class LinkCache(object):
+    """persistent JSON cache of link check results with a TTL"""
+
+    def __init__(self, path=None, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self.results = {}
+
+        if path is not None and os.path.exists(path):
+            with codecs.open(path, encoding='utf-8') as fh:
+                self.results = json.load(fh)
+
+    def get(self, url, now=None):
+        """returns cached result of url unless older than the TTL"""
+
+        result = self.results.get(url)
+        now = time.time() if now is None else now
+        if result is None or now - result['checked'] > self.ttl:
+            return None
+        return result
+
+    def put(self, url, result):
+        self.results[url] = result
+
+    def save(self):
+        """write cache without expired entries"""
+
+        if self.path is None:
+            return
+
+        now = time.time()
+        results = dict((url, r) for url, r in self.results.items()
+                       if now - r['checked'] <= self.ttl)
+        tmp_path = '{}.tmp'.format(self.path)
+        with codecs.open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, ensure_ascii=False, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+class LinkChecker(object):
+    """
+    checks URLs concurrently with HEAD requests (GET where HEAD is not
+    allowed), following redirects
+
+    connections are kept alive and reused per host, at most per_host
+    requests run against one host at a time, and results are cached
+    for ttl seconds in an optional JSON file so reruns skip recently
+    checked URLs
+    """
+
+    def __init__(self, cache_path=None, ttl=86400, workers=16, per_host=2,
+                 timeout=10):
+        self.cache = LinkCache(cache_path, ttl)
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._slots = {}  # host key: semaphore
+        self._idle = {}  # host key: idle connections
+        self.requests = 0
+        self.cached = 0
+
+    def check(self, urls):
+        """
+        returns dict of URL to result dict for distinct URLs: ok (None
+        if the scheme is not checked), status (0 if unreachable), error,
+        url of the final response and checked time
+        """
+
+        urls = set(u.strip() for u in urls if u and u.strip())
+        results = {}
+        pending = []
+
+        for url in urls:
+            result = self.cache.get(url)
+            if result is not None:
+                results[url] = result
+                self.cached += 1
+            else:
+                pending.append(url)
+
+        jobs = queue.Queue()
+        for url in _interleave(pending):
+            jobs.put(url)
+
+        def work():
+            while True:
+                try:
+                    url = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                result = self._check(url)
+                with self._lock:
+                    results[url] = result
+                    if result['status'] is not None:
+                        self.cache.put(url, result)
+
+        threads = [threading.Thread(target=work)
+                   for _ in range(min(self.workers, len(pending)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.close()
+        self.cache.save()
+        return results
+
+    def _check(self, url):
+        result = {'ok': False, 'status': None, 'error': None, 'url': url,
+                  'checked': time.time()}
+        target = url
+
+        scheme, host = _host_key(url)
+        if not scheme or not host:
+            result['error'] = 'invalid URL (no scheme or host)'
+            return result
+        if scheme not in CONNECTIONS:
+            result.update(ok=None, error='unchecked scheme: {}'.format(
+                scheme))
+            return result
+
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                status, location = self._request(target, 'HEAD')
+                if status in HEAD_NOT_ALLOWED:
+                    status, location = self._request(target, 'GET')
+                if status in (301, 302, 303, 307, 308) and location:
+                    target = urljoin(target, location)
+                    continue
+                break
+            else:
+                raise IOError('too many redirects')
+            result.update(status=status, ok=200 <= status < 400, url=target)
+        except (ValueError, IOError, OSError, socket.error,
+                http_client.HTTPException) as err:
+            # unreachable: cached as broken, with status 0
+            result.update(status=0, error='{}: {}'.format(
+                type(err).__name__, err))
+
+        return result
+
+    def _request(self, url, method):
+        """returns (status, Location header) of a request to url"""
+
+        key = _host_key(url)
+        if key[0] not in CONNECTIONS or not key[1]:
+            raise ValueError('unsupported URL: {}'.format(url))
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '{}?{}'.format(path, parts.query)
+
+        with self._lock:
+            slot = self._slots.setdefault(
+                key, threading.BoundedSemaphore(self.per_host))
+
+        with slot:
+            connection = self._idle_connection(key)
+            if connection is not None:
+                try:
+                    return self._send(key, connection, method, path)
+                except (IOError, OSError, socket.error,
+                        http_client.HTTPException):
+                    LOGGER.debug('Reconnecting to {}'.format(key[1]))
+            connection = CONNECTIONS[key[0]](key[1], timeout=self.timeout)
+            return self._send(key, connection, method, path)
+
+    def _send(self, key, connection, method, path):
+        try:
+            connection.request(method, path, headers={
+                'User-Agent': USER_AGENT, 'Connection': 'keep-alive'})
+            response = connection.getresponse()
+            if method == 'GET':  # status is enough, don't download
+                response.close()
+                connection.close()
+            else:
+                response.read()
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._release(key, connection)
+        except Exception:
+            connection.close()
+            raise
+
+        with self._lock:
+            self.requests += 1
+        return response.status, response.getheader('Location')
+
+    def _idle_connection(self, key):
+        """returns an idle kept-alive connection to a host, or None"""
+
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _release(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def close(self):
+        """close idle connections"""
+
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
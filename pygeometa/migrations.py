@@ -44,7 +44,10 @@
 # =================================================================
 
 import codecs
+import glob
 import logging
+from multiprocessing import Pool, cpu_count
+import os
 
 import click
 from six.moves.configparser import SafeConfigParser as ConfigParser
@@ -125,19 +128,165 @@ def configparser2yaml(cpfile):
     return yaml.safe_dump(dict_, default_flow_style=False)
 
 
+def find_legacy_mcfs(paths, extension='.ini'):
+    """
+    yields (filepath, relative path) tuples of old MCF files from a
+    list of files, directories (walked recursively) and glob patterns
+    """
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(extension):
+                        filepath = os.path.join(root, name)
+                        yield filepath, os.path.relpath(filepath, path)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            for filepath in sorted(glob.glob(path)):
+                if os.path.isfile(filepath):
+                    yield filepath, os.path.basename(filepath)
+
+
+def is_migrated(cpfile, yamlfile):
+    """returns True if yamlfile exists and is not older than cpfile"""
+
+    try:
+        return os.path.getmtime(yamlfile) >= os.path.getmtime(cpfile)
+    except OSError:
+        return False
+
+
+def migrate_file(job):
+    """
+    migrates one old MCF file, writing output as it completes
+
+    returns tuple of (input, output, error message or None)
+    """
+
+    cpfile, yamlfile = job
+
+    try:
+        content = configparser2yaml(cpfile)
+        dirname = os.path.dirname(yamlfile)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:  # created by another worker
+                pass
+        tmpfile = '{}.tmp{}'.format(yamlfile, os.getpid())
+        with codecs.open(tmpfile, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        os.rename(tmpfile, yamlfile)
+    except Exception as err:
+        LOGGER.debug('Migration of {} failed'.format(cpfile), exc_info=True)
+        message = (str(err).splitlines() or [''])[0]
+        return cpfile, yamlfile, '{}: {}'.format(type(err).__name__, message)
+
+    return cpfile, yamlfile, None
+
+
+def migrate_batch(paths, output_dir, workers=1, force=False):
+    """
+    migrates old MCF files found in paths into output_dir
+
+    yields (input, output, status) tuples as files complete, where
+    status is 'migrated', 'skipped' or an error message.  Paths and
+    glob patterns matching no file, and inputs mapping to the output of
+    another input, fail without an output
+    """
+
+    jobs = []
+    outputs = {}  # output: input
+
+    for path in paths:
+        found = False
+        for cpfile, relpath in find_legacy_mcfs([path]):
+            found = True
+            yamlfile = os.path.join(output_dir, '{}.yml'.format(
+                                    os.path.splitext(relpath)[0]))
+            previous = outputs.get(yamlfile)
+            if previous is not None:
+                if os.path.realpath(previous) != os.path.realpath(cpfile):
+                    yield cpfile, None, 'Same output {} as {}'.format(
+                        yamlfile, previous)
+                continue  # else the same input, given twice
+            outputs[yamlfile] = cpfile
+            if not force and is_migrated(cpfile, yamlfile):
+                yield cpfile, yamlfile, 'skipped'
+            else:
+                jobs.append((cpfile, yamlfile))
+        if not found and not os.path.isdir(path):
+            yield path, None, 'No such file or matching files'
+
+    if workers > 1 and len(jobs) > 1:
+        pool = Pool(workers)
+        try:
+            chunksize = max(1, len(jobs) // (workers * 8))
+            results = pool.imap_unordered(migrate_file, jobs, chunksize)
+            for cpfile, yamlfile, error in results:
+                yield cpfile, yamlfile, error or 'migrated'
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            cpfile, yamlfile, error = migrate_file(job)
+            yield cpfile, yamlfile, error or 'migrated'
+
+
 @click.command()
-@click.option('--mcf',
-              type=click.Path(exists=True, resolve_path=True),
-              help='Path to old MCF (.ini) file format')
+@click.pass_context
+@click.option('--mcf', multiple=True,
+              help='Path to old MCF (.ini) file format, directory of '
+                   'old MCF files or glob pattern (repeatable)')
 @click.option('--output', type=click.File('w', encoding='utf-8'),
               help='Name of output file')
-def migrate(mcf, output):
-    if mcf is None:
+@click.option('--output-dir',
+              type=click.Path(file_okay=False, resolve_path=True),
+              help='Output directory for batch migration')
+@click.option('--workers', type=int, default=cpu_count(),
+              show_default=True, help='Number of worker processes')
+@click.option('--force', is_flag=True, default=False,
+              help='Migrate files even if output is up to date')
+def migrate(ctx, mcf, output, output_dir, workers, force):
+    if not mcf:
         raise click.UsageError('Missing arguments')
-    else:
-        content = configparser2yaml(mcf)
+
+    if output_dir is None:
+        if len(mcf) == 1 and not os.path.exists(mcf[0]) and not glob.glob(
+                mcf[0]):
+            raise click.BadParameter('No such file or matching files: '
+                                     '{}'.format(mcf[0]), param_hint='--mcf')
+        if len(mcf) > 1 or not os.path.isfile(mcf[0]):
+            raise click.UsageError('--output-dir required for batch mode')
+
+        content = configparser2yaml(mcf[0])
 
         if output is None:
             click.echo_via_pager(content)
         else:
             output.write(content)
+        return
+
+    counts = {'migrated': 0, 'skipped': 0}
+    failures = []
+
+    for cpfile, yamlfile, status in migrate_batch(mcf, output_dir,
+                                                  workers, force):
+        if status in counts:
+            counts[status] += 1
+            LOGGER.info('{} {} -> {}'.format(status, cpfile, yamlfile))
+        else:
+            failures.append((cpfile, status))
+
+    click.echo('Migrated {}, skipped {} (up to date), failed {}'.format(
+               counts['migrated'], counts['skipped'], len(failures)))
+
+    for cpfile, error in sorted(failures):
+        click.echo('FAILED {}: {}'.format(cpfile, error), err=True)
+
+    if failures:
+        ctx.exit(1)
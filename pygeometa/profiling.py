@@ -0,0 +1,350 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+from contextlib import contextmanager
+import cProfile
+import codecs
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+from six import StringIO
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+LOGGER = logging.getLogger(__name__)
+
+MACRO_RE = re.compile(r'{%-?\s*macro\s+(\w+)')
+
+
+def _short(filename):
+    """returns filename with its parent directory, e.g. iso19139/main.j2"""
+
+    dirname, basename = os.path.split(filename)
+    return '{}/{}'.format(os.path.basename(dirname), basename)
+
+
+def _template_sources():
+    """returns dict of filename: template of all cached templates"""
+
+    from pygeometa.core import _ENVIRONMENTS
+
+    templates = {}
+    for env in _ENVIRONMENTS.values():
+        if env.cache is None:
+            continue
+        for template in env.cache.values():
+            if template.filename is not None:
+                templates[os.path.realpath(template.filename)] = template
+    return templates
+
+
+class TemplateLines(object):
+    """maps frames of compiled Jinja2 templates to template lines"""
+
+    def __init__(self):
+        self.templates = _template_sources()
+        self.macros = {}
+
+    def lineno(self, filename, lineno):
+        """returns template line of a line of compiled template code"""
+
+        template = self.templates.get(os.path.realpath(filename))
+        if template is None:
+            return lineno
+        return template.get_corresponding_lineno(lineno)
+
+    def name(self, filename, lineno, funcname):
+        """returns macro or block name of compiled template function"""
+
+        if funcname.startswith('block_'):
+            return 'block {}'.format(funcname[6:])
+        if funcname != 'macro':
+            return funcname
+
+        if filename not in self.macros:
+            with codecs.open(filename, encoding='utf-8') as fh:
+                self.macros[filename] = [MACRO_RE.search(line)
+                                         for line in fh]
+        lines = self.macros[filename]
+        start = self.lineno(filename, lineno)
+        for match in reversed(lines[:start]):
+            if match is not None:
+                return 'macro {}'.format(match.group(1))
+        return funcname
+
+    def label(self, code, lineno):
+        """returns collapsed stack label of a frame"""
+
+        filename = code.co_filename
+        if filename.endswith('.j2'):
+            return '{} ({}:{})'.format(
+                self.name(filename, code.co_firstlineno, code.co_name),
+                _short(filename), self.lineno(filename, lineno))
+        return '{} ({}:{})'.format(code.co_name, os.path.basename(filename),
+                                   code.co_firstlineno)
+
+
+class StackSampler(threading.Thread):
+    """samples stacks of a thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval=0.001):
+        threading.Thread.__init__(self, name='pygeometa-profiler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler(object):
+    """
+    collects cProfile data per pipeline stage, peak memory per record
+    and stack samples, written to a directory on exit
+
+    a Profiler without a directory is disabled and costs nothing
+    """
+
+    def __init__(self, directory=None, interval=0.001):
+        self.directory = directory
+        self.interval = interval
+        self.stages = {}
+        self.records = []
+        self.sampler = None
+        self._stage = None
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def __enter__(self):
+        if self.enabled:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            if tracemalloc is not None:
+                tracemalloc.start()
+            self.sampler = StackSampler(threading.current_thread().ident,
+                                        self.interval)
+            self.sampler.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.enabled:
+            self.sampler.stop()
+            if tracemalloc is not None:
+                tracemalloc.stop()
+            self.write()
+
+    @contextmanager
+    def stage(self, name):
+        """profile a pipeline stage (stages do not nest)"""
+
+        if not self.enabled or self._stage is not None:
+            yield
+            return
+
+        profile, seconds = self.stages.setdefault(
+            name, [cProfile.Profile(), 0.0])
+        self._stage = name
+        start = time.time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.stages[name][1] = seconds + time.time() - start
+            self._stage = None
+
+    @contextmanager
+    def record(self, name):
+        """measure time and peak traced memory of one record"""
+
+        if not self.enabled:
+            yield
+            return
+
+        if tracemalloc is not None:
+            base = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            peak = 0
+            if tracemalloc is not None:
+                peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+            self.records.append((name, self._stage, seconds, peak))
+
+    def template_stats(self):
+        """returns list of (name, template, calls, seconds) by time"""
+
+        lines = TemplateLines()
+        totals = {}
+
+        for profile, _ in self.stages.values():
+            stats = pstats.Stats(profile).stats
+            for (filename, lineno, funcname), value in stats.items():
+                if not filename.endswith('.j2') or not (
+                        funcname in ('root', 'macro') or
+                        funcname.startswith('block_')):
+                    continue
+                name = lines.name(filename, lineno, funcname)
+                if name == 'root':
+                    name = 'template body'
+                key = (name, _short(filename))
+                calls, seconds = totals.get(key, (0, 0.0))
+                totals[key] = (calls + value[1], seconds + value[3])
+
+        return sorted(((k[0], k[1], v[0], v[1]) for k, v in totals.items()),
+                      key=lambda t: -t[3])
+
+    def template_line_samples(self):
+        """returns list of (template, line, samples) by samples"""
+
+        lines = TemplateLines()
+        counts = {}
+
+        for stack, count in self.sampler.samples.items():
+            for code, lineno in reversed(stack):  # innermost template frame
+                if code.co_filename.endswith('.j2'):
+                    key = (_short(code.co_filename),
+                           lines.lineno(code.co_filename, lineno))
+                    counts[key] = counts.get(key, 0) + count
+                    break
+
+        return sorted(((k[0], k[1], v) for k, v in counts.items()),
+                      key=lambda t: -t[2])
+
+    def write(self, limit=25):
+        """write profile report, pstats and collapsed stacks"""
+
+        LOGGER.debug('Writing profile to {}'.format(self.directory))
+        report = []
+
+        report.append('Stages')
+        for name, (profile, seconds) in sorted(self.stages.items()):
+            profile.dump_stats(os.path.join(self.directory,
+                                            '{}.prof'.format(name)))
+            report.append('  {:<20} {:10.3f}s'.format(name, seconds))
+
+        report.append('')
+        report.append('Template blocks and macros (cumulative)')
+        for name, filename, calls, seconds in self.template_stats():
+            report.append('  {:<40} {:>8} calls {:10.3f}s'.format(
+                          '{} [{}]'.format(name, filename), calls, seconds))
+
+        report.append('')
+        report.append('Template lines (samples every {}s)'.format(
+                      self.interval))
+        for filename, lineno, count in self.template_line_samples()[:limit]:
+            report.append('  {:<40} {:>8}'.format(
+                          '{}:{}'.format(filename, lineno), count))
+
+        if self.records:
+            peaks = sorted(self.records, key=lambda r: -r[3])
+            report.append('')
+            report.append('Records: {}, mean peak memory {:.0f} KiB, '
+                          'mean time {:.4f}s'.format(
+                              len(self.records),
+                              sum(r[3] for r in self.records) /
+                              len(self.records) / 1024.0,
+                              sum(r[2] for r in self.records) /
+                              len(self.records)))
+            for name, stage, seconds, peak in peaks[:10]:
+                report.append('  {:<40} {:<10} {:10.0f} KiB {:8.4f}s'.format(
+                              name, stage or '', peak / 1024.0, seconds))
+
+            with codecs.open(os.path.join(self.directory, 'records.csv'),
+                             'w', encoding='utf-8') as fh:
+                fh.write('name,stage,seconds,peak_bytes\n')
+                for name, stage, seconds, peak in self.records:
+                    fh.write(u'"{}",{},{:.6f},{}\n'.format(
+                             name.replace('"', '""'), stage or '', seconds,
+                             peak))
+
+        for name, (profile, _) in sorted(self.stages.items()):
+            stream = StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(limit)
+            report.append('')
+            report.append('Stage {}'.format(name))
+            report.append(stream.getvalue())
+
+        with codecs.open(os.path.join(self.directory, 'profile.txt'), 'w',
+                         encoding='utf-8') as fh:
+            fh.write('\n'.join(report))
+
+        lines = TemplateLines()
+        with codecs.open(os.path.join(self.directory, 'stacks.collapsed'),
+                         'w', encoding='utf-8') as fh:
+            for stack, count in sorted(self.sampler.samples.items(),
+                                       key=lambda s: -s[1]):
+                fh.write(u'{} {}\n'.format(';'.join(
+                    lines.label(code, lineno) for code, lineno in stack),
+                    count))
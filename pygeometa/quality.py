@@ -0,0 +1,223 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import logging
+import re
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+BBOX_FIELDS = ('bounding_box_w', 'bounding_box_e',
+               'bounding_box_s', 'bounding_box_n')
+
+TEMPORAL_FIELDS = ('t_extnt_beginPosition', 't_extnt_endPosition')
+
+# (minx, miny, maxx, maxy) of the area RGA records are expected to cover
+SERBIA_EXTENT = (18.0, 41.5, 23.5, 46.5)
+
+# UTC designator or offset ending the time of an ISO 8601 timestamp
+UTC_OFFSET_RE = re.compile(r'[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?'
+                           r'(Z|([+-])(\d{2}):?(\d{2}))$')
+
+
+def _get(record, field):
+    """field value of an MCFRecord or MCF metadata dict"""
+
+    if isinstance(record, dict):
+        return record.get('metadata', record).get(field)
+    return getattr(record, field, None)
+
+
+def _set(record, field, value):
+    """set field value of an MCFRecord or MCF metadata dict"""
+
+    if isinstance(record, dict):
+        record.get('metadata', record)[field] = value
+    else:
+        setattr(record, field, value)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _datetime(value):
+    """UTC datetime64 of a date or timestamp, NaT if not valid"""
+
+    if not value:
+        return np.datetime64('NaT')
+
+    # datetime64 has no time zones: apply the offset, as UTC
+    text = u'{}'.format(value).strip()
+    offset = np.timedelta64(0, 'm')
+    match = UTC_OFFSET_RE.search(text)
+    if match is not None:
+        text = text[:match.start(3)]
+        if match.group(4) is not None:
+            minutes = int(match.group(5)) * 60 + int(match.group(6))
+            offset = np.timedelta64(minutes, 'm')
+            if match.group(4) == '-':
+                offset = -offset
+
+    try:
+        return np.datetime64(text, 's') - offset
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def gather(records):
+    """returns (n, 4) float array of w, e, s, n and (n, 2) array of dates"""
+
+    bbox = np.array([[_float(_get(r, f)) for f in BBOX_FIELDS]
+                     for r in records], dtype=float).reshape(-1, 4)
+    dates = np.array([[_datetime(_get(r, f)) for f in TEMPORAL_FIELDS]
+                      for r in records],
+                     dtype='datetime64[s]').reshape(-1, 2)
+    return bbox, dates
+
+
+def check_batch(records, autofix=False, region=None):
+    """
+    checks bounding boxes and temporal extents of a batch of records
+    in a single vectorized pass
+
+    :param records: list of MCFRecord objects or MCF dicts
+    :param autofix: swap values of obvious swaps in place
+    :param region: optional (minx, miny, maxx, maxy) extent used to detect
+                   swapped latitude/longitude
+
+    :returns: list of (failures, fixes) lists of issue codes per record
+    """
+
+    bbox, dates = gather(records)
+    w, e, s, n = bbox.T
+    failures = dict((i, []) for i in range(len(records)))
+    fixes = dict((i, []) for i in range(len(records)))
+
+    def flag(mask, code, fixable=False):
+        for i in np.flatnonzero(mask):
+            if fixable and autofix:
+                fixes[i].append(code)
+            else:
+                failures[i].append(code)
+
+    missing = np.isnan(bbox).any(axis=1)
+    projected = ~missing & ((np.abs(bbox[:, :2]) > 360).any(axis=1) |
+                            (np.abs(bbox[:, 2:]) > 180).any(axis=1))
+    valid = ~missing & ~projected
+
+    # latitudes that only make sense as longitudes (or region mismatch)
+    swapped = valid & ((np.abs(bbox[:, 2:]) > 90).all(axis=1) &
+                       (np.abs(bbox[:, :2]) <= 90).all(axis=1))
+    if region is not None:
+        minx, miny, maxx, maxy = region
+        inside = ((w >= minx) & (e <= maxx) & (s >= miny) & (n <= maxy))
+        inside_swapped = ((s >= minx) & (n <= maxx) &
+                          (w >= miny) & (e <= maxy))
+        swapped |= valid & ~inside & inside_swapped
+    flag(swapped, 'bbox_latlon_swapped', fixable=True)
+
+    # remaining checks apply to the (possibly) fixed boxes
+    fixed = np.where(swapped[:, None] & autofix, bbox[:, [2, 3, 0, 1]], bbox)
+    w, e, s, n = fixed.T
+
+    west_east = valid & (w > e)
+    south_north = valid & (s > n)
+    out_of_range = valid & ((np.abs(fixed[:, :2]) > 180).any(axis=1) |
+                            (np.abs(fixed[:, 2:]) > 90).any(axis=1))
+
+    flag(missing, 'bbox_missing')
+    flag(projected, 'bbox_projected')
+    flag(out_of_range & ~swapped, 'bbox_out_of_range')
+    flag(west_east, 'bbox_west_gt_east', fixable=True)
+    flag(south_north, 'bbox_south_gt_north', fixable=True)
+
+    begin, end = dates.T
+    temporal = ~np.isnat(begin) & ~np.isnat(end) & (begin > end)
+    flag(temporal, 'temporal_begin_gt_end', fixable=True)
+
+    for i in range(len(records)):
+        if failures[i]:  # rejected records are left untouched
+            failures[i].extend(fixes[i])
+            fixes[i] = []
+        elif fixes[i]:
+            _fix(records[i], fixes[i])
+
+    return [(failures[i], fixes[i]) for i in range(len(records))]
+
+
+def _fix(record, codes):
+    """apply swaps of fixable issue codes to a record"""
+
+    values = dict((f, _get(record, f)) for f in BBOX_FIELDS)
+
+    if 'bbox_latlon_swapped' in codes:
+        values = {
+            'bounding_box_w': values['bounding_box_s'],
+            'bounding_box_e': values['bounding_box_n'],
+            'bounding_box_s': values['bounding_box_w'],
+            'bounding_box_n': values['bounding_box_e']
+        }
+    if 'bbox_west_gt_east' in codes:
+        values['bounding_box_w'], values['bounding_box_e'] = \
+            values['bounding_box_e'], values['bounding_box_w']
+    if 'bbox_south_gt_north' in codes:
+        values['bounding_box_s'], values['bounding_box_n'] = \
+            values['bounding_box_n'], values['bounding_box_s']
+
+    for field, value in values.items():
+        _set(record, field, value)
+
+    if 'temporal_begin_gt_end' in codes:
+        begin, end = [_get(record, f) for f in TEMPORAL_FIELDS]
+        _set(record, TEMPORAL_FIELDS[0], end)
+        _set(record, TEMPORAL_FIELDS[1], begin)
+
+    LOGGER.debug('Fixed {}'.format(', '.join(codes)))
@@ -0,0 +1,175 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+from six.moves import intern
+
+# MCF metadata keys and the RGAIsoParser properties they are extracted from
+RGA_FIELDS = (
+    ('identifier', 'fileIdentifier'),
+    ('language', 'metadata_language'),
+    ('hierarchylevel', 'hierarchyLevel'),
+    ('organization_name', 'meta_organization_name'),
+    ('organisation_emailAddress', 'meta_organisation_emailAddress'),
+    ('datestamp', 'dateStamp'),
+    ('title', 'title'),
+    ('publish_date', 'publish_date'),
+    ('dateTypeCode', 'dateTypeCode'),
+    ('resourceIdentifier', 'RS_Identifier'),
+    ('resourceIdentifierNamespace', 'RS_Identifier_codeSpace'),
+    ('abstract', 'abstract'),
+    ('resp_organisationName', 'organisationName'),
+    ('resp_organisation_emailAddress', 'organisation_emailAddress'),
+    ('resp_organisation_role', 'organisation_role'),
+    ('keywords', 'descriptiveKeywords'),
+    ('useLimitation', 'useLimitation'),
+    ('accessConstraints', 'accessConstraints'),
+    ('otherConstraints', 'otherConstraints'),
+    ('denominator', 'denominator'),
+    ('distance', 'distance'),
+    ('resourceLanguage', 'resourceLanguage'),
+    ('inspireCategory', 'inspireCategory'),
+    ('bounding_box_w', 'westBoundLongitude'),
+    ('bounding_box_e', 'eastBoundLongitude'),
+    ('bounding_box_s', 'southBoundLatitude'),
+    ('bounding_box_n', 'northBoundLatitude'),
+    ('t_extnt_beginPosition', 't_extnt_beginPosition'),
+    ('t_extnt_endPosition', 't_extnt_endPosition'),
+    ('dist_format', 'dist_format'),
+    ('linkage', 'linkage'),
+    ('lineage', 'lineage'),
+    ('reference_system', 'referenceSystem')
+)
+
+# fields whose values repeat across records and are shared via interning
+INTERNED_FIELDS = frozenset([
+    'language', 'hierarchylevel', 'organization_name',
+    'organisation_emailAddress', 'dateTypeCode',
+    'resourceIdentifierNamespace', 'resp_organisationName',
+    'resp_organisation_emailAddress', 'resp_organisation_role',
+    'keywords', 'useLimitation', 'accessConstraints', 'otherConstraints',
+    'resourceLanguage', 'inspireCategory', 'dist_format', 'linkage',
+    'reference_system'
+])
+
+MCF_VERSION = '1.0.0'
+
+
+def _compact(value, interned=False):
+    """store lists as tuples, interning strings of repeated fields"""
+
+    if isinstance(value, list):
+        return tuple(_compact(v, interned) for v in value)
+    if interned and type(value) is str:
+        return intern(value)
+    return value
+
+
+class MCFRecord(object):
+    """compact, slotted representation of an extracted RGA record"""
+
+    __slots__ = tuple(field for field, _ in RGA_FIELDS)
+
+    def __init__(self, **kwargs):
+        for field in self.__slots__:
+            value = kwargs.get(field)
+            setattr(self, field, _compact(value, field in INTERNED_FIELDS))
+
+    def __eq__(self, other):
+        return (isinstance(other, MCFRecord) and
+                all(getattr(self, f) == getattr(other, f)
+                    for f in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, _compact(value, field in INTERNED_FIELDS))
+
+    @classmethod
+    def from_parser(cls, parser, fields=None):
+        """
+        extract the RGA field set, or only the given fields, from a
+        parsed metadata document
+        """
+
+        values = dict((field, getattr(parser, prop))
+                      for field, prop in RGA_FIELDS
+                      if fields is None or field in fields)
+        if 'inspireCategory' in values:
+            values['inspireCategory'] = [values['inspireCategory']]
+        return cls(**values)
+
+    @classmethod
+    def from_mcf(cls, mcf):
+        """build a record from an MCF dict"""
+
+        return cls(**mcf.get('metadata', mcf))
+
+    def get(self, field, default=None):
+        """dict-like access to a field"""
+
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_mcf(self):
+        """returns MCF dict of the record"""
+
+        metadata = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if isinstance(value, tuple):
+                value = [list(v) if isinstance(v, tuple) else v
+                         for v in value]
+            metadata[field] = value
+
+        return {
+            'mcf': {'version': MCF_VERSION},
+            'metadata': metadata
+        }
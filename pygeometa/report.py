@@ -0,0 +1,377 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+import codecs
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import socket
+
+import click
+
+from pygeometa.completeness import CompletenessStats
+from pygeometa.contacts import ContactRegistry
+from pygeometa.search import CatalogueIndex
+from pygeometa.store import MCFStore
+
+LOGGER = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+STATUSES = ['converted', 'quarantined', 'failed']
+
+
+def parse_shard(value):
+    """returns tuple of (shard number, shard count) from 'i/N', 1-based"""
+
+    try:
+        number, count = [int(v) for v in value.split('/')]
+    except (AttributeError, ValueError):
+        raise ValueError('Invalid shard: {} (expected i/N)'.format(value))
+
+    if count < 1 or not 1 <= number <= count:
+        raise ValueError('Invalid shard: {} (expected 1 <= i <= N)'.format(
+                         value))
+
+    return number, count
+
+
+def shard_of(key, count):
+    """
+    returns the 1-based shard of a key (e.g. relative input path),
+    stable across nodes, processes and Python versions
+    """
+
+    digest = hashlib.sha1(key.replace(os.sep, '/').encode('utf-8'))
+    return int(digest.hexdigest()[:8], 16) % count + 1
+
+
+def in_shard(key, shard):
+    """returns True if key is assigned to shard ((i, N) tuple or None)"""
+
+    if shard is None:
+        return True
+    return shard_of(key, shard[1]) == shard[0]
+
+
+class RunReport(object):
+    """outcome of a conversion run, mergeable across shards"""
+
+    def __init__(self, shard=None):
+        """initialize an empty report, optionally for shard (i, N)"""
+
+        self.shards = {}
+        self.records = {}
+        self.conflicts = []
+        self.stages = {}
+        self.links = {}
+
+        if shard is not None:
+            self.shards['{}/{}'.format(*shard)] = {
+                'host': socket.gethostname(),
+                'started': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'finished': None
+            }
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, name, status, reasons=None, shard=None):
+        """record outcome of an input file"""
+
+        if status not in STATUSES:
+            raise ValueError('Invalid status: {}'.format(status))
+
+        if shard is None and len(self.shards) == 1:
+            shard = list(self.shards)[0]
+
+        self.records[name] = {
+            'status': status,
+            'reasons': list(reasons or []),
+            'shard': shard
+        }
+
+    def add_stage(self, name, stats):
+        """record statistics (e.g. load balance) of a pipeline stage"""
+
+        self.stages.setdefault(name, []).append(stats)
+
+    def add_links(self, results, records):
+        """
+        record link check results (URL: result dict) with the names of
+        the records linking each URL (URL: names)
+        """
+
+        for url, result in results.items():
+            link = self.links.setdefault(url, {'records': []})
+            link.update((k, v) for k, v in result.items() if k != 'records')
+            link['records'] = sorted(set(link['records']) |
+                                     set(records.get(url, [])))
+
+    def broken_links(self):
+        """returns sorted list of (url, status, error, records) not ok"""
+
+        return sorted((url, link['status'], link['error'], link['records'])
+                      for url, link in self.links.items()
+                      if link['ok'] is False)
+
+    def finish(self):
+        """mark all shards of this report as finished"""
+
+        now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        for shard in self.shards.values():
+            shard['finished'] = now
+
+    def summary(self):
+        """returns dict of record count by status"""
+
+        counts = dict((status, 0) for status in STATUSES)
+        for record in self.records.values():
+            counts[record['status']] += 1
+        return counts
+
+    def quarantine_list(self):
+        """returns sorted list of (name, status, reasons) not converted"""
+
+        return sorted((name, r['status'], r['reasons'])
+                      for name, r in self.records.items()
+                      if r['status'] != 'converted')
+
+    def missing_shards(self):
+        """returns sorted list of shards absent from a sharded report"""
+
+        shards = [parse_shard(label) for label in self.shards]
+        counts = set(count for _, count in shards)
+
+        if len(counts) != 1:
+            return []
+
+        count = counts.pop()
+        present = set(number for number, _ in shards)
+        return ['{}/{}'.format(number, count)
+                for number in range(1, count + 1) if number not in present]
+
+    def merge(self, other):
+        """add shards and records of another report into this one"""
+
+        for label, shard in other.shards.items():
+            if label in self.shards:
+                self.conflicts.append('shard {} merged twice'.format(label))
+            self.shards[label] = dict(shard)
+
+        for name, record in other.records.items():
+            if name in self.records:
+                self.conflicts.append(
+                    '{} processed by shards {} and {}'.format(
+                        name, self.records[name]['shard'], record['shard']))
+            self.records[name] = dict(record)
+
+        self.conflicts.extend(other.conflicts)
+
+        for name, stats in other.stages.items():
+            self.stages.setdefault(name, []).extend(stats)
+
+        self.add_links(other.links, dict(
+            (url, link['records']) for url, link in other.links.items()))
+
+    def to_dict(self):
+        """returns report as a JSON serializable dict"""
+
+        return {
+            'version': REPORT_VERSION,
+            'shards': self.shards,
+            'summary': self.summary(),
+            'missing_shards': self.missing_shards(),
+            'conflicts': self.conflicts,
+            'stages': self.stages,
+            'records': self.records,
+            'links': self.links
+        }
+
+    @classmethod
+    def load(cls, path):
+        """read a report from a JSON file"""
+
+        LOGGER.debug('Loading report {}'.format(path))
+        with codecs.open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+
+        if data.get('version') != REPORT_VERSION:
+            raise RuntimeError('Unsupported report version: {}'.format(
+                               data.get('version')))
+
+        report = cls()
+        report.shards = data['shards']
+        report.records = data['records']
+        report.conflicts = data['conflicts']
+        report.stages = data.get('stages', {})
+        report.links = data.get('links', {})
+        return report
+
+    def save(self, path):
+        """write report to a JSON file"""
+
+        LOGGER.debug('Writing report {}'.format(path))
+        tmp_path = '{}.tmp'.format(path)
+        with codecs.open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.to_dict(), fh, indent=2, sort_keys=True,
+                      ensure_ascii=False)
+        os.rename(tmp_path, path)
+
+
+def write_quarantine_list(report, path):
+    """write tab separated list of records not converted"""
+
+    with codecs.open(path, 'w', encoding='utf-8') as fh:
+        for name, status, reasons in report.quarantine_list():
+            fh.write(u'{}\t{}\t{}\n'.format(name, status, '; '.join(reasons)))
+
+
+@click.command()
+@click.pass_context
+@click.option('--output', required=True,
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged report')
+@click.option('--quarantine-list',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged list of records not converted')
+@click.option('--index', 'index_path',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged search index')
+@click.option('--shard-index', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Per-shard search index to merge (repeatable)')
+@click.option('--store', 'store_path',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged MCF store')
+@click.option('--shard-store', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Per-shard MCF store to merge (repeatable)')
+@click.option('--contacts', 'contacts_path',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged contact registry (entries already in it '
+                   'are kept)')
+@click.option('--shard-contacts', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Per-shard contact registry to merge (repeatable)')
+@click.option('--completeness', 'completeness_path',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to merged field completeness (.json for JSON, '
+                   'else CSV)')
+@click.option('--shard-completeness', multiple=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Per-shard field completeness JSON to merge (repeatable)')
+@click.argument('reports', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False,
+                                resolve_path=True))
+def merge_reports(ctx, output, quarantine_list, index_path, shard_index,
+                  store_path, shard_store, contacts_path, shard_contacts,
+                  completeness_path, shard_completeness, reports):
+    """
+    merge per-shard run reports, quarantine lists, indexes, stores,
+    contact registries and field completeness
+    """
+
+    if shard_index and index_path is None:
+        raise click.UsageError('--index required with --shard-index')
+    if shard_store and store_path is None:
+        raise click.UsageError('--store required with --shard-store')
+    if shard_contacts and contacts_path is None:
+        raise click.UsageError('--contacts required with --shard-contacts')
+    if shard_completeness and completeness_path is None:
+        raise click.UsageError(
+            '--completeness required with --shard-completeness')
+
+    merged = RunReport()
+    for path in reports:
+        merged.merge(RunReport.load(path))
+    merged.save(output)
+
+    if quarantine_list is not None:
+        write_quarantine_list(merged, quarantine_list)
+
+    if shard_index:
+        index = CatalogueIndex()
+        for path in shard_index:
+            index.merge(CatalogueIndex(path))
+        index.save(index_path)
+
+    if shard_store:
+        with MCFStore(store_path) as store:
+            for path in shard_store:
+                with MCFStore(path) as shard:
+                    store.put_many(shard.iter_records())
+
+    if shard_contacts:
+        registry = ContactRegistry(contacts_path if os.path.exists(
+                                   contacts_path) else None)
+        for path in shard_contacts:
+            registry.merge(ContactRegistry(path))
+        registry.save(contacts_path)
+
+    if shard_completeness:
+        stats = CompletenessStats()
+        for path in shard_completeness:
+            with codecs.open(path, encoding='utf-8') as fh:
+                stats.merge(CompletenessStats.from_dict(json.load(fh)))
+        with codecs.open(completeness_path, 'w', encoding='utf-8') as fh:
+            if completeness_path.endswith('.json'):
+                stats.write_json(fh)
+            else:
+                stats.write_csv(fh)
+
+    summary = merged.summary()
+    click.echo('Merged {} reports: {}'.format(len(reports), ', '.join(
+               '{} {}'.format(summary[s], s) for s in STATUSES)))
+
+    for message in merged.missing_shards():
+        click.echo('MISSING shard {}'.format(message), err=True)
+    for message in merged.conflicts:
+        click.echo('CONFLICT {}'.format(message), err=True)
+
+    if merged.missing_shards() or merged.conflicts:
+        ctx.exit(1)
@@ -0,0 +1,250 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import logging
+import re
+
+import numpy as np
+
+from pygeometa.quality import BBOX_FIELDS, _float, _get, _set
+
+LOGGER = logging.getLogger(__name__)
+
+# semi-major axis, inverse flattening
+ELLIPSOIDS = {
+    'bessel': (6377397.155, 299.1528128),
+    'grs80': (6378137.0, 298.257222101),
+    'wgs84': (6378137.0, 298.257223563)
+}
+
+# geocentric translation to WGS84, MGI 1901 to WGS 84 (1), EPSG:3962
+MGI_1901_TO_WGS84 = (682.0, -203.0, 480.0)
+
+
+def _gauss_kruger(zone):
+    return ('bessel', 3.0 * zone, 0.9999, zone * 1000000.0 + 500000.0, 0.0,
+            MGI_1901_TO_WGS84)
+
+
+def _utm(zone, ellipsoid):
+    return (ellipsoid, 6.0 * zone - 183.0, 0.9996, 500000.0, 0.0, None)
+
+
+# EPSG code: ellipsoid, central meridian, scale factor, false easting,
+# false northing, translation to WGS84. The deprecated MGI / Balkans codes
+# are used by Serbian sources for MGI 1901 coordinates.
+PROJECTIONS = {
+    31275: _gauss_kruger(5),  # MGI / Balkans zone 5
+    31276: _gauss_kruger(6),  # MGI / Balkans zone 6
+    31277: _gauss_kruger(7),  # MGI / Balkans zone 7
+    31278: _gauss_kruger(8),  # MGI / Balkans zone 8
+    3908: _gauss_kruger(6),  # MGI 1901 / Balkans zone 6
+    3909: _gauss_kruger(7),  # MGI 1901 / Balkans zone 7
+    3910: _gauss_kruger(8),  # MGI 1901 / Balkans zone 8
+    32633: _utm(33, 'wgs84'),  # WGS 84 / UTM zone 33N
+    32634: _utm(34, 'wgs84'),  # WGS 84 / UTM zone 34N
+    32635: _utm(35, 'wgs84'),  # WGS 84 / UTM zone 35N
+    25833: _utm(33, 'grs80'),  # ETRS89 / UTM zone 33N
+    25834: _utm(34, 'grs80'),  # ETRS89 / UTM zone 34N
+    25835: _utm(35, 'grs80'),  # ETRS89 / UTM zone 35N
+    3046: _utm(34, 'grs80'),  # ETRS89 / UTM zone 34N (N-E)
+    8682: _utm(34, 'grs80')  # SRB_ETRS89 / UTM zone 34N
+}
+
+EPSG_RE = re.compile(r'EPSG(?:/\d+/|:+)(\d+)|^\s*(\d{4,5})\s*$', re.I)
+
+
+def parse_epsg(value):
+    """returns EPSG code of a reference system identifier, or None"""
+
+    if not value:
+        return None
+    if isinstance(value, (list, tuple)):
+        value = value[0]
+    match = EPSG_RE.search(u'{}'.format(value))
+    if match is None:
+        return None
+    return int(match.group(1) or match.group(2))
+
+
+def guess_epsg(easting):
+    """guess the projection of a bounding box from its eastings"""
+
+    zone = int(easting // 1000000)
+    if 5 <= zone <= 8:  # Gauss-Kruger zone prefixed easting
+        return 31270 + zone
+    if 100000 <= easting <= 900000:
+        return 25834  # UTM zone 34N, covering Serbia
+    return None
+
+
+def is_projected(bbox):
+    """boolean mask of (n, 4) w, e, s, n rows holding projected values"""
+
+    return ((np.abs(bbox[:, :2]) > 180).any(axis=1) |
+            (np.abs(bbox[:, 2:]) > 90).any(axis=1))
+
+
+def densify(bbox, points=21):
+    """
+    returns x, y arrays of shape (n, 4 * points) tracing the edges
+    of (n, 4) w, e, s, n bounding boxes
+    """
+
+    t = np.linspace(0.0, 1.0, points)
+    w, e, s, n = [c[:, None] for c in bbox.T]
+    x = np.hstack([w + (e - w) * t, np.repeat(e, points, axis=1),
+                   e + (w - e) * t, np.repeat(w, points, axis=1)])
+    y = np.hstack([np.repeat(s, points, axis=1), s + (n - s) * t,
+                   np.repeat(n, points, axis=1), n + (s - n) * t])
+    return x, y
+
+
+def transverse_mercator_inverse(x, y, ellipsoid, lon0, k0, fe, fn):
+    """inverse transverse Mercator (Snyder), returns lon, lat in radians"""
+
+    a, rf = ELLIPSOIDS[ellipsoid]
+    e2 = (2 - 1 / rf) / rf
+    ep2 = e2 / (1 - e2)
+    e1 = (1 - np.sqrt(1 - e2)) / (1 + np.sqrt(1 - e2))
+
+    mu = (y - fn) / k0 / (a * (1 - e2 / 4 - 3 * e2 ** 2 / 64 -
+                               5 * e2 ** 3 / 256))
+    phi1 = (mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * np.sin(2 * mu) +
+            (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * np.sin(4 * mu) +
+            (151 * e1 ** 3 / 96) * np.sin(6 * mu) +
+            (1097 * e1 ** 4 / 512) * np.sin(8 * mu))
+
+    sin1, cos1, tan1 = np.sin(phi1), np.cos(phi1), np.tan(phi1)
+    c1 = ep2 * cos1 ** 2
+    t1 = tan1 ** 2
+    n1 = a / np.sqrt(1 - e2 * sin1 ** 2)
+    r1 = a * (1 - e2) / (1 - e2 * sin1 ** 2) ** 1.5
+    d = (x - fe) / (n1 * k0)
+
+    lat = phi1 - (n1 * tan1 / r1) * (
+        d ** 2 / 2 -
+        (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * ep2) * d ** 4 / 24 +
+        (61 + 90 * t1 + 298 * c1 + 45 * t1 ** 2 - 252 * ep2 -
+         3 * c1 ** 2) * d ** 6 / 720)
+    lon = np.radians(lon0) + (
+        d - (1 + 2 * t1 + c1) * d ** 3 / 6 +
+        (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * ep2 +
+         24 * t1 ** 2) * d ** 5 / 120) / cos1
+
+    return lon, lat
+
+
+def geocentric_translation(lon, lat, source, target, shift):
+    """datum shift of geodetic coordinates (radians) by translation"""
+
+    a, rf = ELLIPSOIDS[source]
+    e2 = (2 - 1 / rf) / rf
+    n = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    x = n * np.cos(lat) * np.cos(lon) + shift[0]
+    y = n * np.cos(lat) * np.sin(lon) + shift[1]
+    z = n * (1 - e2) * np.sin(lat) + shift[2]
+
+    a, rf = ELLIPSOIDS[target]
+    e2 = (2 - 1 / rf) / rf
+    p = np.sqrt(x ** 2 + y ** 2)
+    lat = np.arctan2(z, p * (1 - e2))
+    for _ in range(3):
+        n = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+        lat = np.arctan2(z + e2 * n * np.sin(lat), p)
+
+    return np.arctan2(y, x), lat
+
+
+def to_wgs84(x, y, epsg):
+    """transform projected coordinates to WGS84 degrees"""
+
+    ellipsoid, lon0, k0, fe, fn, shift = PROJECTIONS[epsg]
+    lon, lat = transverse_mercator_inverse(x, y, ellipsoid, lon0, k0, fe, fn)
+    if shift is not None:
+        lon, lat = geocentric_translation(lon, lat, ellipsoid, 'wgs84', shift)
+    return np.degrees(lon), np.degrees(lat)
+
+
+def reproject_batch(records, points=21, reference_system='reference_system'):
+    """
+    reprojects projected bounding boxes of a batch of records to WGS84,
+    in place
+
+    :param records: list of MCFRecord objects or MCF dicts
+    :param points: number of points per densified bounding box edge
+    :param reference_system: field holding the declared reference system
+
+    :returns: list of EPSG codes reprojected from (None if untouched
+              or unknown) per record
+    """
+
+    bbox = np.array([[_float(_get(r, f)) for f in BBOX_FIELDS]
+                     for r in records], dtype=float).reshape(-1, 4)
+    projected = ~np.isnan(bbox).any(axis=1) & is_projected(bbox)
+    codes = [None] * len(records)
+
+    for i in np.flatnonzero(projected):
+        epsg = parse_epsg(_get(records[i], reference_system))
+        if epsg not in PROJECTIONS:
+            epsg = guess_epsg(bbox[i, 0])
+        if epsg is None:
+            LOGGER.warning('Unknown reference system of record {}'.format(i))
+        codes[i] = epsg
+
+    for epsg in set(c for c in codes if c is not None):
+        rows = np.array([i for i, c in enumerate(codes) if c == epsg])
+        x, y = densify(bbox[rows], points)
+        lon, lat = to_wgs84(x, y, epsg)
+        bounds = np.column_stack([lon.min(axis=1), lon.max(axis=1),
+                                  lat.min(axis=1), lat.max(axis=1)])
+        LOGGER.debug('Reprojected {} records from EPSG:{}'.format(
+                     len(rows), epsg))
+        for i, values in zip(rows, np.round(bounds, 6)):
+            for field, value in zip(BBOX_FIELDS, values):
+                _set(records[i], field, '{}'.format(float(value)))
+
+    return codes
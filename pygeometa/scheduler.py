@@ -0,0 +1,382 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+import heapq
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import sys
+import time
+import traceback
+import zipfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from pygeometa.fileio import split_source
+from pygeometa.profiling import Profiler
+
+LOGGER = logging.getLogger(__name__)
+
+
+def source_size(source):
+    """returns size in bytes of a source file or zip member"""
+
+    path, member = split_source(source)
+
+    try:
+        if member is not None:
+            with zipfile.ZipFile(path) as archive:
+                return archive.getinfo(member).file_size
+        return os.path.getsize(path)
+    except (OSError, KeyError):
+        return 0
+
+
+def memory_usage():
+    """
+    returns tuple of current and peak resident set size in bytes of
+    this process (None if unknown)
+    """
+
+    try:
+        with open('/proc/self/status') as fh:
+            status = dict(line.split(':', 1) for line in fh if ':' in line)
+        return tuple(int(status[key].split()[0]) * 1024
+                     for key in ('VmRSS', 'VmHWM'))
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+
+    if resource is None:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if not sys.platform.startswith('darwin'):  # KiB, bytes on macOS
+        peak *= 1024
+    return peak, peak
+
+
+def _work(func, connection):
+    """
+    worker process loop: run func on received arguments until None,
+    replying with the result and current and peak RSS
+    """
+
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        key, arg = task
+        try:
+            result, error = func(arg), None
+        except Exception as err:
+            LOGGER.debug(traceback.format_exc())
+            result, error = None, '{}: {}'.format(type(err).__name__, err)
+        connection.send((key, result, error) + memory_usage())
+
+
+class Worker(object):
+    """a worker process with a pipe and its current task"""
+
+    def __init__(self, func, slot):
+        self.slot = slot
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work,
+                                               args=(func, child))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.task = None
+        self.started = None
+        self.tasks = 0
+
+    def assign(self, key, arg):
+        self.task = key
+        self.started = time.time()
+        self.tasks += 1
+        self.connection.send((key, arg))
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class JobQueue(object):
+    """
+    jobs, (key, arg, size) tuples, read from an iterable and popped
+    largest first; with window, at most window jobs are read ahead, so
+    jobs start while the iterable is still producing them
+    """
+
+    def __init__(self, jobs, window=None):
+        self.jobs = iter(jobs)
+        self.window = window
+        self.heap = []
+        self.count = 0  # keeps input order among equal sizes
+        self.exhausted = False
+
+    def __len__(self):
+        self.fill()
+        return len(self.heap)
+
+    def fill(self):
+        """read jobs until window of them are queued or none are left"""
+
+        while not self.exhausted and (self.window is None or
+                                      len(self.heap) < self.window):
+            try:
+                key, arg, size = next(self.jobs)
+            except StopIteration:
+                self.exhausted = True
+                break
+            heapq.heappush(self.heap, (-size, self.count, key, arg))
+            self.count += 1
+
+    def pop(self):
+        """returns (key, arg) of the largest queued job, or None"""
+
+        self.fill()
+        if not self.heap:
+            return None
+        _, _, key, arg = heapq.heappop(self.heap)
+        return key, arg
+
+
+class Scheduler(object):
+    """
+    runs a function over jobs, largest first (within a window of jobs
+    read ahead, if given), in worker processes with an optional per-job
+    wall-clock timeout
+
+    jobs that raise or time out are reported with an error message; a
+    timed out worker is killed and replaced.  A worker that has run
+    max_tasks jobs, or whose RSS exceeds max_rss bytes after a job, is
+    stopped and replaced by a fresh fork of this process, so caches
+    warmed here before run() stay warm.  With one worker and no limits,
+    or an enabled profiler, jobs run in this process.  With window, at
+    most window jobs are read ahead of those running
+    """
+
+    def __init__(self, func, workers=1, timeout=None, profiler=None,
+                 max_tasks=None, max_rss=None, window=None):
+        self.func = func
+        self.window = window
+        self.profiler = profiler or Profiler()
+        if self.profiler.enabled:
+            workers, timeout, max_tasks, max_rss = 1, None, None, None
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.busy = [0.0] * self.workers
+        self.tasks = [0] * self.workers
+        self.peak_rss = [None] * self.workers
+        self.recycled = [0] * self.workers
+        self.wall = 0.0
+
+    def run(self, jobs):
+        """
+        run func over jobs, an iterable of (key, arg, size) tuples,
+        yielding (key, result, error message or None) tuples as jobs
+        complete.  Without a window all jobs are read and ordered first;
+        with one, jobs are consumed as they are produced and ordered
+        largest first among those read ahead
+        """
+
+        window = self.window
+        if window is not None:
+            window = max(window, self.workers)
+        jobs = JobQueue(jobs, window)
+        start = time.time()
+
+        try:
+            if self.workers == 1 and (self.timeout, self.max_tasks,
+                                      self.max_rss) == (None, None, None):
+                results = self._run_inline(jobs)
+            else:
+                results = self._run_workers(jobs)
+            for result in results:
+                yield result
+        finally:
+            self.wall = time.time() - start
+
+    def _run_inline(self, jobs):
+        while True:
+            job = jobs.pop()
+            if job is None:
+                break
+            key, arg = job
+            started = time.time()
+            try:
+                with self.profiler.record(key):
+                    result = (key, self.func(arg), None)
+            except Exception as err:
+                LOGGER.debug(traceback.format_exc())
+                result = (key, None, '{}: {}'.format(type(err).__name__, err))
+            self.busy[0] += time.time() - started
+            self.tasks[0] += 1
+            yield result
+
+    def _run_workers(self, jobs):
+        workers = [Worker(self.func, slot)
+                   for slot in range(min(self.workers, len(jobs)))]
+
+        try:
+            for worker in workers:
+                if jobs:
+                    worker.assign(*jobs.pop())
+
+            while any(worker.task is not None for worker in workers):
+                ready = wait([w.connection for w in workers
+                              if w.task is not None], self._wait_timeout(
+                             workers))
+                now = time.time()
+
+                for index, worker in enumerate(workers):
+                    if worker.task is None:
+                        continue
+                    replace = None
+                    if worker.connection in ready:
+                        try:
+                            (key, result, error, rss,
+                             peak) = worker.connection.recv()
+                            replace = self._recycle(worker, rss, peak)
+                        except EOFError:  # worker died
+                            key, result, error = (worker.task, None,
+                                                  'worker exited')
+                            replace = 'kill'
+                    elif (self.timeout is not None and
+                          now - worker.started > self.timeout):
+                        LOGGER.warning('Killing {} after {}s'.format(
+                                       worker.task, self.timeout))
+                        key, result, error = (worker.task, None,
+                                              'timeout after {}s'.format(
+                                                  self.timeout))
+                        replace = 'kill'
+                    else:
+                        continue
+
+                    self.busy[worker.slot] += now - worker.started
+                    self.tasks[worker.slot] += 1
+                    worker.task = None
+                    if replace == 'recycle' and jobs:
+                        worker.stop()
+                        self.recycled[worker.slot] += 1
+                        worker = workers[index] = Worker(self.func,
+                                                         worker.slot)
+                    elif replace == 'kill':
+                        worker.kill()
+                        worker = workers[index] = Worker(self.func,
+                                                         worker.slot)
+                    if jobs:
+                        worker.assign(*jobs.pop())
+                    yield key, result, error
+        finally:
+            for worker in workers:
+                if worker.task is None:
+                    worker.stop()
+                else:
+                    worker.kill()
+
+    def _recycle(self, worker, rss, peak):
+        """
+        record peak memory of a worker and return 'recycle' if it
+        reached its task or memory limit, else None
+        """
+
+        if peak is not None:
+            self.peak_rss[worker.slot] = max(self.peak_rss[worker.slot] or 0,
+                                             peak)
+
+        if self.max_tasks is not None and worker.tasks >= self.max_tasks:
+            LOGGER.debug('Recycling worker {} after {} tasks'.format(
+                         worker.slot, worker.tasks))
+            return 'recycle'
+        if (self.max_rss is not None and rss is not None and
+                rss > self.max_rss):
+            LOGGER.debug('Recycling worker {} at {} bytes RSS'.format(
+                         worker.slot, rss))
+            return 'recycle'
+        return None
+
+    def _wait_timeout(self, workers):
+        """returns seconds until the next running job times out"""
+
+        if self.timeout is None:
+            return None
+        deadline = min(w.started for w in workers if w.task is not None)
+        return max(0, deadline + self.timeout - time.time())
+
+    def stats(self):
+        """
+        returns dict of load balance statistics: wall time, busy time,
+        tasks, peak RSS (bytes) and recycles per worker, and efficiency
+        (mean / max busy time)
+        """
+
+        busiest = max(self.busy)
+        return {
+            'workers': self.workers,
+            'wall_seconds': round(self.wall, 3),
+            'busy_seconds': [round(b, 3) for b in self.busy],
+            'tasks': list(self.tasks),
+            'peak_rss': list(self.peak_rss),
+            'recycled': list(self.recycled),
+            'efficiency': round(sum(self.busy) / len(self.busy) / busiest,
+                                3) if busiest else 1.0
+        }
@@ -0,0 +1,325 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+import zlib
+
+import click
+
+from pygeometa.core import read_mcf
+from pygeometa.fileio import (find_sources, get_compression, read_text,
+                              source_name)
+
+LOGGER = logging.getLogger(__name__)
+
+# MCF metadata fields tokenised into the index, with their ranking weight
+INDEXED_FIELDS = {
+    'title': 3,
+    'keywords': 2,
+    'abstract': 1,
+    'organization_name': 1,
+    'resp_organisationName': 1,
+    'lineage': 1
+}
+
+# 2: documents keyed by record name, with fileIdentifier stored
+INDEX_VERSION = 2
+
+# Serbian Cyrillic to Latin (gajica) transliteration
+CYRILLIC_TO_LATIN = {
+    u'а': u'a', u'б': u'b', u'в': u'v', u'г': u'g', u'д': u'd',
+    u'ђ': u'đ', u'е': u'e', u'ж': u'ž', u'з': u'z', u'и': u'i',
+    u'ј': u'j', u'к': u'k', u'л': u'l', u'љ': u'lj', u'м': u'm',
+    u'н': u'n', u'њ': u'nj', u'о': u'o', u'п': u'p', u'р': u'r',
+    u'с': u's', u'т': u't', u'ћ': u'ć', u'у': u'u', u'ф': u'f',
+    u'х': u'h', u'ц': u'c', u'ч': u'č', u'џ': u'dž', u'ш': u'š'
+}
+
+FOLD_TABLE = dict((ord(k), v) for k, v in CYRILLIC_TO_LATIN.items())
+FOLD_TABLE[ord(u'đ')] = u'dj'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    """fold Serbian Cyrillic/Latin text into lowercase plain Latin"""
+
+    text = text.lower().translate(FOLD_TABLE)
+    text = unicodedata.normalize('NFKD', text).translate(FOLD_TABLE)
+    return u''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """returns list of script-folded tokens of a string or list of strings"""
+
+    if text is None:
+        return []
+    if isinstance(text, (list, tuple)):
+        tokens = []
+        for value in text:
+            tokens.extend(tokenize(value))
+        return tokens
+    return TOKEN_RE.findall(fold(u'{}'.format(text)))
+
+
+class CatalogueIndex(object):
+    """
+    inverted full-text index of MCF records, keyed by record name (as
+    the store and run report are), since fileIdentifiers of a catalogue
+    are not necessarily unique
+    """
+
+    def __init__(self, path=None):
+        """initialize index, loading it from path if it exists"""
+
+        self.path = path
+        self.docs = {}  # name: [title, length, identifier]
+        self.postings = {}  # term: {name: weight}
+        self._terms = {}  # name: terms, for incremental updates
+        self.dirty = False
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, name):
+        return name in self.docs
+
+    def add(self, name, mcf):
+        """add or replace record name with the content of an MCF"""
+
+        metadata = mcf.get('metadata', mcf)
+        name = u'{}'.format(name)
+
+        if name in self.docs:
+            self.remove(name)
+
+        weights = {}
+        for field, weight in INDEXED_FIELDS.items():
+            for token in tokenize(metadata.get(field)):
+                weights[token] = weights.get(token, 0) + weight
+
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[name] = weight
+
+        title = metadata.get('title')
+        if isinstance(title, (list, tuple)):
+            title = title[0] if title else None
+        identifier = metadata.get('identifier')
+        if identifier is not None:
+            identifier = u'{}'.format(identifier)
+        self.docs[name] = [title, sum(weights.values()), identifier]
+        self._terms[name] = list(weights)
+        self.dirty = True
+
+    def remove(self, name):
+        """remove a record from the index"""
+
+        if name not in self.docs:
+            return
+
+        for term in self._terms.pop(name, []):
+            postings = self.postings.get(term, {})
+            postings.pop(name, None)
+            if not postings:
+                self.postings.pop(term, None)
+
+        del self.docs[name]
+        self.dirty = True
+
+    def search(self, query, limit=10, k1=1.2, b=0.75):
+        """
+        returns list of (name, score, title, identifier) tuples matching
+        query, ranked by BM25
+        """
+
+        if not self.docs:
+            return []
+
+        num_docs = len(self.docs)
+        avg_length = sum(d[1] for d in self.docs.values()) / float(num_docs)
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for name, tf in postings.items():
+                norm = k1 * (1 - b + b * self.docs[name][1] /
+                             (avg_length or 1))
+                scores[name] = (scores.get(name, 0) +
+                                idf * tf * (k1 + 1) / (tf + norm))
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return [(n, s, self.docs[n][0], self.docs[n][2])
+                for n, s in ranked[:limit]]
+
+    def merge(self, other):
+        """add all records of another index into this one"""
+
+        for name in other.docs:
+            self.remove(name)
+
+        for term, postings in other.postings.items():
+            self.postings.setdefault(term, {}).update(postings)
+
+        for name, terms in other._terms.items():
+            self.docs[name] = list(other.docs[name])
+            self._terms[name] = list(terms)
+
+        self.dirty = True
+
+    def load(self, path):
+        """load index from disk"""
+
+        LOGGER.debug('Loading index {}'.format(path))
+        with open(path, 'rb') as fh:
+            data = json.loads(zlib.decompress(fh.read()).decode('utf-8'))
+
+        if data.get('version') != INDEX_VERSION:
+            raise RuntimeError('Unsupported index version: {}'.format(
+                               data.get('version')))
+
+        names = [d[0] for d in data['docs']]
+        self.docs = dict((d[0], d[1:]) for d in data['docs'])
+        self.postings = {}
+        self._terms = dict((n, []) for n in names)
+
+        for term, flat in data['postings'].items():
+            postings = self.postings[term] = {}
+            for pos in range(0, len(flat), 2):
+                name = names[flat[pos]]
+                postings[name] = flat[pos + 1]
+                self._terms[name].append(term)
+
+        self.dirty = False
+
+    def save(self, path=None):
+        """write index to disk as compressed JSON, documents numbered"""
+
+        path = path or self.path
+        if path is None:
+            raise RuntimeError('index path required')
+
+        names = sorted(self.docs)
+        numbers = dict((name, n) for n, name in enumerate(names))
+        postings = {}
+
+        for term, docs in self.postings.items():
+            flat = postings[term] = []
+            for name in sorted(docs, key=numbers.get):
+                flat.extend([numbers[name], docs[name]])
+
+        data = {
+            'version': INDEX_VERSION,
+            'docs': [[name] + self.docs[name] for name in names],
+            'postings': postings
+        }
+
+        LOGGER.debug('Writing index {}'.format(path))
+        content = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'wb') as fh:
+            fh.write(zlib.compress(content.encode('utf-8'), 9))
+        os.rename(tmp_path, path)
+        self.path = path
+        self.dirty = False
+
+
+@click.command()
+@click.option('--index', 'index_path', required=True,
+              type=click.Path(dir_okay=False, resolve_path=True),
+              help='Path to index file')
+@click.argument('mcf', nargs=-1, required=True,
+                type=click.Path(exists=True, resolve_path=True))
+def build_index(index_path, mcf):
+    """add MCF files or directories of MCFs to a search index"""
+
+    index = CatalogueIndex(index_path)
+    count = 0
+
+    for path in mcf:
+        # recursive: ymls_dts_dir may have the hash layout
+        sources = (find_sources(path, '.yml', recursive=True)
+                   if os.path.isdir(path) else [path])
+        for mcf_path in sources:
+            # plain files are read by path, for base_mcf includes
+            record = read_mcf(read_text(mcf_path) if get_compression(mcf_path)
+                              else mcf_path)
+            # record name, as in meta2iso: fileIdentifiers may be shared
+            index.add(source_name(mcf_path), record)
+            count += 1
+
+    index.save()
+    click.echo('Indexed {} records ({} total)'.format(count, len(index)))
+
+
+@click.command()
+@click.option('--index', 'index_path', required=True,
+              type=click.Path(exists=True, dir_okay=False,
+                              resolve_path=True),
+              help='Path to index file')
+@click.option('--limit', type=int, default=10,
+              help='Maximum number of results')
+@click.argument('query', nargs=-1, required=True)
+def search(index_path, limit, query):
+    """ranked lookup of records in a search index"""
+
+    index = CatalogueIndex(index_path)
+
+    for name, score, title, identifier in index.search(' '.join(query),
+                                                       limit):
+        click.echo(u'{:.3f}\t{}\t{}\t{}'.format(score, name, identifier or '',
+                                                title or ''))
@@ -0,0 +1,172 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import codecs
+from collections import namedtuple
+import logging
+import re
+
+from pygeometa.core import get_rga_languages
+from pygeometa.fileio import open_source
+
+LOGGER = logging.getLogger(__name__)
+
+# bytes read from the start of a source; title and abstract of typical
+# records start within the first 6 KiB
+HEADER_SIZE = 16 * 1024
+
+ISO_ROOTS = ('MD_Metadata', 'MI_Metadata')
+GMD_NAMESPACE = 'http://www.isotc211.org/2005/gmd'
+
+# RGA template language of records whose language is not supported
+DEFAULT_RGA_LANGUAGE = 'srb_lat'
+
+# ISO 639-1 and deprecated codes of supported ISO 639-2 languages
+LANGUAGE_ALIASES = {
+    'en': 'eng',
+    'sr': 'srp',
+    'scc': 'srp'
+}
+
+DECLARATION_RE = re.compile(
+    br'^<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+ROOT_RE = re.compile(r'<(?![?!])(?:[\w.-]+:)?([\w.-]+)')
+LANGUAGE_RE = re.compile(
+    r'<(?:\w+:)?language>\s*(?:<(?:\w+:)?LanguageCode\b[^>]*?'
+    r'codeListValue\s*=\s*["\']([^"\']*)["\']|'
+    r'<(?:\w+:)?CharacterString>\s*([^<\s]*))')
+TEXT_RE = re.compile(r'<(?:\w+:)?(?:title|abstract)>\s*'
+                     r'<(?:\w+:)?CharacterString>([^<]*)')
+
+Header = namedtuple('Header', ['iso', 'reason', 'language', 'script',
+                               'rga_language'])
+
+
+def decode_header(data):
+    """decode the start of an XML document as given by its declaration"""
+
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return data.decode('utf-16', 'replace')
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+
+    encoding = 'utf-8'
+    match = DECLARATION_RE.match(data)
+    if match is not None:
+        encoding = match.group(1).decode('ascii')
+    try:
+        return data.decode(encoding, 'replace')
+    except LookupError:
+        LOGGER.debug('Unknown encoding {}'.format(encoding))
+        return data.decode('utf-8', 'replace')
+
+
+def detect_script(text):
+    """returns dominant script of text: cyr, lat, or None if no letters"""
+
+    cyrillic = latin = 0
+    for char in text:
+        if u'Ѐ' <= char <= u'ӿ':
+            cyrillic += 1
+        elif char.isalpha() and char < u'ɐ':
+            latin += 1
+
+    if not cyrillic and not latin:
+        return None
+    return 'cyr' if cyrillic > latin else 'lat'
+
+
+def route(language, script):
+    """
+    returns RGA template language (dts_template_* suffix) for a
+    metadata language (ISO 639-2 code) and dominant script
+    """
+
+    language = LANGUAGE_ALIASES.get(language, language)
+    candidates = sorted(key for key, code in get_rga_languages().items()
+                        if code == language)
+
+    if not candidates:  # unsupported or unknown language: by script
+        candidates = sorted(get_rga_languages())
+        default = DEFAULT_RGA_LANGUAGE
+    else:
+        default = candidates[0]
+
+    for candidate in candidates:
+        if script is not None and candidate.endswith('_' + script):
+            return candidate
+    return default
+
+
+def sniff(source, size=HEADER_SIZE):
+    """
+    returns Header of a plain, compressed or zipped XML source from its
+    first size bytes: whether it is an ISO 19139 document (and if not,
+    why), metadata language, dominant script of title and abstract, and
+    the RGA template language to render it with
+    """
+
+    with open_source(source) as fh:
+        text = decode_header(fh.read(size))
+
+    match = ROOT_RE.search(text)
+    if match is None:
+        return Header(False, 'no XML root element', None, None, None)
+    if match.group(1) not in ISO_ROOTS:
+        return Header(False, 'root element {} is not ISO 19139'.format(
+                      match.group(1)), None, None, None)
+    if GMD_NAMESPACE not in text:
+        return Header(False, 'ISO 19139 (gmd) namespace not declared',
+                      None, None, None)
+
+    language = None
+    match = LANGUAGE_RE.search(text)
+    if match is not None:
+        language = (match.group(1) or match.group(2) or '').lower() or None
+
+    script = detect_script(u' '.join(TEXT_RE.findall(text)))
+
+    return Header(True, None, language, script, route(language, script))
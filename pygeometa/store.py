@@ -0,0 +1,189 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import json
+import logging
+import sqlite3
+
+LOGGER = logging.getLogger(__name__)
+
+STORE_SCHEME = 'sqlite:'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    name TEXT PRIMARY KEY,
+    identifier TEXT,
+    datestamp TEXT,
+    publish_date TEXT,
+    language TEXT,
+    mcf TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_identifier ON records (identifier);
+CREATE INDEX IF NOT EXISTS records_datestamp ON records (datestamp);
+CREATE INDEX IF NOT EXISTS records_publish_date ON records (publish_date);
+CREATE INDEX IF NOT EXISTS records_language ON records (language);
+'''
+
+
+def store_uri(path, name):
+    """returns a read_mcf compatible reference to a record in a store"""
+
+    return '{}{}#{}'.format(STORE_SCHEME, path, name)
+
+
+def parse_store_uri(uri):
+    """returns tuple of store path and record name"""
+
+    path, _, name = uri[len(STORE_SCHEME):].rpartition('#')
+    return path, name
+
+
+def _column(value):
+    """normalize an MCF value into an indexable column value"""
+
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    return None if value is None else u'{}'.format(value)
+
+
+class MCFStore(object):
+    """SQLite-backed store of MCF records"""
+
+    def __init__(self, path):
+        """open (and create if necessary) a store at path"""
+
+        LOGGER.debug('Opening MCF store {}'.format(path))
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __len__(self):
+        cursor = self.connection.execute('SELECT COUNT(*) FROM records')
+        return cursor.fetchone()[0]
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def put(self, name, mcf):
+        """insert or replace a single record"""
+
+        self.put_many([(name, mcf)])
+
+    def put_many(self, records):
+        """insert or replace (name, mcf) records in one transaction"""
+
+        rows = []
+        for name, mcf in records:
+            metadata = mcf.get('metadata', {})
+            rows.append((
+                name,
+                _column(metadata.get('identifier')),
+                _column(metadata.get('datestamp')),
+                _column(metadata.get('publish_date')),
+                _column(metadata.get('language')),
+                json.dumps(mcf, ensure_ascii=False, default=str)
+            ))
+
+        LOGGER.debug('Inserting {} records'.format(len(rows)))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO records (name, identifier, '
+                'datestamp, publish_date, language, mcf) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+        return len(rows)
+
+    def get(self, name):
+        """returns MCF dict of a record"""
+
+        cursor = self.connection.execute(
+            'SELECT mcf FROM records WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def delete(self, name):
+        """remove a record"""
+
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM records WHERE name = ?', (name,))
+
+    def names(self):
+        """returns sorted list of record names"""
+
+        cursor = self.connection.execute(
+            'SELECT name FROM records ORDER BY name')
+        return [row[0] for row in cursor]
+
+    def iter_records(self, where=None, params=(), sizes=False):
+        """
+        yields (name, mcf) of all records, in one sequential scan,
+        optionally filtered by an SQL where clause on the indexed columns;
+        with sizes, (name, mcf, size of the stored JSON)
+        """
+
+        sql = 'SELECT name, mcf FROM records'
+        if where is not None:
+            sql = '{} WHERE {}'.format(sql, where)
+
+        for name, mcf in self.connection.execute(sql, params):
+            if sizes:
+                yield name, json.loads(mcf), len(mcf)
+            else:
+                yield name, json.loads(mcf)
+
+    def close(self):
+        """close the store"""
+
+        self.connection.close()
@@ -0,0 +1,269 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2017 Government of Canada
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+import codecs
+from datetime import date
+import json
+import logging
+import os
+import re
+
+import click
+from six import string_types
+import yaml
+
+from pygeometa.core import get_schema_path, get_supported_schemas, read_mcf
+from pygeometa.fileio import find_sources, get_compression, read_text
+
+LOGGER = logging.getLogger(__name__)
+
+# declarative MCF schema file of a template directory
+SCHEMA_FILE = 'schema.yml'
+
+TYPES = ('string', 'number', 'date', 'list')
+
+DATE_RE = re.compile(r'^\d{4}(-\d{2}(-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?'
+                     r'(Z|[+-]\d{2}:?\d{2})?)?)?)?$')
+
+# magic keywords expanded by normalize_datestring
+DATE_KEYWORDS = ('$date$', '$year$')
+
+_VALIDATORS = {}
+
+
+def _empty(value):
+    return value is None or value == '' or value == []
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    if isinstance(value, string_types):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+def _is_date(value):
+    if isinstance(value, date):
+        return True
+    if isinstance(value, string_types):
+        value = value.strip()
+        return value in DATE_KEYWORDS or DATE_RE.match(value) is not None
+    return False
+
+
+CHECKS = {
+    'string': lambda value: isinstance(value, string_types),
+    'number': _is_number,
+    'date': _is_date,
+    'list': lambda value: isinstance(value, list)
+}
+
+
+def _compile_field(field, rule):
+    """returns function of an MCF section returning reasons for a field"""
+
+    types = rule.get('type', [])
+    if isinstance(types, string_types):
+        types = [types]
+    for type_ in types + [rule.get('items', 'string')]:
+        if type_ not in TYPES:
+            raise ValueError('Unknown type {} of field {}'.format(type_,
+                                                                  field))
+
+    required = rule.get('required', False)
+    type_checks = [CHECKS[t] for t in types]
+    item_check = CHECKS[rule['items']] if 'items' in rule else None
+    values = frozenset(rule['values']) if 'values' in rule else None
+    parallel_to = rule.get('parallel_to')
+
+    def parallel(section, value):
+        other = section.get(parallel_to)
+        if isinstance(other, list) != isinstance(value, list):
+            return ['{}:not_parallel'.format(field)]
+        if isinstance(value, list) and len(value) != len(other):
+            return ['{}:length'.format(field)]
+        return []
+
+    def check(section):
+        value = section.get(field)
+        if _empty(value):
+            reasons = ['{}:missing'.format(field)] if required else []
+            # an empty value is no match for a list the template loops
+            # over together with it (e.g. '' picks its scalar branch)
+            if parallel_to is not None and not _empty(
+                    section.get(parallel_to)):
+                reasons.extend(parallel(section, value))
+            return reasons
+
+        if type_checks and not any(c(value) for c in type_checks):
+            return ['{}:type'.format(field)]
+
+        reasons = []
+        items = value if isinstance(value, list) else [value]
+        if item_check is not None and isinstance(value, list):
+            if not all(_empty(i) or item_check(i) for i in items):
+                reasons.append('{}:item_type'.format(field))
+        if values is not None:
+            if not all(i in values for i in items
+                       if isinstance(i, string_types) and i.strip()):
+                reasons.append('{}:value'.format(field))
+        if parallel_to is not None:
+            reasons.extend(parallel(section, value))
+        return reasons
+
+    return check
+
+
+class Validator(object):
+    """
+    checks MCF dicts against a declarative schema of sections and field
+    rules, compiled once into per-field checks
+    """
+
+    def __init__(self, schema):
+        self.checks = []
+        for section, fields in schema.items():
+            for field, rule in sorted(fields.items()):
+                self.checks.append((section, _compile_field(field, rule)))
+        self.sections = sorted(schema)
+
+    def validate(self, mcf):
+        """
+        returns list of machine-readable reasons, field:code, why an MCF
+        dict cannot be rendered (empty if valid).  Codes are missing,
+        type, item_type, value, not_parallel and length
+        """
+
+        reasons = []
+        for section in self.sections:
+            if not isinstance(mcf.get(section), dict):
+                reasons.append('{}:missing'.format(section))
+        for section, check in self.checks:
+            if isinstance(mcf.get(section), dict):
+                reasons.extend(check(mcf[section]))
+        return reasons
+
+
+def load_validator(path):
+    """returns Validator of a schema file, loaded once"""
+
+    if path not in _VALIDATORS:
+        LOGGER.debug('Loading MCF schema {}'.format(path))
+        with codecs.open(path, encoding='utf-8') as fh:
+            _VALIDATORS[path] = Validator(yaml.safe_load(fh))
+    return _VALIDATORS[path]
+
+
+def get_validator(schema=None, schema_local=None):
+    """
+    returns Validator of the MCF schema of a template directory, or
+    None if the template has no schema
+    """
+
+    path = os.path.join(get_schema_path(schema, schema_local)[0],
+                        SCHEMA_FILE)
+    if path not in _VALIDATORS and not os.path.exists(path):
+        return None
+    return load_validator(path)
+
+
+@click.command()
+@click.pass_context
+@click.option('--schema',
+              type=click.Choice(get_supported_schemas()),
+              help='Metadata schema (default: dts_template)')
+@click.option('--schema_local',
+              type=click.Path(exists=True, resolve_path=True,
+                              dir_okay=True, file_okay=False),
+              help='Locally defined metadata schema')
+@click.option('--format', 'format_', type=click.Choice(['text', 'json']),
+              default='text', help='Output format (json: one object per '
+                                   'MCF)')
+@click.argument('mcf', nargs=-1, required=True,
+                type=click.Path(exists=True, resolve_path=True))
+def lint(ctx, schema, schema_local, format_, mcf):
+    """check MCF files or directories of MCFs against a template schema"""
+
+    if schema is None and schema_local is None:
+        schema = 'dts_template'
+    validator = get_validator(schema, schema_local)
+    if validator is None:
+        raise click.UsageError('Template has no {}'.format(SCHEMA_FILE))
+
+    total = invalid = 0
+    for path in mcf:
+        # recursive: ymls_dts_dir may have the hash layout
+        sources = (find_sources(path, '.yml', recursive=True)
+                   if os.path.isdir(path) else [path])
+        for mcf_path in sources:
+            total += 1
+            try:
+                # plain files are read by path, for base_mcf includes
+                reasons = validator.validate(read_mcf(
+                    read_text(mcf_path) if get_compression(mcf_path)
+                    else mcf_path))
+            except Exception as err:
+                reasons = ['mcf:unreadable']
+                LOGGER.debug('{}: {}'.format(mcf_path, err))
+            if reasons:
+                invalid += 1
+            if format_ == 'json':
+                click.echo(json.dumps({'mcf': mcf_path, 'valid': not reasons,
+                                       'reasons': reasons}))
+            elif reasons:
+                click.echo('{}\t{}'.format(mcf_path, ' '.join(reasons)))
+
+    if format_ == 'text':
+        click.echo('{} of {} MCFs invalid'.format(invalid, total))
+    if invalid:
+        ctx.exit(1)
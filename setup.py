@@ -151,7 +151,7 @@ def find_packages_templates(location='.'):
         if 'templates' in dirs:  # include as a package_data key
             packages.append(root.replace(os.sep, '.').replace('..', ''))
 
-    return {'pygeometa': ['templates/*/*.j2']}
+    return {'pygeometa': ['templates/*/*.j2', 'templates/*/*.yml']}
     return packages
 
 
@@ -0,0 +1,107 @@
+# =================================================================
+#
+# Terms and Conditions of Use
+#
+# Unless otherwise noted, computer program source code of this
+# distribution # is covered under Crown Copyright, Government of
+# Canada, and is distributed under the MIT License.
+#
+# The Canada wordmark and related graphics associated with this
+# distribution are protected under trademark law and copyright law.
+# No permission is granted to use them outside the parameters of
+# the Government of Canada's corporate identity program. For
+# more information, see
+# http://www.tbs-sct.gc.ca/fip-pcim/index-eng.asp
+#
+# Copyright title to all 3rd party software distributed with this
+# software is held by the respective copyright holders as noted in
+# those files. Users are asked to read the 3rd Party Licenses
+# referenced with those assets.
+#
+# Copyright (c) 2015 Government of Canada
+# Copyright (c) 2016 ERT Inc.
+# Copyright (c) 2017 Tom Kralidis
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# =================================================================
+
+
+"""
+benchmarks of pygeometa batch processing
+
+usage: python tests/benchmark.py [number of records]
+"""
+
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+from pygeometa.core import read_mcf
+from pygeometa.record import MCFRecord
+
+THISDIR = os.path.dirname(os.path.realpath(__file__))
+SAMPLES = os.path.join(THISDIR, '..', 'ymls_dts_dir', '*.yml')
+
+
+def _fresh(value):
+    """copy a value with new string objects, as parsing each file would"""
+
+    if isinstance(value, dict):
+        return dict((k, _fresh(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_fresh(v) for v in value]
+    if isinstance(value, str):
+        return (value + '.')[:-1]
+    return value
+
+
+def measure(label, build, count):
+    """report memory held by count records built with function build"""
+
+    tracemalloc.start()
+    start = time.time()
+    records = [build(i) for i in range(count)]
+    elapsed = time.time() - start
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('{:<24}{:>10.1f} MB per {} records {:>8.0f} B/record '
+          '{:>6.2f}s'.format(label, current / 1048576.0, count,
+                             current / float(count), elapsed))
+    return records
+
+
+def bench_records(count=10000):
+    """memory per batch of records: MCF dicts versus MCFRecord"""
+
+    mcfs = [read_mcf(path)['metadata'] for path in sorted(glob.glob(SAMPLES))]
+
+    measure('MCF dict', lambda i: _fresh(mcfs[i % len(mcfs)]), count)
+    measure('MCFRecord', lambda i: MCFRecord.from_mcf(
+        _fresh(mcfs[i % len(mcfs)])), count)
+
+
+if __name__ == '__main__':
+    bench_records(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -45,14 +45,53 @@
 #
 # =================================================================
 
+import codecs
+import glob
+import gzip
+import json
 import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import warnings
+import zipfile
+from xml.etree import ElementTree as etree
 
-from six import text_type
+from click.testing import CliRunner
+from six import StringIO, text_type
+from six.moves import BaseHTTPServer, socketserver
 import yaml
 
-from pygeometa.core import (read_mcf, pretty_print, render_template,
-                            get_charstring, get_supported_schemas)
+from pygeometa.changes import (Manifest, canonical_hash, write_atom,
+                               write_jsonl)
+from pygeometa import changes, fileio
+from pygeometa.completeness import CompletenessStats, completeness
+from pygeometa.contacts import (HREF_PATTERN, ContactRegistry,
+                                contact_references, record_href,
+                                registry_name)
+from pygeometa.core import (MCFSection, read_mcf, pretty_print,
+                            render_template, render_batch, get_charstring,
+                            generate_metadata, get_supported_schemas,
+                            get_template_fields)
+from pygeometa.emitter import render_tree
+from pygeometa.fileio import (COMPRESSIONS, AtomicWriter, find_sources,
+                              layout_path, open_output, parse_xml, read_text,
+                              source_name)
+from pygeometa.linkcheck import LinkChecker
+from pygeometa.migrations import migrate, migrate_batch
+from pygeometa.quality import SERBIA_EXTENT, check_batch
+from pygeometa.record import MCFRecord
+from pygeometa.profiling import Profiler
+from pygeometa.report import RunReport, merge_reports, parse_shard, shard_of
+from pygeometa.reproject import parse_epsg, reproject_batch
+from pygeometa.scheduler import Scheduler
+from pygeometa.search import CatalogueIndex, build_index, fold
+from pygeometa.sniff import sniff
+from pygeometa.store import MCFStore, store_uri
+from pygeometa.validation import Validator, get_validator, lint
 
 THISDIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -152,6 +191,32 @@ class PygeometaTest(unittest.TestCase):
                                 {'title_fr': 'foo', 'title_en': 'bar'}, 'fr')
         self.assertEqual(values, [None, None], 'Expected specific values')
 
+    def test_language_index(self):
+        """test per-section language index built by read_mcf"""
+
+        mcf = read_mcf(get_abspath('../sample.yml'))
+        section = mcf['identification']
+        self.assertIsInstance(section, MCFSection, 'Expected indexed section')
+        self.assertIsInstance(mcf['contact']['main'], MCFSection,
+                              'Expected indexed subsection')
+        self.assertEqual(get_charstring('title', section, 'en', 'fr'),
+                         [section['title_en'], section['title_fr']],
+                         'Expected multilingual values')
+
+        section = MCFSection({'title_srb_lat': 'foo', 'title': 'bar'})
+        self.assertEqual(get_charstring('title', section, 'srb_lat'),
+                         ['foo', None], 'Expected language with underscore')
+        self.assertEqual(get_charstring('title', section, 'eng', 'srb_lat'),
+                         ['bar', 'foo'], 'Expected unsuffixed fallback')
+        section['title_eng'] = 'baz'
+        self.assertEqual(get_charstring('title', section, 'eng'),
+                         ['baz', None], 'Expected index rebuilt on change')
+
+        section = pickle.loads(pickle.dumps(section))
+        self.assertIsInstance(section, MCFSection, 'Expected pickled section')
+        self.assertEqual(yaml.safe_load(yaml.dump(section)), dict(section),
+                         'Expected section dumped as a mapping')
+
     def test_get_supported_schemas(self):
         """Test supported schemas"""
 
@@ -206,6 +271,1105 @@ class PygeometaTest(unittest.TestCase):
 
         self.assertIsInstance(mcf, dict, 'Expected dict')
 
+    def test_catalogue_index(self):
+        """test script-folded full-text index"""
+
+        self.assertEqual(fold(u'Đerdap Љубовија'), u'djerdap ljubovija',
+                         'Expected folded text')
+
+        index = CatalogueIndex()
+        index.add('a', read_mcf(get_abspath(
+            '../ymls_dts_dir/md_DOF10_SRP_lat.yml')))
+        index.add('b', {'metadata': {'title': u'Digitalni model terena',
+                                     'keywords': [u'Elevation']}})
+
+        results = index.search(u'ортофото')
+        self.assertEqual(results[0][0], 'a', 'Expected Cyrillic match')
+        results = index.search(u'ortofoto')
+        self.assertEqual(results[0][0], 'a', 'Expected Latin match')
+        results = index.search(u'дигитални модел')
+        self.assertEqual([r[0] for r in results], ['b', 'a'],
+                         'Expected ranked results')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            index.save(os.path.join(tmpdir, 'index.dat'))
+            index2 = CatalogueIndex(os.path.join(tmpdir, 'index.dat'))
+            self.assertEqual(index2.search(u'modela terena'),
+                             index.search(u'modela terena'),
+                             'Expected identical results after reload')
+            index2.add('b', {'metadata': {'title': u'Ortofoto'}})
+            self.assertEqual(index2.search(u'teren'), [],
+                             'Expected replaced record')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_catalogue_index_shared_identifier(self):
+        """test records sharing a fileIdentifier are indexed by name"""
+
+        index = CatalogueIndex()
+        for name, title in (('md_a', u'Ortofoto Beograd'),
+                            ('md_b', u'Ortofoto Novi Sad')):
+            index.add(name, {'metadata': {'identifier': 'shared',
+                                          'title': title}})
+
+        self.assertEqual(len(index), 2, 'Expected both records indexed')
+        results = index.search(u'ortofoto')
+        self.assertEqual(sorted(r[0] for r in results), ['md_a', 'md_b'],
+                         'Expected both records found')
+        self.assertEqual(set(r[3] for r in results), set(['shared']),
+                         'Expected stored fileIdentifier')
+
+        other = CatalogueIndex()
+        other.add('md_c', {'metadata': {'identifier': 'shared',
+                                        'title': u'Ortofoto Niš'}})
+        index.merge(other)
+        self.assertEqual(len(index.search(u'ortofoto')), 3,
+                         'Expected merged records kept')
+
+    def test_mcf_store(self):
+        """test SQLite MCF store"""
+
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'catalogue.db')
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        identifier = mcf['metadata']['identifier']
+
+        try:
+            with MCFStore(path) as store:
+                count = store.put_many([('md_DOF10', mcf),
+                                        ('other', {'metadata': {}})])
+                self.assertEqual(count, 2, 'Expected 2 inserted records')
+                store.put('md_DOF10', mcf)
+                self.assertEqual(len(store), 2, 'Expected replaced record')
+                self.assertEqual(store.get('md_DOF10'), mcf,
+                                 'Expected identical MCF')
+                rows = list(store.iter_records('identifier = ?',
+                                               (identifier,)))
+                self.assertEqual(rows, [('md_DOF10', mcf)],
+                                 'Expected filtered rows')
+
+                xml = render_template(rows[0][1], schema_local=get_abspath(
+                    '../pygeometa/templates/dts_template_srb_lat'))
+                self.assertTrue(identifier in xml, 'Expected identifier')
+
+            mcf2 = read_mcf(store_uri(path, 'md_DOF10'))
+            self.assertEqual(mcf2, mcf, 'Expected identical MCF')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_mcf_record(self):
+        """test compact record representation"""
+
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        record = MCFRecord.from_mcf(mcf)
+
+        self.assertFalse(hasattr(record, '__dict__'), 'Expected slots')
+        mcf['metadata']['reference_system'] = None  # not in sample MCF
+        self.assertEqual(record.to_mcf(), mcf, 'Expected identical MCF')
+        self.assertEqual(record.dist_format, ('TIFF', 'MrSID', 'ECW'),
+                         'Expected tuple')
+
+        email = ''.join(['tik', '@rgz.gov.rs'])
+        record2 = MCFRecord(organisation_emailAddress=email)
+        self.assertTrue(record2.organisation_emailAddress is
+                        record.organisation_emailAddress,
+                        'Expected interned string')
+
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record,
+                         'Expected picklable record')
+
+    def test_check_batch(self):
+        """test vectorized extent and date checks"""
+
+        def record(w, e, s, n, begin='', end=''):
+            return MCFRecord(bounding_box_w=w, bounding_box_e=e,
+                             bounding_box_s=s, bounding_box_n=n,
+                             t_extnt_beginPosition=begin,
+                             t_extnt_endPosition=end)
+
+        records = [
+            record('18.95', '23', '41.8', '46.2', '2011-01-01', '2014-06-08'),
+            record('23', '18.95', '41.8', '46.2'),
+            record('41.8', '46.2', '18.95', '23'),
+            record('7400000', '7600000', '4600000', '5100000'),
+            record('18.95', '23', '', '46.2'),
+            record('18.95', '23', '41.8', '96.2'),
+            record('18.95', '23', '41.8', '46.2', '2014-06-08', '2011-01-01')
+        ]
+
+        results = check_batch(records, region=SERBIA_EXTENT)
+        self.assertEqual([r[0] for r in results], [
+            [], ['bbox_west_gt_east'], ['bbox_latlon_swapped'],
+            ['bbox_projected'], ['bbox_missing'], ['bbox_out_of_range'],
+            ['temporal_begin_gt_end']], 'Expected specific failures')
+        self.assertEqual(records[1].bounding_box_w, '23', 'Expected no fix')
+
+        results = check_batch(records, autofix=True, region=SERBIA_EXTENT)
+        self.assertEqual([bool(r[0]) for r in results],
+                         [False, False, False, True, True, True, False],
+                         'Expected fixed records to pass')
+        for r in (records[1], records[2]):
+            self.assertEqual((r.bounding_box_w, r.bounding_box_e,
+                              r.bounding_box_s, r.bounding_box_n),
+                             ('18.95', '23', '41.8', '46.2'),
+                             'Expected fixed bounding box')
+        self.assertEqual(records[6].t_extnt_beginPosition, '2011-01-01',
+                         'Expected fixed temporal extent')
+
+        self.assertEqual(check_batch([]), [], 'Expected empty result')
+
+        # begins before it ends in UTC, not in the local times given
+        records = [record('18.95', '23', '41.8', '46.2',
+                          '2014-06-08T01:00:00+03:00', '2014-06-07T23:00Z')]
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertEqual(check_batch(records), [([], [])],
+                             'Expected offsets applied')
+
+    def test_reproject_batch(self):
+        """test vectorized bounding box reprojection"""
+
+        self.assertEqual(parse_epsg('http://www.opengis.net/def/crs/EPSG/0/'
+                                    '3046'), 3046, 'Expected EPSG code')
+        self.assertEqual(parse_epsg('EPSG:31277'), 31277,
+                         'Expected EPSG code')
+        self.assertEqual(parse_epsg('WGS 84'), None, 'Expected no code')
+
+        records = [
+            MCFRecord(bounding_box_w='18.95', bounding_box_e='23',
+                      bounding_box_s='41.8', bounding_box_n='46.2'),
+            MCFRecord(bounding_box_w='457306.6886',
+                      bounding_box_e='457306.6886',
+                      bounding_box_s='4963096.8136',
+                      bounding_box_n='4963096.8136',
+                      reference_system='urn:ogc:def:crs:EPSG::25834'),
+            MCFRecord(bounding_box_w='7380000', bounding_box_e='7540000',
+                      bounding_box_s='4900000', bounding_box_n='5000000')
+        ]
+
+        codes = reproject_batch(records)
+        self.assertEqual(codes, [None, 25834, 31277], 'Expected EPSG codes')
+        self.assertEqual(records[0].bounding_box_w, '18.95',
+                         'Expected untouched bounding box')
+        self.assertAlmostEqual(float(records[1].bounding_box_w), 20.46, 5)
+        self.assertAlmostEqual(float(records[1].bounding_box_s), 44.82, 5)
+
+        # densified edges extend beyond the corners of the box
+        record = records[2]
+        self.assertTrue(19.4 < float(record.bounding_box_w) < 19.5)
+        self.assertTrue(21.5 < float(record.bounding_box_e) < 21.6)
+        self.assertTrue(44.2 < float(record.bounding_box_s) < 44.3)
+        self.assertTrue(45.1 < float(record.bounding_box_n) < 45.2)
+
+    def test_render_tree(self):
+        """test conformance of tree emitter with RGA templates"""
+
+        def canonical(element):
+            return (element.tag,
+                    sorted((k, ' '.join(v.split()))
+                           for k, v in element.attrib.items()),
+                    ' '.join((element.text or '').split()),
+                    [canonical(child) for child in element])
+
+        mcfs = sorted(glob.glob(get_abspath('../ymls_dts_dir/*.yml')))[::6]
+        for schema in ['dts_template_eng', 'dts_template_srb_cyr',
+                       'dts_template_srb_lat']:
+            schema_local = get_abspath('../pygeometa/templates/{}'.format(
+                                       schema))
+            for mcf in mcfs:
+                xml = render_tree(mcf, schema)
+                self.assertIsInstance(xml, text_type,
+                                      'Expected unicode string')
+                self.assertEqual(
+                    canonical(etree.fromstring(xml.encode('utf-8'))),
+                    canonical(etree.fromstring(render_template(
+                        mcf, schema_local=schema_local).encode('utf-8'))),
+                    'Expected same content as {} for {}'.format(schema, mcf))
+
+    def test_migrate_batch(self):
+        """test batch migration of old MCF files"""
+
+        tmpdir = tempfile.mkdtemp()
+        indir = os.path.join(tmpdir, 'in')
+        outdir = os.path.join(tmpdir, 'out')
+        os.makedirs(os.path.join(indir, 'sub'))
+
+        ini = '[metadata]\nidentifier=abc\n\n[contact:main]\norganization=X\n'
+        for name in ['a.ini', os.path.join('sub', 'b.ini')]:
+            with open(os.path.join(indir, name), 'w') as fh:
+                fh.write(ini)
+        with open(os.path.join(indir, 'bad.ini'), 'w') as fh:
+            fh.write('no section header\n')
+
+        try:
+            results = migrate_batch([indir], outdir, workers=2)
+            statuses = sorted(status for _, _, status in results)
+            self.assertEqual(statuses[1:], ['migrated', 'migrated'],
+                             'Expected migrated files')
+            self.assertTrue(statuses[0].startswith('MissingSection'),
+                            'Expected failure message')
+
+            with open(os.path.join(outdir, 'sub', 'b.yml')) as fh:
+                mcf = yaml.safe_load(fh)
+            self.assertEqual(mcf['contact']['main']['organization'], 'X',
+                             'Expected nested contact')
+
+            results = list(migrate_batch([os.path.join(indir, '*.ini')],
+                                         outdir))
+            self.assertEqual(sorted(status for _, _, status in results)[1],
+                             'skipped', 'Expected up to date file skipped')
+
+            with open(os.path.join(indir, 'sub', 'a.ini'), 'w') as fh:
+                fh.write(ini)
+            results = list(migrate_batch(
+                [os.path.join(indir, 'a.ini'),
+                 os.path.join(indir, 'sub', 'a.ini'),
+                 os.path.join(indir, 'missing.ini'),
+                 os.path.join(indir, '*.cfg')], outdir, force=True))
+            self.assertEqual(len(results), 4, 'Expected every input')
+            self.assertEqual([r[2].split()[0] for r in results
+                              if r[1] is None], ['Same', 'No', 'No'],
+                             'Expected clash and unmatched paths failed')
+
+            runner = CliRunner()
+            result = runner.invoke(migrate, [
+                '--mcf', os.path.join(indir, 'mising.ini'),
+                '--output-dir', outdir])
+            self.assertEqual(result.exit_code, 1, 'Expected failure exit')
+            self.assertIn('mising.ini', result.output,
+                          'Expected unmatched path reported')
+            result = runner.invoke(migrate, [
+                '--mcf', os.path.join(indir, 'mising.ini')])
+            self.assertIn('No such file', result.output,
+                          'Expected missing file reported')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_batch(self):
+        """test batch rendering with a shared environment"""
+
+        tmpdir = tempfile.mkdtemp()
+        mcfs = [get_abspath('../sample.yml'), get_abspath('unilingual.yml'),
+                get_abspath('missing.yml')]
+        pattern = os.path.join(tmpdir, '{schema}', '{name}.xml')
+
+        try:
+            results = dict((mcf, (output, error)) for mcf, output, error in
+                           render_batch(mcfs, pattern, schema='iso19139',
+                                        workers=2))
+            self.assertEqual([results[mcf][1] is None for mcf in mcfs],
+                             [True, True, False], 'Expected one failure')
+
+            output = os.path.join(tmpdir, 'iso19139', 'sample.xml')
+            self.assertEqual(results[mcfs[0]][0], output,
+                             'Expected output path')
+            with open(output, 'rb') as fh:
+                self.assertEqual(fh.read().decode('utf-8'), render_template(
+                                 mcfs[0], schema='iso19139'),
+                                 'Expected same output as render_template')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_batch_same_output(self):
+        """test batch rendering fails inputs sharing an output"""
+
+        tmpdir = tempfile.mkdtemp()
+        mcfs = []
+        for dirname in ['a', 'b']:
+            os.makedirs(os.path.join(tmpdir, dirname))
+            mcfs.append(os.path.join(tmpdir, dirname, 'foo.yml'))
+            shutil.copy(get_abspath('../sample.yml'), mcfs[-1])
+        pattern = os.path.join(tmpdir, 'out', '{name}.xml')
+        output = os.path.join(tmpdir, 'out', 'foo.xml')
+
+        try:
+            results = list(render_batch(mcfs, pattern, schema='iso19139'))
+            self.assertEqual(sorted(results)[0], (mcfs[0], output, None),
+                             'Expected first input rendered')
+            self.assertEqual(sorted(results)[1][:2], (mcfs[1], output),
+                             'Expected second input failed')
+            self.assertTrue(sorted(results)[1][2].startswith('Same output'),
+                            'Expected same output error')
+
+            # e.g. listed explicitly and through its directory
+            results = list(render_batch([mcfs[0], os.path.join(
+                tmpdir, 'a', '.', 'foo.yml')], pattern, schema='iso19139',
+                workers=2))
+            self.assertEqual(results, [(mcfs[0], output, None)],
+                             'Expected input given twice rendered once')
+
+            runner = CliRunner()
+            result = runner.invoke(generate_metadata, [
+                '--mcf', os.path.join(tmpdir, 'a'),
+                '--mcf', os.path.join(tmpdir, 'b'),
+                '--schema', 'iso19139', '--output-dir',
+                os.path.join(tmpdir, 'out')])
+            self.assertEqual(result.exit_code, 1, 'Expected failure exit')
+            self.assertIn('failed 1', result.output, 'Expected one failure')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_run_report(self):
+        """test shard assignment and merging of run reports"""
+
+        self.assertEqual(parse_shard('2/3'), (2, 3), 'Expected shard tuple')
+        self.assertRaises(ValueError, parse_shard, '4/3')
+        self.assertRaises(ValueError, parse_shard, 'all')
+
+        names = ['md_{}.xml'.format(i) for i in range(300)]
+        shards = [shard_of(name, 3) for name in names]
+        self.assertEqual(shard_of('md_0.xml', 3), shards[0],
+                         'Expected stable assignment')
+        self.assertEqual(sorted(set(shards)), [1, 2, 3],
+                         'Expected all shards used')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for number in [1, 2]:
+                report = RunReport((number, 2))
+                for name in names[:10]:
+                    if shard_of(name, 2) == number:
+                        report.add(name, 'converted')
+                paths.append(os.path.join(tmpdir, '{}.json'.format(number)))
+                report.finish()
+                report.save(paths[-1])
+
+            merged = RunReport()
+            merged.merge(RunReport.load(paths[0]))
+            self.assertEqual(merged.missing_shards(), ['2/2'],
+                             'Expected missing shard')
+            merged.merge(RunReport.load(paths[1]))
+            merged.add(names[0], 'quarantined', ['bbox_missing'])
+            self.assertEqual(merged.missing_shards(), [], 'Expected no gaps')
+            self.assertEqual(merged.conflicts, [], 'Expected no conflicts')
+            self.assertEqual(merged.summary(), {'converted': 9,
+                                                'quarantined': 1,
+                                                'failed': 0},
+                             'Expected merged counts')
+            self.assertEqual(merged.quarantine_list(),
+                             [(names[0], 'quarantined', ['bbox_missing'])],
+                             'Expected quarantine list')
+
+            merged.merge(RunReport.load(paths[1]))
+            self.assertTrue(merged.conflicts, 'Expected conflicts')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_profiler(self):
+        """test profiling of rendering stages"""
+
+        tmpdir = tempfile.mkdtemp()
+        mcfs = [get_abspath('../sample.yml'), get_abspath('unilingual.yml')]
+        pattern = os.path.join(tmpdir, 'out', '{name}.xml')
+
+        try:
+            self.assertFalse(Profiler().enabled, 'Expected disabled')
+
+            with Profiler(tmpdir) as profiler, profiler.stage('render'):
+                results = list(render_batch(mcfs, pattern, 'iso19139',
+                                            workers=2, profiler=profiler))
+            self.assertEqual(len(results), 2, 'Expected rendered records')
+            self.assertEqual(len(profiler.records), 2,
+                             'Expected profile per record')
+
+            for name in ['profile.txt', 'render.prof', 'records.csv',
+                         'stacks.collapsed']:
+                self.assertTrue(os.path.exists(os.path.join(tmpdir, name)),
+                                'Expected {}'.format(name))
+
+            with open(os.path.join(tmpdir, 'profile.txt')) as fh:
+                report = fh.read()
+            self.assertTrue('macro get_freetext '
+                            '[common/iso19139-charstring.j2]' in report,
+                            'Expected template macro timing')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_xml(self):
+        """test binary XML input with encoding declaration"""
+
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'cp1250.xml')
+        xml = (u'<?xml version="1.0" encoding="windows-1250"?>\n'
+               u'<gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd"'
+               u' xmlns:xlink="http://www.w3.org/1999/xlink">'
+               u'<gmd:title xlink:href="#t">\u0160abac \u017ea\u010de'
+               u'</gmd:title></gmd:MD_Metadata>')
+
+        try:
+            with open(path, 'wb') as fh:
+                fh.write(xml.encode('cp1250'))
+
+            for threshold in [0, 1024 * 1024]:  # memory-mapped and read
+                root = parse_xml(path, mmap_threshold=threshold).getroot()
+                self.assertEqual(root.tag, 'MD_Metadata',
+                                 'Expected namespace stripped')
+                self.assertEqual(root[0].text, u'\u0160abac \u017ea\u010de',
+                                 'Expected decoded text')
+                self.assertEqual(root[0].attrib, {'href': '#t'},
+                                 'Expected attribute namespace stripped')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_compressed_sources(self):
+        """test compressed and zipped input and compressed output"""
+
+        tmpdir = tempfile.mkdtemp()
+        xml = b'<MD_Metadata><title>x</title></MD_Metadata>'
+
+        try:
+            for compression in COMPRESSIONS:
+                with open_output(os.path.join(tmpdir, 'md_{}.xml'.format(
+                                 compression[1:])), compression, 1) as fh:
+                    fh.write(xml)
+            with zipfile.ZipFile(os.path.join(tmpdir, 'b.zip'), 'w') as zf:
+                zf.writestr('sub/md_zip.xml', xml)
+                zf.writestr('readme.txt', b'')
+            with open(os.path.join(tmpdir, 'readme.txt'), 'w') as fh:
+                fh.write('not a source')
+
+            sources = list(find_sources(tmpdir))
+            self.assertEqual(sorted(source_name(s) for s in sources),
+                             sorted(['md_{}'.format(c[1:]) for c in
+                                     COMPRESSIONS] + ['md_zip']),
+                             'Expected compressed and zipped sources')
+
+            for source in sources:
+                root = parse_xml(source).getroot()
+                self.assertEqual(root[0].text, 'x', 'Expected parsed XML')
+
+            self.assertEqual(read_text(os.path.join(tmpdir, 'md_gz.xml.gz')),
+                             xml.decode('utf-8'), 'Expected decompressed')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_scheduler(self):
+        """test size-ordered scheduling with timeouts"""
+
+        jobs = [('small', 0.01, 1), ('large', 0.02, 3), ('bad', -1, 2)]
+
+        scheduler = Scheduler(sleep_job)
+        results = list(scheduler.run(jobs))
+        self.assertEqual([key for key, _, _ in results],
+                         ['large', 'bad', 'small'], 'Expected largest first')
+        self.assertEqual(results[1][2], 'ValueError: negative',
+                         'Expected error message')
+        self.assertEqual(scheduler.stats()['tasks'], [3], 'Expected tasks')
+
+        scheduler = Scheduler(sleep_job, workers=2, timeout=0.5)
+        results = dict((key, (result, error)) for key, result, error in
+                       scheduler.run(jobs + [('hang', 60, 4)]))
+        self.assertEqual(results['hang'], (None, 'timeout after 0.5s'),
+                         'Expected timeout')
+        self.assertEqual(results['small'], (0.01, None), 'Expected result')
+        self.assertEqual(sum(scheduler.stats()['tasks']), 4,
+                         'Expected all tasks counted')
+
+        scheduler = Scheduler(sleep_job, workers=1, max_tasks=2,
+                              max_rss=1024 ** 4)
+        results = list(scheduler.run([(i, 0, i) for i in range(8)]))
+        self.assertEqual(sorted(key for key, _, _ in results), list(range(8)),
+                         'Expected no records lost on recycling')
+        stats = scheduler.stats()
+        self.assertEqual(sum(stats['recycled']), 3, 'Expected recycles')
+        self.assertTrue(all(stats['peak_rss']), 'Expected peak memory')
+
+        produced = []
+
+        def stream():
+            for size in (1, 3, 2, 9, 8, 7):
+                produced.append(size)
+                yield (size, 0, size)
+
+        scheduler = Scheduler(sleep_job, window=3)
+        results = scheduler.run(stream())
+        self.assertEqual(next(results)[0], 3, 'Expected largest of window')
+        self.assertEqual(produced, [1, 3, 2], 'Expected bounded read ahead')
+        self.assertEqual([key for key, _, _ in results], [9, 8, 7, 2, 1],
+                         'Expected largest first within window')
+
+        scheduler = Scheduler(sleep_job, workers=2, timeout=5, window=2)
+        results = list(scheduler.run(stream()))
+        self.assertEqual(sorted(key for key, _, _ in results),
+                         [1, 2, 3, 7, 8, 9], 'Expected all windowed jobs')
+
+    def test_get_template_fields(self):
+        """test static analysis of fields read by a template"""
+
+        fields = get_template_fields(schema='iso19139')
+        self.assertIn('identifier', fields, 'Expected identifier field')
+        self.assertIn('language_alternate', fields, 'Expected field')
+        self.assertNotIn('title', fields, 'Expected metadata fields only')
+        self.assertIs(get_template_fields(schema='iso19139'), fields,
+                      'Expected cached fields')
+
+        self.assertIsNone(get_template_fields(schema='iso19139',
+                                              section='identification'),
+                          'Expected dynamic access to be undetermined')
+
+        fields = get_template_fields(schema_local=get_abspath(
+            '../pygeometa/templates/dts_template_srb_lat'))
+        self.assertIn('title', fields, 'Expected title field')
+        self.assertNotIn('hierarchylevel', fields, 'Expected unused field')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cases = [
+                (u"{{ record.metadata.get('abstract', '') }}"
+                 u"{{ record['metadata'].title }}",
+                 frozenset(['abstract', 'title'])),
+                (u"{% for k, v in record.metadata.items() %}{{ v }}"
+                 u"{% endfor %}", None),
+                (u"{{ record.get('metadata') }}", None)
+            ]
+            for number, (source, expected) in enumerate(cases):
+                schema_local = os.path.join(tmpdir, str(number))
+                os.makedirs(schema_local)
+                with codecs.open(os.path.join(schema_local, 'main.j2'), 'w',
+                                 encoding='utf-8') as fh:
+                    fh.write(source)
+                self.assertEqual(get_template_fields(
+                                 schema_local=schema_local), expected,
+                                 'Expected method calls handled')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_atomic_writer(self):
+        """test atomic output files with group commit"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'record.xml')
+            with AtomicWriter('batch', group_size=2) as writer:
+                for name in ('a', 'b', 'c'):
+                    with writer.open(os.path.join(tmpdir, name)) as fh:
+                        fh.write(name.encode('utf-8'))
+                self.assertEqual(sorted(os.listdir(tmpdir))[-2:], ['a', 'b'],
+                                 'Expected first group committed')
+                self.assertEqual(len(writer.pending), 1, 'Expected pending')
+            self.assertEqual(writer.commits, 2, 'Expected group commits')
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['a', 'b', 'c'],
+                             'Expected no temporary files')
+
+            # count file data syncs: one barrier per group, not per file
+            fsyncs = []
+            _fsync = fileio._fsync
+            fileio._fsync = lambda fh: fsyncs.append(fh) or _fsync(fh)
+            try:
+                with AtomicWriter('batch', group_size=4) as writer:
+                    for number in range(10):
+                        with writer.open(os.path.join(tmpdir,
+                                                      str(number))) as fh:
+                            fh.write(b'x')
+                self.assertEqual(writer.commits, 3, 'Expected 3 groups')
+                if fileio._syncfs is not None or hasattr(os, 'sync'):
+                    self.assertEqual(len(fsyncs), 0,
+                                     'Expected no per-file syncs')
+                    self.assertEqual(writer.syncs, 3,
+                                     'Expected one sync per group')
+
+                fsyncs = []
+                with AtomicWriter('file') as writer:
+                    for number in range(10):
+                        with writer.open(os.path.join(tmpdir,
+                                                      str(number))) as fh:
+                            fh.write(b'x')
+                self.assertEqual((len(fsyncs), writer.syncs), (10, 10),
+                                 'Expected one sync per file')
+            finally:
+                fileio._fsync = _fsync
+            for number in range(10):
+                os.remove(os.path.join(tmpdir, str(number)))
+
+            writer = AtomicWriter('file')
+            with self.assertRaises(RuntimeError):
+                with writer.open(path) as fh:
+                    fh.write(b'<trunc')
+                    raise RuntimeError('crash')
+            self.assertFalse(os.path.exists(path), 'Expected no output')
+            self.assertEqual(len(os.listdir(tmpdir)), 3,
+                             'Expected temporary file removed')
+
+            for compression in COMPRESSIONS:
+                writer = AtomicWriter('none', compression=compression)
+                with writer.open(path) as fh:
+                    fh.write(b'<xml/>')
+                self.assertEqual(read_text(path + compression), '<xml/>',
+                                 'Expected compressed output')
+
+            with self.assertRaises(ValueError):
+                AtomicWriter('always')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_sniff(self):
+        """test template routing from the start of XML files"""
+
+        header = (u'<?xml version="1.0" encoding="{}"?>\n<gmd:MD_Metadata '
+                  u'xmlns:gmd="http://www.isotc211.org/2005/gmd" '
+                  u'xmlns:gco="http://www.isotc211.org/2005/gco">'
+                  u'<gmd:language><gmd:LanguageCode codeListValue="{}">'
+                  u'</gmd:LanguageCode></gmd:language><gmd:title>'
+                  u'<gco:CharacterString>{}</gco:CharacterString>'
+                  u'</gmd:title>')
+        cases = [
+            ('utf-8', 'srp', u'Топографска карта Србије', 'srb_cyr'),
+            ('windows-1250', 'srp', u'Topografska karta Srbije', 'srb_lat'),
+            ('utf-8', 'eng', u'Topographic map of Serbia', 'eng'),
+            ('utf-8', 'ger', u'Топографска карта', 'srb_cyr')
+        ]
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'record.xml')
+            for encoding, language, title, rga_language in cases:
+                with open(path, 'wb') as fh:
+                    fh.write(header.format(encoding, language, title).encode(
+                        encoding, 'replace') + b'x' * 20000)
+                result = sniff(path)
+                self.assertTrue(result.iso, 'Expected ISO 19139')
+                self.assertEqual(result.language, language,
+                                 'Expected metadata language')
+                self.assertEqual(result.rga_language, rga_language,
+                                 'Expected template language')
+
+            with open(path, 'wb') as fh:
+                fh.write(b'<?xml version="1.0"?><csw:Record/>')
+            result = sniff(path)
+            self.assertFalse(result.iso, 'Expected non-ISO record')
+            self.assertIn('Record', result.reason, 'Expected reason')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_validator(self):
+        """test declarative MCF pre-validation"""
+
+        validator = get_validator('dts_template_srb_lat')
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        self.assertEqual(validator.validate(mcf), [], 'Expected valid MCF')
+
+        mcf['metadata'].update({
+            'title': '',
+            'inspireCategory': 'imageryBaseMapsEarthCover',
+            'datestamp': '04.11.2010',
+            'publish_date': ['2007-09-01', '2008-01-01'],
+            'dateTypeCode': ['creation', 'published'],
+            'bounding_box_w': 'west'
+        })
+        self.assertEqual(sorted(validator.validate(mcf)), [
+            'bounding_box_w:type', 'dateTypeCode:value',
+            'datestamp:type', 'inspireCategory:type', 'title:missing'],
+            'Expected reasons')
+
+        validator = Validator({'metadata': {'a': {'type': 'list',
+                                                  'parallel_to': 'b'}}})
+        self.assertEqual(validator.validate({'metadata': {'a': [1],
+                                                          'b': [1, 2]}}),
+                         ['a:length'], 'Expected length mismatch')
+        self.assertEqual(validator.validate({}), ['metadata:missing'],
+                         'Expected missing section')
+
+        # the template renders an empty string dateTypeCode as one date
+        validator = get_validator('dts_template_srb_lat')
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        mcf['metadata'].update({'publish_date': ['2007-09-01', '2008-01-01'],
+                                'dateTypeCode': ''})
+        self.assertEqual(validator.validate(mcf),
+                         ['dateTypeCode:not_parallel'],
+                         'Expected empty value not parallel to list')
+        self.assertRaises(Exception, render_template, mcf,
+                          'dts_template_srb_lat')
+        mcf['metadata']['dateTypeCode'] = []
+        self.assertEqual(validator.validate(mcf), ['dateTypeCode:length'],
+                         'Expected empty list length mismatch')
+
+    def test_completeness_stats(self):
+        """test streaming field completeness statistics"""
+
+        stats = CompletenessStats()
+        for organisation, title, lineage in [
+                (u'РГЗ', u'Карта', u'Скенирање'), (u'РГЗ', u'Karta', ''),
+                (u'РЗС', u'Map', None)]:
+            stats.add({'metadata': {'organization_name': organisation,
+                                    'language': 'sr', 'title': title,
+                                    'lineage': lineage}})
+
+        rows = dict(((r['dimension'], r['group']), r) for r in stats.rows())
+        self.assertEqual(len(stats), 3, 'Expected 3 records')
+        self.assertEqual(rows[('all', '')]['lineage'], 0.3333,
+                         'Expected lineage share')
+        self.assertEqual(rows[('organisation', u'РГЗ')]['records'], 2,
+                         'Expected records by organisation')
+        self.assertEqual(rows[('language', 'srb_cyr')]['title'], 1.0,
+                         'Expected language by script of title')
+        self.assertEqual(rows[('language', 'srb_lat')]['records'], 2,
+                         'Expected Latin records')
+
+        merged = CompletenessStats.from_dict(stats.to_dict())
+        merged.merge(stats)
+        self.assertEqual(len(merged), 6, 'Expected merged records')
+
+        # a record failing after it was counted
+        failed = {'metadata': {'organization_name': u'РЗС',
+                               'language': 'en', 'title': u'Failed'}}
+        rows = list(stats.rows())
+        stats.add(failed)
+        stats.remove(failed)
+        self.assertEqual(list(stats.rows()), rows, 'Expected record removed')
+
+        output = StringIO()
+        stats.write_csv(output)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('dimension,group,records'),
+                        'Expected CSV header')
+        self.assertEqual(len(lines), 1 + len(rows), 'Expected CSV rows')
+
+    def test_link_checker(self):
+        """test concurrent link checks against a local server"""
+
+        server = LinkServer(('127.0.0.1', 0), LinkHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        base = 'http://127.0.0.1:{}'.format(server.server_port)
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            cache = os.path.join(tmpdir, 'links.json')
+            urls = ['{}/{}'.format(base, p) for p in
+                    ('ok', 'missing', 'moved', 'nohead', 'ok')]
+            checker = LinkChecker(cache, workers=4, per_host=2)
+            results = checker.check(urls + ['www.example.org/x',
+                                            'ftp://example.org/x'])
+            self.assertEqual(len(results), 6, 'Expected distinct URLs')
+            self.assertTrue(results[urls[0]]['ok'], 'Expected ok link')
+            self.assertEqual(results[urls[1]]['status'], 404,
+                             'Expected broken link')
+            self.assertEqual(results[urls[2]]['url'], urls[0],
+                             'Expected redirect followed')
+            self.assertTrue(results[urls[3]]['ok'], 'Expected GET fallback')
+            self.assertFalse(results['www.example.org/x']['ok'],
+                             'Expected invalid URL')
+            self.assertIsNone(results['ftp://example.org/x']['ok'],
+                              'Expected unchecked scheme')
+
+            checker = LinkChecker(cache)
+            results = checker.check(urls)
+            self.assertEqual((checker.requests, checker.cached), (0, 4),
+                             'Expected cached results')
+
+            checker = LinkChecker(cache, ttl=0)
+            checker.check(urls[:1])
+            self.assertEqual(checker.requests, 1, 'Expected expired cache')
+
+            report = RunReport()
+            report.add_links(results, {urls[1]: ['md_a', 'md_b']})
+            self.assertEqual(report.broken_links(),
+                             [(urls[1], 404, None, ['md_a', 'md_b'])],
+                             'Expected broken link in report')
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmpdir)
+
+    def test_contact_registry(self):
+        """test responsible parties referenced from a shared registry"""
+
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        registry = ContactRegistry()
+        ids = registry.add(mcf)
+        self.assertEqual(registry.add(mcf), ids, 'Expected stable ids')
+        self.assertEqual(len(registry), len(set(ids)),
+                         'Expected deduplicated contacts')
+
+        mcf['contacts'] = contact_references(mcf, 'registry.xml#{id}')
+        self.assertEqual(mcf['contacts']['contact']['href'],
+                         'registry.xml#{}'.format(ids[0]),
+                         'Expected contact reference')
+
+        for xml in (render_template(mcf, 'dts_template_srb_lat'),
+                    render_tree(mcf)):
+            self.assertNotIn('CI_ResponsibleParty', xml,
+                             'Expected no inline responsible parties')
+            self.assertEqual(xml.count('xlink:href="registry.xml#'),
+                             len(ids), 'Expected xlink references')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'contacts.xml')
+            with open(path, 'wb') as fh:
+                fh.write(registry.to_xml())
+            self.assertEqual(ContactRegistry(path).entries, registry.entries,
+                             'Expected registry round trip')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_contact_registry_layout(self):
+        """test registry references of compressed hash layout records"""
+
+        self.assertEqual(record_href(HREF_PATTERN, 'name.xml'), HREF_PATTERN,
+                         'Expected flat layout href')
+        self.assertEqual(record_href('http://example.org/{id}',
+                                     os.path.join('ab', 'cd', 'name.xml')),
+                         'http://example.org/{id}', 'Expected absolute href')
+
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        registry = ContactRegistry()
+        ids = registry.add(mcf)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = layout_path(tmpdir, 'name.xml', 'hash')
+            href = record_href(HREF_PATTERN, os.path.relpath(path, tmpdir))
+            mcf['contacts'] = contact_references(mcf, href)
+            with AtomicWriter(compression='.gz') as writer:
+                with writer.open(path) as fh:
+                    fh.write(render_template(
+                        mcf, 'dts_template_srb_lat').encode('utf-8'))
+            registry.save(os.path.join(tmpdir, registry_name()))
+
+            with gzip.open(writer.path(path)) as fh:
+                xml = fh.read().decode('utf-8')
+            target, _, id_ = mcf['contacts']['contact']['href'].partition('#')
+            self.assertIn('xlink:href="{}'.format(target), xml,
+                          'Expected registry references')
+            self.assertEqual(id_, ids[0], 'Expected contact id')
+            self.assertEqual(ContactRegistry(os.path.join(
+                os.path.dirname(path), target)).entries, registry.entries,
+                'Expected href to resolve to the uncompressed registry')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_change_manifest(self):
+        """test change detection from canonical output hashes"""
+
+        mcf = read_mcf(get_abspath('../ymls_dts_dir/md_DOF10_SRP_lat.yml'))
+        xml = render_template(mcf, 'dts_template_srb_lat')
+        identifier, digest = canonical_hash(xml)
+        self.assertEqual(identifier, mcf['metadata']['identifier'],
+                         'Expected fileIdentifier')
+        self.assertEqual(canonical_hash(pretty_print(xml))[1], digest,
+                         'Expected formatting to be ignored')
+
+        # fallback form of Pythons without etree.canonicalize
+        canonical = changes._canonicalize(etree.fromstring(
+            xml.encode('utf-8')))
+        self.assertEqual(changes._canonicalize(etree.fromstring(
+            pretty_print(xml).encode('utf-8'))), canonical,
+            'Expected formatting to be ignored by the fallback')
+
+        mcf['metadata']['title'] = 'Changed'
+        changed = canonical_hash(render_template(mcf,
+                                                 'dts_template_srb_lat'))
+        self.assertNotEqual(changes._canonicalize(etree.fromstring(
+            render_template(mcf, 'dts_template_srb_lat').encode('utf-8'))),
+            canonical, 'Expected modification in the fallback form')
+        self.assertNotEqual(changed[1], digest, 'Expected modification')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'manifest.json')
+            manifest = Manifest(path)
+            manifest.update('a', identifier, digest)
+            manifest.update('b', identifier, digest)
+            manifest.save()
+
+            manifest = Manifest(path)
+            self.assertIsNone(manifest.update('a', identifier, digest),
+                              'Expected unchanged record')
+            self.assertEqual(manifest.update('c', *changed)['change'],
+                             'added', 'Expected added record')
+            self.assertEqual(manifest.missing(), ['b'],
+                             'Expected record not seen this run')
+            manifest.delete('b')
+            manifest.update('a', *changed)
+            self.assertEqual(manifest.summary(),
+                             {'added': 1, 'modified': 1, 'deleted': 1},
+                             'Expected change summary')
+            manifest.save()
+            self.assertEqual(sorted(Manifest(path).records), ['a', 'c'],
+                             'Expected manifest round trip')
+
+            feed = os.path.join(tmpdir, 'changes.jsonl')
+            write_jsonl(manifest.changes, feed)
+            with open(feed) as fh:
+                self.assertEqual([json.loads(line)['change'] for line in fh],
+                                 ['added', 'deleted', 'modified'],
+                                 'Expected JSON Lines feed')
+
+            feed = os.path.join(tmpdir, 'changes.atom')
+            write_atom(manifest.changes, feed,
+                       link='https://example.org/{identifier}')
+            entries = etree.parse(feed).getroot().findall(
+                '{http://www.w3.org/2005/Atom}entry')
+            self.assertEqual(len(entries), 3, 'Expected Atom entries')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_find_sources_layout(self):
+        """test streaming, recursive and filtered discovery and layouts"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for path in ('a_lat.xml', 'b_cyr.xml', 'c.yml', '.d_lat.xml',
+                         'lat/e_lat.xml', 'lat/sub/f_lat.xml'):
+                path = os.path.join(tmpdir, *path.split('/'))
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'w') as fh:
+                    fh.write('<x/>')
+
+            def names(**kwargs):
+                return sorted(source_name(s) for s in
+                              find_sources(tmpdir, **kwargs))
+
+            self.assertEqual(next(find_sources(tmpdir, '.yml')),
+                             os.path.join(tmpdir, 'c.yml'),
+                             'Expected sources yielded as found')
+            self.assertEqual(names(), ['a_lat', 'b_cyr'],
+                             'Expected top level, visible sources')
+            self.assertEqual(names(recursive=True),
+                             ['a_lat', 'b_cyr', 'e_lat', 'f_lat'],
+                             'Expected sources of subdirectories')
+            self.assertEqual(names(recursive=True, include=['*_lat.xml'],
+                                   exclude=['lat/sub/*']),
+                             ['a_lat', 'e_lat'], 'Expected filtered sources')
+
+            self.assertEqual(layout_path('out', 'a.xml'),
+                             os.path.join('out', 'a.xml'),
+                             'Expected flat layout')
+            path = layout_path(tmpdir, 'a.xml', 'hash')
+            self.assertEqual(len(os.path.relpath(path, tmpdir).split(
+                             os.sep)), 3, 'Expected hash prefix directories')
+            self.assertEqual(path, layout_path(tmpdir, 'a.xml', 'hash'),
+                             'Expected stable layout')
+            with AtomicWriter(durability='file') as writer:
+                with writer.open(path) as fh:
+                    fh.write(b'<x/>')
+            self.assertTrue(os.path.isfile(path),
+                            'Expected layout directories created')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_contact_registry_shards(self):
+        """test per-shard contact registries merged with the reports"""
+
+        self.assertEqual(registry_name(), 'contacts.xml',
+                         'Expected shared registry')
+        self.assertNotEqual(registry_name((1, 2)), registry_name((2, 2)),
+                            'Expected one registry per shard')
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ids = set()
+            args = ['--output', os.path.join(tmpdir, 'report.json'),
+                    '--contacts', os.path.join(tmpdir, 'contacts.xml')]
+            for number, name in ((1, 'md_DOF10_SRP_lat'),
+                                 (2, '_md_DMT 10m_SRP_lat')):
+                registry = ContactRegistry()
+                ids.update(registry.add(read_mcf(get_abspath(
+                    '../ymls_dts_dir/{}.yml'.format(name)))))
+                path = os.path.join(tmpdir, registry_name((number, 2)))
+                with open(path, 'wb') as fh:
+                    fh.write(registry.to_xml())
+                args.extend(['--shard-contacts', path])
+                report = RunReport((number, 2))
+                report.add(name, 'converted')
+                report.save(os.path.join(tmpdir, '{}.json'.format(number)))
+                args.append(os.path.join(tmpdir, '{}.json'.format(number)))
+
+            # an entry edited in the merged registry of an earlier run
+            edited = ContactRegistry()
+            id_ = sorted(ids)[0]
+            edited.entries[id_] = (u'Edited', u'', u'pointOfContact')
+            with open(os.path.join(tmpdir, 'contacts.xml'), 'wb') as fh:
+                fh.write(edited.to_xml())
+
+            result = CliRunner().invoke(merge_reports, args)
+            self.assertEqual(result.exit_code, 0, result.output)
+            merged = ContactRegistry(os.path.join(tmpdir, 'contacts.xml'))
+            self.assertEqual(set(merged.entries), ids,
+                             'Expected contacts of both shards')
+            self.assertEqual(merged.entries[id_][0], u'Edited',
+                             'Expected edited entry kept')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_completeness_shards(self):
+        """test per-shard completeness merged with the reports"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            total = CompletenessStats()
+            args = ['--output', os.path.join(tmpdir, 'report.json'),
+                    '--completeness', os.path.join(tmpdir, 'all.json')]
+            for number, title in ((1, u'Карта'), (2, u'Map')):
+                stats = CompletenessStats()
+                stats.add({'metadata': {'organization_name': u'РГЗ',
+                                        'language': 'sr', 'title': title}})
+                total.merge(stats)
+                path = os.path.join(tmpdir, 'completeness.{}.json'.format(
+                                    number))
+                with codecs.open(path, 'w', encoding='utf-8') as fh:
+                    stats.write_json(fh)
+                args.extend(['--shard-completeness', path])
+                report = RunReport((number, 2))
+                report.add(title, 'converted')
+                report.save(os.path.join(tmpdir, '{}.json'.format(number)))
+                args.append(os.path.join(tmpdir, '{}.json'.format(number)))
+
+            result = CliRunner().invoke(merge_reports, args)
+            self.assertEqual(result.exit_code, 0, result.output)
+            with codecs.open(os.path.join(tmpdir, 'all.json'),
+                             encoding='utf-8') as fh:
+                merged = json.load(fh)
+            self.assertEqual(merged['rows'], list(total.rows()),
+                             'Expected completeness of both shards')
+            self.assertEqual(merged['rows'][0]['records'], 2,
+                             'Expected records of both shards')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_layout_commands(self):
+        """test MCF commands reading a compressed, hash layout directory"""
+
+        names = ['md_DOF10_SRP_lat', '_md_DMT 10m_SRP_lat']
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name, compression in zip(names, [None, '.gz']):
+                path = layout_path(tmpdir, name + '.yml', 'hash')
+                os.makedirs(os.path.dirname(path))
+                with open(get_abspath('../ymls_dts_dir/{}.yml'.format(
+                          name)), 'rb') as fh:
+                    content = fh.read()
+                with open_output(path, compression) as fh:
+                    fh.write(content)
+
+            runner = CliRunner()
+            result = runner.invoke(lint, ['--format', 'json', tmpdir])
+            results = [json.loads(line) for line in result.output.splitlines()]
+            self.assertEqual(len(results), 2, 'Expected all MCFs linted')
+            self.assertNotIn('mcf:unreadable', sum(
+                             [r['reasons'] for r in results], []),
+                             'Expected compressed MCFs read')
+
+            index_path = os.path.join(tmpdir, 'index.json.z')
+            result = runner.invoke(build_index, ['--index', index_path,
+                                                 tmpdir])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(sorted(CatalogueIndex(index_path).docs),
+                             sorted(names), 'Expected all MCFs indexed')
+
+            result = runner.invoke(completeness, ['--format', 'json',
+                                                  tmpdir])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(json.loads(result.output)['rows'][0]['records'],
+                             2, 'Expected completeness of all MCFs')
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 def get_abspath(filepath):
     """helper function absolute file access"""
@@ -213,5 +1377,46 @@ def get_abspath(filepath):
     return os.path.join(THISDIR, filepath)
 
 
+def sleep_job(seconds):
+    """helper function for scheduler tests"""
+
+    if seconds < 0:
+        raise ValueError('negative')
+    time.sleep(seconds)
+    return seconds
+
+
+class LinkServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """stand-in HTTP server for link checker tests"""
+
+    daemon_threads = True
+
+
+class LinkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """replies by path: ok, missing, moved (to ok) and nohead (GET only)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        if self.path == '/nohead':
+            return self.reply(405)
+        if self.path == '/moved':
+            return self.reply(301, {'Location': '/ok'})
+        self.reply(200 if self.path in ('/ok', '/nohead') else 404)
+
+    def do_GET(self):
+        self.do_HEAD() if self.path != '/nohead' else self.reply(200)
+
+    def reply(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
 if __name__ == '__main__':
     unittest.main()